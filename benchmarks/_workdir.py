@@ -0,0 +1,11 @@
+"""基準測試共用的暫存工作目錄：程式結束時 (含例外中止) 整個刪掉，不在 /tmp 留下幾 GB 的測試資料庫。"""
+import atexit
+import shutil
+import tempfile
+
+
+def make_work_dir(prefix):
+    path = tempfile.mkdtemp(prefix=prefix)
+    # 結束時連線可能還開著 (Windows 刪不掉開啟中的檔案)，刪不掉的就算了
+    atexit.register(shutil.rmtree, path, ignore_errors=True)
+    return path
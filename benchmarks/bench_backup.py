@@ -0,0 +1,82 @@
+"""線上快照備份的成本：create_backup (讀取執行緒分段複製) 的耗時，以及備份進行中寫入執行緒的
+add_trade 延遲 (對照沒有備份時)；最後還原快照並核對筆數與 integrity_check。
+
+    python benchmarks/bench_backup.py --trades 100000 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from _workdir import make_work_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = make_work_dir("bench_backup_")
+sys.path.insert(0, ROOT)
+from main import AsyncDBManager, DBManager  # noqa: E402
+
+PAIRS = ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY", "US30", "NAS100", "BTCUSD"]
+TRADE = {'pair': 'XAUUSD', 'direction': 'BUY', 'lots': 0.1, 'entry_price': 2000.0, 'exit_price': 2001.0, 'pnl_usd': 10.0}
+
+
+def build_db(path, n):
+    db = DBManager(path)
+    rnd = random.Random(5)
+    start = datetime(2020, 1, 1)
+    db.import_trades({'ticket': None, 'pair': rnd.choice(PAIRS), 'direction': rnd.choice(["BUY", "SELL"]), 'lots': 0.1,
+                      'entry_price': 1.0, 'exit_price': 1.0 + rnd.gauss(0, 0.002), 'entry_time': start + timedelta(minutes=5 * i)}
+                     for i in range(n))
+    db.conn.close()
+
+
+async def write_latencies(db, until):
+    # 持續寫入直到 until 完成，回傳每筆 add_trade 的延遲 (ms)
+    samples = []
+    while not until.done():
+        t0 = time.perf_counter()
+        await db.add_trade(TRADE)
+        samples.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(0.005)
+    return samples
+
+
+async def run(n):
+    path = os.path.join(WORK_DIR, f"backup_{n}.db")
+    build_db(path, n)
+    db = AsyncDBManager(path)
+    await db.open()
+    baseline = await write_latencies(db, asyncio.ensure_future(asyncio.sleep(1)))
+
+    t0 = time.perf_counter()
+    backup = asyncio.ensure_future(db.create_backup())
+    during = await write_latencies(db, backup)
+    snapshot = await backup
+    backup_ms = (time.perf_counter() - t0) * 1000
+
+    expected = DBManager(snapshot).get_trade_stats()['count']
+    t0 = time.perf_counter()
+    await db.restore_backup(snapshot)
+    restore_ms = (time.perf_counter() - t0) * 1000
+    restored = await db.get_trade_stats()
+    assert restored['count'] == expected, (restored['count'], expected)
+    assert db.writer.conn.execute('PRAGMA quick_check').fetchone()[0] == 'ok'
+    db.close()
+
+    size = os.path.getsize(snapshot) / 1048576
+    p = lambda xs, q: statistics.quantiles(xs, n=100)[q - 1] if len(xs) > 1 else xs[0]
+    print(f"{n:>10,}{size:>10.1f}{backup_ms:>12.0f}{restore_ms:>12.0f}"
+          f"{p(baseline, 50):>12.2f}{p(during, 50):>12.2f}{max(during):>12.2f}{len(during):>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+    print(f"{'trades':>10}{'MB':>10}{'backup ms':>12}{'restore ms':>12}{'write p50':>12}{'bk p50':>12}{'bk max':>12}{'writes':>8}")
+    print("(write = 沒有備份時 add_trade 延遲 ms；bk = 備份進行中 add_trade 延遲 ms；restore 含還原前的安全快照)")
+    for size in args.trades:
+        asyncio.run(run(size))
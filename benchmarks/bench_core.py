@@ -0,0 +1,190 @@
+"""核心 DBManager 操作的基準測試：產生 10k ~ 1M 筆的合成日記 (輸入頁 common_pairs 的商品)，量測
+新增、get_all_trades、get_trade_by_id、修改心得、刪除、匯出 CSV 與統計頁 (load_stats_data) 用到的查詢。
+不啟動 Flet 介面；結果可輸出成 JSON，並與上一次的 JSON 比較找出變慢的項目。
+
+    python benchmarks/bench_core.py --sizes 10000 100000 1000000 --json results.json
+    python benchmarks/bench_core.py --sizes 10000 100000 --compare results.json --threshold 1.25
+
+--compare 時任一項目的 median 比基準慢超過 threshold 倍 (且差距超過 NOISE_MS) 就以 exit code 1 結束。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from _workdir import make_work_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = make_work_dir("bench_core_")
+sys.path.insert(0, ROOT)
+import stats  # noqa: E402
+from main import DBManager, EQUITY_CHART_POINTS  # noqa: E402
+
+# 與輸入頁的 common_pairs 相同
+PAIRS = ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY", "US30", "NAS100", "BTCUSD", "ETHUSD", "SOLUSD"]
+BASE_PRICE = {"XAUUSD": 2000.0, "EURUSD": 1.1, "GBPUSD": 1.27, "USDJPY": 150.0, "US30": 38000.0,
+              "NAS100": 17000.0, "BTCUSD": 60000.0, "ETHUSD": 3000.0, "SOLUSD": 150.0}
+START = datetime(2020, 1, 1)
+# 每 NOTE_EVERY 筆有一段心得
+NOTE_EVERY = 5
+NOTES = ["突破進場，回測不破加碼", "追高被洗，下次等回檔", "新聞行情，停損太緊", "照計畫執行，移動停利出場", "盤整區間，不該進場"]
+# 單筆操作 (新增/讀取/修改/刪除) 每項取樣次數；整表操作至少重複到 MIN_TOTAL_SEC 或 MAX_REPEAT 次
+SINGLE_OPS = 200
+MIN_TOTAL_SEC = 0.5
+MAX_REPEAT = 10
+# 比較時 median 差距小於這個毫秒數視為雜訊
+NOISE_MS = 0.05
+
+
+def synthetic_rows(n, rnd):
+    t = START
+    for _ in range(n):
+        t += timedelta(seconds=rnd.randint(60, 540))
+        pair = rnd.choice(PAIRS)
+        entry = BASE_PRICE[pair]
+        yield {'ticket': None, 'pair': pair, 'direction': rnd.choice(["BUY", "SELL"]), 'lots': 0.01 * rnd.randint(1, 100),
+               'entry_price': entry, 'exit_price': round(entry * (1 + rnd.gauss(0, 0.002)), 5), 'entry_time': t}
+
+
+def build_journal(path, n):
+    db = DBManager(path)
+    if db.error_msg:
+        raise SystemExit(db.error_msg)
+    rnd = random.Random(n)
+    t0 = time.perf_counter()
+    db.import_trades(synthetic_rows(n, rnd))
+    import_ms = (time.perf_counter() - t0) * 1000
+    db.cursor.execute(f"UPDATE trades SET note = ? || ' #' || id WHERE id % {NOTE_EVERY} = 0", (rnd.choice(NOTES),))
+    db.conn.commit()
+    return db, import_ms
+
+
+def sample(fn, args_list):
+    # 每組參數跑一次，回傳每次的毫秒數
+    samples = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def repeat(fn):
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < MAX_REPEAT and (len(samples) < 3 or time.perf_counter() - started < MIN_TOTAL_SEC):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def summarize(op, n, samples, rows=None):
+    ordered = sorted(samples)
+    result = {
+        "op": op, "trades": n, "samples": len(samples),
+        "median_ms": statistics.median(ordered), "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "min_ms": ordered[0],
+    }
+    if rows:
+        result["rows"] = rows
+        result["us_per_row"] = result["median_ms"] * 1000 / rows
+    return result
+
+
+def load_stats_data(db):
+    # 統計頁 load_stats_data (未篩選、快取失效) 會打的查詢，依同樣順序
+    db.get_trade_stats()
+    db.get_settings()
+    db.get_trades_version()
+    db.get_advanced_stats(max_points=EQUITY_CHART_POINTS)
+    month = date.today().replace(day=1)
+    db.get_rollups("day", month.isoformat(), (month + timedelta(days=31)).isoformat())
+    db.get_rollups("hour")
+    db.get_rollups("weekday")
+
+
+def run(n):
+    db, import_ms = build_journal(os.path.join(WORK_DIR, f"core_{n}.db"), n)
+    rnd = random.Random(1)
+    max_id = db.conn.execute('SELECT max(id) FROM trades').fetchone()[0]
+    ids = lambda k: [(rnd.randint(1, max_id),) for _ in range(k)]
+    trade = {'pair': 'XAUUSD', 'direction': 'BUY', 'lots': 0.1, 'entry_price': 2000.0, 'exit_price': 2001.0, 'pnl_usd': 10.0}
+    export_path = os.path.join(WORK_DIR, "export.csv")
+
+    results = [
+        summarize("import_trades", n, [import_ms], n),
+        summarize("add_trade", n, sample(db.add_trade, [(trade,)] * SINGLE_OPS)),
+        summarize("get_trade_by_id", n, sample(db.get_trade_by_id, ids(SINGLE_OPS))),
+        summarize("update_trade_note", n, sample(db.update_trade_note, [(i, "複盤：" + rnd.choice(NOTES)) for (i,) in ids(SINGLE_OPS)])),
+        summarize("get_all_trades", n, repeat(db.get_all_trades), n),
+        summarize("export_csv", n, repeat(lambda: db.export_csv(export_path)), n),
+        summarize("get_advanced_stats", n, repeat(lambda: db.get_advanced_stats(max_points=EQUITY_CHART_POINTS)), n),
+        summarize("load_stats_data", n, repeat(lambda: load_stats_data(db)), n),
+        # 刪除放最後，前面的操作都看到完整的 n 筆
+        summarize("delete_trade", n, sample(db.delete_trade, ids(SINGLE_OPS))),
+    ]
+    db.conn.close()
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"), "commit": commit,
+        "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "numpy": stats.np.__version__ if stats.np is not None else None,
+        "platform": platform.platform(), "cpu_count": os.cpu_count(),
+    }
+
+
+def print_table(results, baseline=None):
+    print(f"{'trades':>10}  {'op':<20}{'median ms':>12}{'p95 ms':>12}{'us/row':>10}" + (f"{'base ms':>12}{'ratio':>8}" if baseline else ""))
+    for r in results:
+        line = f"{r['trades']:>10,}  {r['op']:<20}{r['median_ms']:>12.3f}{r['p95_ms']:>12.3f}" + (f"{r['us_per_row']:>10.2f}" if 'us_per_row' in r else f"{'':>10}")
+        base = baseline.get((r['trades'], r['op'])) if baseline else None
+        if base:
+            line += f"{base['median_ms']:>12.3f}{r['median_ms'] / max(base['median_ms'], 1e-9):>7.2f}x"
+        print(line)
+
+
+def regressions(results, baseline, threshold):
+    return [r for r in results
+            if (r['trades'], r['op']) in baseline
+            and r['median_ms'] > baseline[(r['trades'], r['op'])]['median_ms'] * threshold
+            and r['median_ms'] - baseline[(r['trades'], r['op'])]['median_ms'] > NOISE_MS]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--json", help="把結果寫成 JSON (environment + results)")
+    parser.add_argument("--compare", help="與先前 --json 輸出的基準比較")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        results += run(size)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {(r['trades'], r['op']): r for r in json.load(f)['results']}
+    print_table(results, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, ensure_ascii=False, indent=2)
+    if baseline:
+        slower = regressions(results, baseline, args.threshold)
+        for r in slower:
+            print(f"變慢: {r['trades']:,} {r['op']} {r['median_ms']:.3f} ms (基準 {baseline[(r['trades'], r['op'])]['median_ms']:.3f} ms)")
+        sys.exit(1 if slower else 0)
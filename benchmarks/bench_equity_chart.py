@@ -0,0 +1,76 @@
+"""權益曲線圖的縮減與繪圖成本：downsample_minmax (numpy / 純 Python) 與建立 ft.LineChart 的時間，
+並核對縮減後的最大回撤、最高/最低點與原曲線相同。
+
+    python benchmarks/bench_equity_chart.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import flet as ft  # noqa: E402
+import stats  # noqa: E402
+
+POINTS = 400
+
+
+def synthetic_curve(n):
+    rnd = random.Random(7)
+    equity, net = array('d'), 0.0
+    for _ in range(n):
+        net += rnd.gauss(5, 100)
+        equity.append(net)
+    return equity
+
+
+def max_drawdown(values):
+    peak, worst = 0.0, 0.0
+    for v in values:
+        if v > peak: peak = v
+        if peak - v > worst: worst = peak - v
+    return worst
+
+
+def build_chart(xs, ys):
+    # 與 main.build_equity_chart 相同的控制項組成
+    return ft.LineChart(
+        data_series=[ft.LineChartData(data_points=[ft.LineChartDataPoint(x + 1, round(y, 2)) for x, y in zip(xs, ys)], color="blue", stroke_width=2)],
+        min_x=1, max_x=xs[-1] + 1, min_y=min(ys), max_y=max(ys),
+    )
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def run(n):
+    curve = synthetic_curve(n)
+    variants = [("python", curve)]
+    if stats.np is not None:
+        variants.insert(0, ("numpy", stats.np.frombuffer(curve, dtype=stats.np.float64)))
+    print(f"\n== {n:,} trades -> {POINTS} points ==")
+    print(f"{'path':<10}{'downsample ms':>16}{'chart ms':>12}{'points':>10}")
+    expected = (max_drawdown(curve), min(curve), max(curve))
+    for name, values in variants:
+        np_module = stats.np
+        if name == "python":
+            stats.np = None
+        try:
+            (xs, ys), down_ms = timed(stats.downsample_minmax, values, POINTS)
+        finally:
+            stats.np = np_module
+        assert (max_drawdown(ys), min(ys), max(ys)) == expected, name
+        _, chart_ms = timed(build_chart, xs, ys)
+        print(f"{name:<10}{down_ms:>16.3f}{chart_ms:>12.3f}{len(xs):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    for size in parser.parse_args().sizes:
+        run(size)
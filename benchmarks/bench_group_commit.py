@@ -0,0 +1,81 @@
+"""cli.py serve 的成交寫入吞吐量：多個機器人連線 (keep-alive，每次 POST 一筆 /fills) 同時送單，
+比較群組提交 (GroupCommitter 一批一次 commit) 與每筆各自 commit (max_batch=1)，並核對已實現損益與 trade_stats 一致。
+
+    python benchmarks/bench_group_commit.py --clients 1 8 32 --fills 300 --synchronous NORMAL FULL
+
+--synchronous FULL 時每次 commit 都會 fsync (App 預設 WAL + NORMAL 只在 checkpoint 時 fsync)。
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+from _workdir import make_work_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = make_work_dir("bench_group_commit_")
+sys.path.insert(0, ROOT)
+from cli import JournalServer  # noqa: E402
+from main import DBManager  # noqa: E402
+
+PAIRS = ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY", "US30", "NAS100", "BTCUSD", "ETHUSD", "SOLUSD"]
+
+
+def bot(port, n, seed, latencies, realized):
+    rnd = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    price = 100.0
+    for _ in range(n):
+        price = max(price + rnd.gauss(0, 1), 1.0)
+        body = json.dumps({'pair': rnd.choice(PAIRS), 'side': rnd.choice(["BUY", "SELL"]), 'lots': 0.01 * rnd.randint(1, 100), 'price': round(price, 2)})
+        t0 = time.perf_counter()
+        conn.request("POST", "/fills", body, {"Content-Type": "application/json"})
+        result = json.loads(conn.getresponse().read())
+        latencies.append((time.perf_counter() - t0) * 1000)
+        assert 'error' not in result, result
+        realized.append(result['realized'])
+    conn.close()
+
+
+def run(clients, fills, synchronous, max_batch):
+    path = os.path.join(WORK_DIR, f"fills_{clients}_{synchronous}_{max_batch}.db")
+    server = JournalServer(("127.0.0.1", 0), path)
+    server.writer_db.conn.execute(f'PRAGMA synchronous={synchronous}')
+    server.committer.max_batch = max_batch
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    latencies, realized = [], []
+    threads = [threading.Thread(target=bot, args=(server.server_port, fills, seed, latencies, realized)) for seed in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - t0
+    batches, ops = server.committer.batches, server.committer.ops
+    server.shutdown()
+    server.server_close()
+
+    db = DBManager(path)
+    net = db.get_trade_stats()['net']
+    assert abs(sum(realized) - net) < 1e-6 * max(1.0, abs(net)), (sum(realized), net)
+    assert db.conn.execute('SELECT count(*) FROM fills').fetchone()[0] == clients * fills
+    db.conn.close()
+    latencies.sort()
+    return ops / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99)], ops / batches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--fills", type=int, default=300, help="每個連線送幾筆")
+    parser.add_argument("--synchronous", nargs="+", default=["NORMAL", "FULL"], choices=["OFF", "NORMAL", "FULL"])
+    args = parser.parse_args()
+    print(f"{'sync':<8}{'clients':>8}{'mode':>10}{'fills/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'avg batch':>11}")
+    for synchronous in args.synchronous:
+        for clients in args.clients:
+            for mode, max_batch in (("per-fill", 1), ("group", 500)):
+                rate, p50, p99, batch = run(clients, args.fills, synchronous, max_batch)
+                print(f"{synchronous:<8}{clients:>8}{mode:>10}{rate:>10,.0f}{p50:>9.2f}{p99:>9.2f}{batch:>11.1f}")
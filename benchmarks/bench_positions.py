@@ -0,0 +1,74 @@
+"""部位配對效能：PositionBook.fill 單純配對，以及 DBManager.record_fill 含寫入 trades / position_lots 的每筆成本，
+並核對已實現損益 = 所有平倉來回交易損益的總和。
+
+    python benchmarks/bench_positions.py --fills 10000 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from _workdir import make_work_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = make_work_dir("bench_positions_")
+sys.path.insert(0, ROOT)
+import positions  # noqa: E402
+from main import DBManager  # noqa: E402
+
+PAIRS = ["XAUUSD", "EURUSD", "BTCUSD"]
+# DB 路徑每筆都要 commit，只取前面這麼多筆量測
+DB_FILLS = 5000
+
+
+def synthetic_fills(n):
+    # 偏向同方向連續加碼，偶爾大量反向 (部分平倉或反手)
+    rnd = random.Random(3)
+    price = {p: 100.0 for p in PAIRS}
+    for i in range(n):
+        pair = rnd.choice(PAIRS)
+        price[pair] = max(price[pair] + rnd.gauss(0, 1), 1.0)
+        side = "BUY" if rnd.random() < 0.5 else "SELL"
+        yield pair, side, round(0.01 * rnd.randint(1, 300), 2), round(price[pair], 2), 1_700_000_000 + i * 60
+
+
+def run_engine(fills, method):
+    books = {p: positions.PositionBook() for p in PAIRS}
+    trips = 0
+    t0 = time.perf_counter()
+    for pair, side, lots, price, ts in fills:
+        trips += len(books[pair].fill(side, lots, price, ts, method=method))
+    elapsed = time.perf_counter() - t0
+    return elapsed, trips, max(len(b.lots) for b in books.values())
+
+
+def run_db(fills, method, n):
+    db = DBManager(os.path.join(WORK_DIR, f"positions_{n}_{method}.db"))
+    db.set_lot_matching(method)
+    realized = 0.0
+    t0 = time.perf_counter()
+    for pair, side, lots, price, _ in fills:
+        realized += db.record_fill(pair, side, lots, price)['realized']
+    elapsed = time.perf_counter() - t0
+    net = db.get_trade_stats()['net']
+    assert abs(realized - net) < 1e-6 * max(1.0, abs(net)), (realized, net)
+    db.conn.close()
+    return elapsed
+
+
+def run(n):
+    fills = list(synthetic_fills(n))
+    print(f"\n== {n:,} fills ==")
+    print(f"{'method':<8}{'engine us/fill':>16}{'round trips':>14}{'max open lots':>15}{'db ms/fill':>12}")
+    for method in (positions.MATCH_FIFO, positions.MATCH_AVERAGE):
+        elapsed, trips, max_lots = run_engine(fills, method)
+        db_elapsed = run_db(fills[:DB_FILLS], method, n)
+        print(f"{method:<8}{elapsed / n * 1e6:>16.2f}{trips:>14,}{max_lots:>15,}{db_elapsed / min(n, DB_FILLS) * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fills", type=int, nargs="+", default=[10_000, 100_000])
+    for size in parser.parse_args().fills:
+        run(size)
@@ -0,0 +1,104 @@
+"""檢查 trade_rollups 增量更新與整表重算的結果一致，並比較讀彙總表與每次 GROUP BY trades 的時間。
+
+    python benchmarks/bench_rollups.py --trades 100000 --ops 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from _workdir import make_work_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = make_work_dir("bench_rollups_")
+sys.path.insert(0, ROOT)
+from main import DBManager, ROLLUP_PERIODS  # noqa: E402
+
+PAIRS = ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY", "US30", "NAS100", "BTCUSD"]
+START = datetime(2020, 1, 1)
+REPEAT = 20
+TOLERANCE = 1e-6
+
+
+def synthetic_rows(n, rnd):
+    t = START
+    for _ in range(n):
+        t += timedelta(seconds=rnd.randint(60, 3600))
+        yield {'ticket': None, 'pair': rnd.choice(PAIRS), 'direction': rnd.choice(["BUY", "SELL"]), 'lots': 0.01 * rnd.randint(1, 100),
+               'entry_price': 1.0, 'exit_price': 1.0 + rnd.gauss(0, 0.002), 'entry_time': t}
+
+
+def snapshot(db):
+    return {r[:3]: r[3:] for r in db.conn.execute('SELECT * FROM trade_rollups')}
+
+
+def compare(incremental, rebuilt):
+    # 計數必須完全相同，金額允許浮點累加順序造成的誤差
+    assert incremental.keys() == rebuilt.keys(), f"bucket 不一致: {len(incremental.keys() ^ rebuilt.keys())} 個"
+    for key, a in incremental.items():
+        b = rebuilt[key]
+        assert a[:3] == b[:3], (key, a, b)
+        assert all(abs(x - y) < TOLERANCE for x, y in zip(a[3:], b[3:])), (key, a, b)
+
+
+def random_ops(db, ops, rnd):
+    # 隨機新增 (任意時間點，write_batch 的 trade 走 add_trade 同一條增量路徑) 與刪除 (delete_trade)
+    for _ in range(ops):
+        if rnd.random() < 0.6:
+            entry_time = START + timedelta(seconds=rnd.randint(0, 3 * 365 * 86400))
+            db.write_batch([('trade', {'pair': rnd.choice(PAIRS), 'direction': 'BUY', 'lots': 0.1, 'entry_price': 1.0,
+                                       'exit_price': 1.0 + rnd.gauss(0, 0.002), 'entry_time': entry_time})])
+        else:
+            trade_id = db.conn.execute('SELECT id FROM trades WHERE id >= abs(random()) % (SELECT max(id) FROM trades) LIMIT 1').fetchone()
+            if trade_id:
+                db.delete_trade(trade_id[0])
+
+
+def timed(fn):
+    samples = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def run(n, ops):
+    rnd = random.Random(42)
+    db = DBManager(os.path.join(WORK_DIR, f"rollups_{n}.db"))
+    if db.error_msg:
+        raise SystemExit(db.error_msg)
+    t0 = time.perf_counter()
+    db.import_trades(synthetic_rows(n, rnd))
+    import_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    random_ops(db, ops, rnd)
+    ops_ms = (time.perf_counter() - t0) * 1000
+    incremental = snapshot(db)
+    t0 = time.perf_counter()
+    db.rebuild_trade_rollups()
+    rebuild_ms = (time.perf_counter() - t0) * 1000
+    compare(incremental, snapshot(db))
+
+    print(f"\n== {n:,} trades + {ops:,} 次隨機新增/刪除: 增量與重算一致 ({len(incremental):,} 個 bucket) ==")
+    print(f"import {import_ms:.0f} ms / 每次增量 {ops_ms / ops:.3f} ms / 整表重算 {rebuild_ms:.0f} ms")
+    print(f"{'period':<10}{'GROUP BY ms':>14}{'rollup ms':>12}{'speedup':>10}")
+    for period, expr in ROLLUP_PERIODS.items():
+        group_sql = f'SELECT {expr} AS b, count(*), sum(pnl_usd > 0), sum(pnl_usd < 0), sum(max(pnl_usd, 0)), sum(max(-pnl_usd, 0)), sum(pnl_usd) FROM trades GROUP BY b ORDER BY b'
+        group_ms = timed(lambda: db.conn.execute(group_sql).fetchall())
+        rollup_ms = timed(lambda: db.get_rollups(period))
+        print(f"{period:<10}{group_ms:>14.3f}{rollup_ms:>12.3f}{group_ms / max(rollup_ms, 1e-9):>9.1f}x")
+    db.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--ops", type=int, default=2000)
+    args = parser.parse_args()
+    for size in args.trades:
+        run(size, args.ops)
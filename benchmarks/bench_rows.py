@@ -0,0 +1,88 @@
+"""get_all_trades 的列表示法：舊的每列 dict(zip(...)) (含心得) 對照 Trade (__slots__、pair/direction 共用字串、
+心得延後載入) 與匯出用的 tuple 路徑，量測時間與 tracemalloc 的留存/峰值記憶體。
+
+    python benchmarks/bench_rows.py --sizes 10000 100000 1000000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from _workdir import make_work_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = make_work_dir("bench_rows_")
+sys.path.insert(0, ROOT)
+from main import DBManager, EXPORT_COLUMNS  # noqa: E402
+
+PAIRS = ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY", "US30", "NAS100", "BTCUSD", "ETHUSD", "SOLUSD"]
+START = datetime(2020, 1, 1)
+RUNS = 3
+
+
+def build_db(path, n):
+    db = DBManager(path)
+    rnd = random.Random(11)
+    db.import_trades({'ticket': None, 'pair': rnd.choice(PAIRS), 'direction': rnd.choice(["BUY", "SELL"]), 'lots': 0.01 * rnd.randint(1, 100),
+                      'entry_price': 1.0, 'exit_price': 1.0 + rnd.gauss(0, 0.002), 'entry_time': START + timedelta(minutes=5 * i)}
+                     for i in range(n))
+    db.cursor.execute("UPDATE trades SET note = '突破進場，回測不破加碼 #' || id WHERE id % 5 = 0")
+    db.conn.commit()
+    return db
+
+
+def dict_rows(db):
+    # 改版前的 get_all_trades
+    db.cursor.execute('SELECT * FROM trades ORDER BY id DESC')
+    rows = db.cursor.fetchall()
+    trades = []
+    col_names = [description[0] for description in db.cursor.description]
+    for r in rows:
+        trade_dict = dict(zip(col_names, r))
+        if 'note' not in trade_dict or trade_dict['note'] is None:
+            trade_dict['note'] = ""
+        trades.append(trade_dict)
+    return trades
+
+
+def tuple_rows(db):
+    return [row for chunk in db.iter_trade_chunks(EXPORT_COLUMNS) for row in chunk]
+
+
+def measure(fn, db):
+    best = None
+    for _ in range(RUNS):
+        gc.collect()
+        t0 = time.perf_counter()
+        result = fn(db)
+        elapsed = time.perf_counter() - t0
+        del result
+        best = elapsed if best is None else min(best, elapsed)
+    gc.collect()
+    tracemalloc.start()
+    result = fn(db)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return best * 1000, retained / 1048576, peak / 1048576
+
+
+def run(n):
+    db = build_db(os.path.join(WORK_DIR, f"rows_{n}.db"), n)
+    print(f"\n== {n:,} trades ==")
+    print(f"{'path':<24}{'ms':>10}{'retained MB':>14}{'peak MB':>10}{'B/row':>8}")
+    for name, fn in (("dict (舊)", dict_rows), ("Trade", DBManager.get_all_trades), ("tuple (匯出欄位)", tuple_rows)):
+        ms, retained, peak = measure(fn, db)
+        print(f"{name:<24}{ms:>10.1f}{retained:>14.1f}{peak:>10.1f}{retained * 1048576 / n:>8.0f}")
+    db.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    for size in parser.parse_args().sizes:
+        run(size)
@@ -0,0 +1,104 @@
+"""比較舊 schema (無索引、TEXT 時間) 與 migration 後 (entry_ts + 索引 + WAL) 的查詢時間。
+
+    python benchmarks/bench_schema.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from _workdir import make_work_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = make_work_dir("bench_schema_")
+sys.path.insert(0, ROOT)
+from main import DBManager  # noqa: E402
+
+PAIRS = ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY", "US30", "NAS100", "BTCUSD", "ETHUSD", "SOLUSD"]
+START = datetime(2020, 1, 1)
+REPEAT = 20
+
+LEGACY_SCHEMA = '''
+    CREATE TABLE trades (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pair TEXT, direction TEXT, lots REAL, entry_price REAL, exit_price REAL,
+        pnl_usd REAL, entry_time TEXT, note TEXT DEFAULT ''
+    )
+'''
+
+
+def synthetic_rows(n):
+    # 約每 5 分鐘一筆，時間遞增
+    rnd = random.Random(42)
+    t = START
+    for _ in range(n):
+        t += timedelta(seconds=rnd.randint(60, 540))
+        yield (rnd.choice(PAIRS), rnd.choice(["BUY", "SELL"]), 0.01 * rnd.randint(1, 100),
+               1.0, 1.0, rnd.gauss(5, 100), str(t))
+
+
+def build_legacy_db(path, n):
+    conn = sqlite3.connect(path)
+    conn.execute(LEGACY_SCHEMA)
+    conn.executemany('INSERT INTO trades (pair, direction, lots, entry_price, exit_price, pnl_usd, entry_time) VALUES (?, ?, ?, ?, ?, ?, ?)', synthetic_rows(n))
+    conn.commit()
+    conn.close()
+
+
+def timed(conn, sql, params):
+    samples = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def queries(n):
+    # 取資料中段的一天 / 一個月當查詢區間
+    mid = START + timedelta(seconds=300 * n // 2)
+    day, month = (mid, mid + timedelta(days=1)), (mid, mid + timedelta(days=30))
+    text = lambda r: (str(r[0]), str(r[1]))
+    epoch = lambda r: (int(r[0].timestamp()), int(r[1].timestamp()))
+    return [
+        ("pair + 30d sum",
+         "SELECT count(*), sum(pnl_usd) FROM trades WHERE pair=? AND entry_time BETWEEN ? AND ?", ("XAUUSD",) + text(month),
+         "SELECT count(*), sum(pnl_usd) FROM trades WHERE pair=? AND entry_ts BETWEEN ? AND ?", ("XAUUSD",) + epoch(month)),
+        ("1d range rows",
+         "SELECT * FROM trades WHERE entry_time BETWEEN ? AND ? ORDER BY entry_time", text(day),
+         "SELECT * FROM trades WHERE entry_ts BETWEEN ? AND ? ORDER BY entry_ts", epoch(day)),
+        ("latest 50 by pair",
+         "SELECT * FROM trades WHERE pair=? ORDER BY entry_time DESC LIMIT 50", ("EURUSD",),
+         "SELECT * FROM trades WHERE pair=? ORDER BY entry_ts DESC LIMIT 50", ("EURUSD",)),
+    ]
+
+
+def run(n):
+    path = os.path.join(WORK_DIR, f"trades_{n}.db")
+    build_legacy_db(path, n)
+    before = sqlite3.connect(path)
+    results = [(name, timed(before, old_sql, old_p)) for name, old_sql, old_p, _, _ in queries(n)]
+    before.close()
+
+    t0 = time.perf_counter()
+    db = DBManager(path)
+    migrate_ms = (time.perf_counter() - t0) * 1000
+    if db.error_msg:
+        raise SystemExit(db.error_msg)
+    print(f"\n== {n:,} trades (migration {migrate_ms:.0f} ms) ==")
+    print(f"{'query':<20}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for (name, old_ms), (_, _, _, new_sql, new_p) in zip(results, queries(n)):
+        new_ms = timed(db.conn, new_sql, new_p)
+        print(f"{name:<20}{old_ms:>12.3f}{new_ms:>12.3f}{old_ms / max(new_ms, 1e-9):>9.1f}x")
+    db.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    for size in parser.parse_args().sizes:
+        run(size)
@@ -0,0 +1,84 @@
+"""比較心得搜尋走 FTS5 索引與 LIKE 全表掃描的查詢時間。
+
+    python benchmarks/bench_search.py --sizes 10000 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+from _workdir import make_work_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = make_work_dir("bench_search_")
+sys.path.insert(0, ROOT)
+from main import DBManager  # noqa: E402
+
+PAIRS = ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY", "US30", "NAS100", "BTCUSD"]
+WORDS = ["突破", "回踩", "假突破", "追高", "停損太近", "順勢", "逆勢", "新聞行情", "盤整", "加碼",
+         "breakout", "retest", "fomo", "trend", "range", "scalp", "swing", "news", "revenge", "patience"]
+# 約千分之一的心得帶有少見詞，模擬「找某次特定情境」的查詢
+RARE_WORDS = ["流動性獵殺", "liquidity sweep"]
+REPEAT = 20
+# LIKE 的 LIMIT 在常見詞上很快就湊滿一頁，真正的差距在少見詞與查無結果 (必須掃完整張表)；
+# FTS 依 bm25 排序，常見詞需要為所有命中列計分
+QUERIES = [("rare word", "流動性獵殺", 0), ("rare ascii", "liquidity sweep", 0), ("no match", "不存在的關鍵字", 0),
+           ("common word", "breakout", 0), ("common page 10", "breakout", 270)]
+
+
+def synthetic_notes(n):
+    rnd = random.Random(42)
+    for i in range(n):
+        note = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 30)))
+        if rnd.random() < 0.001:
+            note += " " + rnd.choice(RARE_WORDS)
+        yield (rnd.choice(PAIRS), rnd.choice(["BUY", "SELL"]), 0.1, 1.0, 1.0, rnd.gauss(5, 100), "2024-01-01 00:00:00", note, 1704067200 + i * 300)
+
+
+def timed(fn, *args):
+    samples = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def run(n):
+    db = DBManager(os.path.join(WORK_DIR, f"search_{n}.db"))
+    if db.error_msg:
+        raise SystemExit(db.error_msg)
+    if not db.fts_tokenizer:
+        raise SystemExit("此 SQLite 不支援 FTS5")
+    t0 = time.perf_counter()
+    db.cursor.executemany('''
+        INSERT INTO trades (pair, direction, lots, entry_price, exit_price, pnl_usd, entry_time, note, entry_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', synthetic_notes(n))
+    db.conn.commit()
+    insert_ms = (time.perf_counter() - t0) * 1000
+
+    # LIKE 路徑：把 fts_tokenizer 暫時拿掉，search_trades 就會退回全表掃描
+    def like_search(query, offset):
+        tokenizer, db.fts_tokenizer = db.fts_tokenizer, None
+        try:
+            return db.search_trades(query, 30, offset)
+        finally:
+            db.fts_tokenizer = tokenizer
+
+    print(f"\n== {n:,} notes (insert + FTS 索引 {insert_ms:.0f} ms, tokenizer={db.fts_tokenizer}) ==")
+    print(f"{'query':<16}{'LIKE ms':>12}{'FTS ms':>12}{'speedup':>10}")
+    for name, query, offset in QUERIES:
+        like_ms = timed(like_search, query, offset)
+        fts_ms = timed(db.search_trades, query, 30, offset)
+        print(f"{name:<16}{like_ms:>12.3f}{fts_ms:>12.3f}{like_ms / max(fts_ms, 1e-9):>9.1f}x")
+    db.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    for size in parser.parse_args().sizes:
+        run(size)
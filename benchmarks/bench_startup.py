@@ -0,0 +1,117 @@
+"""量測冷啟動到第一個畫面 (time-to-first-frame) 的時間，每次都在新的 process 裡跑。
+
+    python benchmarks/bench_startup.py --sizes 0 100000 1000000
+
+第一個畫面 = main(page) 呼叫 page.add() 並把控制項序列化成送往前端的指令；
+另外列出 import flet / import main 的時間、首頁送出的指令數，以及畫面出來後開資料庫的時間。
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from _workdir import make_work_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+PAIRS = ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY", "US30", "NAS100", "BTCUSD"]
+
+
+class FramePage:
+    """main() 用到的最小 Page 介面；add() 時把控制項轉成 Flet 協定指令並記錄時間。"""
+
+    def __init__(self):
+        self.overlay = []
+        self.controls = []
+        self.first_frame = None
+        self.commands = 0
+        self.dialog = None
+
+    def clean(self):
+        self.controls.clear()
+
+    def add(self, *controls):
+        self.controls.extend(controls)
+        for c in controls:
+            self.commands += len(c._build_add_commands(index={}, added_controls=[]))
+        if self.first_frame is None:
+            self.first_frame = time.perf_counter()
+
+    def update(self, *controls):
+        pass
+
+    def set_dialog_open(self, value):
+        pass
+
+
+def child(work_dir):
+    # 在新 process 裡量測；cwd 是資料庫所在目錄 (main 用相對路徑的 DB_FILE)
+    t0 = time.perf_counter()
+    import flet  # noqa: F401
+    t1 = time.perf_counter()
+    os.chdir(work_dir)
+    sys.path.insert(0, ROOT)
+    import asyncio
+    import main
+    t2 = time.perf_counter()
+    page = FramePage()
+    opened = []
+    open_db = main.db.open
+
+    async def timed_open():
+        await open_db()
+        opened.append(time.perf_counter())
+
+    main.db.open = timed_open
+    asyncio.run(main.main(page))
+    print(json.dumps({
+        "import_flet": (t1 - t0) * 1000,
+        "import_main": (t2 - t1) * 1000,
+        "first_frame": (page.first_frame - t1) * 1000,
+        "db_open": (opened[0] - page.first_frame) * 1000,
+        "commands": page.commands,
+    }))
+    main.db.close()
+
+
+def build_db(work_dir, n):
+    os.chdir(work_dir)
+    sys.path.insert(0, ROOT)
+    from main import DBManager
+    db = DBManager()
+    if n:
+        rnd = random.Random(1)
+        start = datetime(2020, 1, 1)
+        db.import_trades({'ticket': None, 'pair': rnd.choice(PAIRS), 'direction': rnd.choice(["BUY", "SELL"]), 'lots': 0.1,
+                          'entry_price': 1.0, 'exit_price': 1.0 + rnd.gauss(0, 0.002), 'entry_time': start + timedelta(minutes=5 * i)}
+                         for i in range(n))
+    db.conn.close()
+
+
+def run(n):
+    work_dir = make_work_dir("bench_startup_")
+    build_db(work_dir, n)
+    samples = []
+    for _ in range(RUNS):
+        out = subprocess.run([sys.executable, __file__, "--child", work_dir], capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    median = {k: sorted(s[k] for s in samples)[RUNS // 2] for k in samples[0]}
+    print(f"{n:>10,}{median['import_flet']:>14.1f}{median['import_main']:>14.1f}{median['first_frame']:>14.1f}{median['db_open']:>12.1f}{median['commands']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 100_000, 1_000_000])
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+    else:
+        print(f"{'trades':>10}{'flet ms':>14}{'main ms':>14}{'TTFF ms':>14}{'db ms':>12}{'cmds':>10}")
+        print("(TTFF 從 import main 開始算，不含 import flet)")
+        for size in args.sizes:
+            run(size)
@@ -0,0 +1,69 @@
+"""比較 stats.compute_stats 的 numpy 向量化路徑與純 Python 單次迴圈路徑，並核對兩者結果一致。
+
+    python benchmarks/bench_stats.py --sizes 10000 100000 1000000
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import stats  # noqa: E402
+
+PAIRS = ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY", "US30", "NAS100", "BTCUSD", "ETHUSD", "SOLUSD"]
+SCALAR_KEYS = ("count", "wins", "losses", "gross_profit", "gross_loss", "net", "profit_factor", "expectancy",
+               "avg_win", "avg_loss", "max_drawdown", "max_drawdown_duration", "longest_underwater",
+               "sharpe", "sortino", "max_win_streak", "max_loss_streak", "total_lots")
+
+
+def synthetic_rows(n):
+    rnd = random.Random(7)
+    return [(round(rnd.gauss(5, 100), 2) if rnd.random() > 0.02 else 0.0, 0.01 * rnd.randint(1, 100), rnd.choice(PAIRS), 1_600_000_000 + i * 300) for i in range(n)]
+
+
+def as_python_columns(cols):
+    return stats.TradeColumns(array('d', cols.pnl), array('d', cols.lots), array('I', cols.pair_ids), cols.pairs, array('q', cols.ts))
+
+
+def same(a, b):
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+
+
+def check(fast, slow):
+    for key in SCALAR_KEYS:
+        assert same(fast[key], slow[key]), (key, fast[key], slow[key])
+    for pair, p in slow["per_pair"].items():
+        assert all(same(fast["per_pair"][pair][k], v) for k, v in p.items()), pair
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def run(n):
+    rows = synthetic_rows(n)
+    cols, load_ms = timed(stats.columns_from_rows, rows)
+    py_cols = as_python_columns(cols)
+    slow, loop_ms = timed(stats._compute_python, py_cols)
+    line = f"{n:>10,}  columns {load_ms:8.1f} ms  python loop {loop_ms:8.1f} ms"
+    if stats.np is not None:
+        fast, np_ms = timed(stats.compute_stats, cols)
+        check(fast, slow)
+        line += f"  numpy {np_ms:8.1f} ms  ({loop_ms / np_ms:.0f}x)"
+    else:
+        line += "  numpy (未安裝)"
+    print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    for size in parser.parse_args().sizes:
+        run(size)
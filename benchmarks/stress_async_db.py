@@ -0,0 +1,85 @@
+"""AsyncDBManager 壓力測試：多個 coroutine 同時寫入與讀取，檢查資料一致性與事件迴圈延遲。
+
+    python benchmarks/stress_async_db.py --writers 8 --trades 500 --readers 8
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import time
+
+from _workdir import make_work_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = make_work_dir("stress_async_db_")
+sys.path.insert(0, ROOT)
+from main import AsyncDBManager  # noqa: E402
+
+PAIRS = ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY", "US30", "NAS100", "BTCUSD", "ETHUSD", "SOLUSD"]
+
+
+async def writer(db, n, seed, ids):
+    rnd = random.Random(seed)
+    for _ in range(n):
+        trade_id = await db.add_trade({'pair': rnd.choice(PAIRS), 'direction': 'BUY', 'lots': 0.1,
+                                       'entry_price': 1.0, 'exit_price': 1.0, 'pnl_usd': round(rnd.gauss(5, 100), 2)})
+        assert trade_id, "add_trade failed"
+        ids.append(trade_id)
+        # 偶爾刪掉一筆、改一筆心得，讓寫入種類混雜
+        if rnd.random() < 0.1 and ids:
+            await db.delete_trade(ids.pop(rnd.randrange(len(ids))))
+        elif rnd.random() < 0.1 and ids:
+            await db.update_trade_note(rnd.choice(ids), "stress")
+
+
+async def reader(db, stop, counter):
+    while not stop.is_set():
+        page = await db.get_trades_page(None, 50)
+        s = await db.get_trade_stats()
+        assert s['count'] >= 0 and len(page) <= 50
+        counter[0] += 2
+
+
+async def lag_probe(stop, lags, interval=0.005):
+    # 事件迴圈若被同步 I/O 卡住，sleep 醒來的時間會明顯超過 interval
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - t0 - interval)
+
+
+async def run(args):
+    db = AsyncDBManager(os.path.join(WORK_DIR, "stress.db"), readers=args.readers)
+    ids, lags, reads = [], [], [0]
+    stop = asyncio.Event()
+    probe = asyncio.create_task(lag_probe(stop, lags))
+    readers = [asyncio.create_task(reader(db, stop, reads)) for _ in range(args.readers)]
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(writer(db, args.trades, seed, ids) for seed in range(args.writers)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await asyncio.gather(probe, *readers)
+
+    # 一致性：筆數與 trigger 維護的彙總都要等於全表重算
+    trades = await db.get_all_trades()
+    s = await db.get_trade_stats()
+    assert len(trades) == len(ids) == s['count'], (len(trades), len(ids), s['count'])
+    assert sorted(t['id'] for t in trades) == sorted(ids)
+    assert math.isclose(s['net'], math.fsum(t['pnl_usd'] for t in trades), abs_tol=1e-6)
+    db.close()
+
+    lags.sort()
+    writes = args.writers * args.trades
+    print(f"writes {writes} ({writes / elapsed:,.0f}/s), reads {reads[0]} ({reads[0] / elapsed:,.0f}/s), "
+          f"{elapsed:.2f} s; loop lag p50 {lags[len(lags) // 2] * 1000:.2f} ms, max {lags[-1] * 1000:.2f} ms; consistency OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--trades", type=int, default=500, help="每個 writer 新增的筆數")
+    parser.add_argument("--readers", type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,562 @@
+"""交易日記的無介面入口：命令列工具與本機 HTTP/JSON API，直接使用 main.DBManager 與同一套損益規則。
+
+    python cli.py add XAUUSD BUY 0.1 2000 2010
+    python cli.py add --ndjson trades.ndjson        (每行一筆 {"pair", "direction", "lots", "entry_price", "exit_price"}；- 為 stdin)
+    python cli.py fill XAUUSD SELL 0.05 2015
+    python cli.py list --pair XAUUSD --from 2024-01-01 --format ndjson
+    python cli.py stats --pair XAUUSD
+    python cli.py positions
+    python cli.py import statement.htm
+    python cli.py export trades.csv.gz --gzip
+    python cli.py serve --port 8765
+
+共用參數 --journal 選帳戶 (預設帳戶沿用 trading_data.db)，--dir 為日記檔所在目錄。
+
+HTTP API (serve，預設只聽 127.0.0.1，沒有驗證)：
+    GET  /health                     寫入佇列與群組提交的計數
+    GET  /trades?pair=&from=&to=&direction=&outcome=&sort=&limit=
+                                     NDJSON 串流 (chunked)，每行一筆交易
+    GET  /stats?pair=&from=&to=      統計 JSON (不含權益曲線)
+    GET  /positions                  未平倉部位 JSON
+    POST /trades, POST /fills        body 為單一 JSON 物件、JSON 陣列或 NDJSON；
+                                     所有連線的寫入排進同一個寫入執行緒，一批只 commit 一次
+"""
+import argparse
+import json
+import math
+import queue
+import sys
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from main import DBManager, DEFAULT_JOURNAL, JournalRegistry, Trade, TRADE_SORTS, parse_day, trade_page_cursor
+
+DEFAULT_HOST, DEFAULT_PORT = "127.0.0.1", 8765
+# 列表串流時每次從資料庫取的筆數 (keyset 分頁)，也是 HTTP 每個 chunk 的筆數
+LIST_PAGE_SIZE = 1000
+# 群組提交每批最多幾筆；佇列裡有多少就取多少，不額外等待
+GROUP_COMMIT_MAX = 500
+# 統計輸出不含權益曲線 (每筆一個點)
+STATS_SKIP_KEYS = ("equity_curve",)
+SIDES = ("BUY", "SELL")
+# 列表輸出的欄位 (列表查詢不載入心得；要心得請用 export)
+LIST_FIELDS = tuple(k for k in Trade.__slots__ if k != 'note')
+
+# --- 輸入解析 (CLI 與 HTTP 共用)，錯誤一律 ValueError ---
+
+def parse_time(value):
+    if value in (None, ""): return None
+    return datetime.fromisoformat(str(value))
+
+
+def parse_side(value):
+    side = str(value or "").upper().strip()
+    if side not in SIDES:
+        raise ValueError(f"方向必須是 BUY 或 SELL: {value}")
+    return side
+
+
+def parse_number(value):
+    # float() 也接受 "inf" / "nan" (JSON 的 Infinity / NaN)，寫進損益會弄壞統計與 JSON 輸出
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"不是有效的數字: {value}")
+    return number
+
+
+def parse_lots(value):
+    lots = parse_number(value)
+    if not lots > 0:
+        raise ValueError(f"手數必須大於 0: {value}")
+    return lots
+
+
+def parse_price(value):
+    price = parse_number(value)
+    if not price > 0:
+        raise ValueError(f"價格必須大於 0: {value}")
+    return price
+
+
+def parse_pair(value):
+    pair = str(value or "").upper().strip()
+    if not pair:
+        raise ValueError("缺少商品")
+    return pair
+
+
+def parse_trade(obj):
+    # 回傳 DBManager.apply_trade 的參數
+    return {
+        'pair': parse_pair(obj.get('pair')), 'direction': parse_side(obj.get('direction')), 'lots': parse_lots(obj.get('lots')),
+        'entry_price': parse_price(obj['entry_price']), 'exit_price': parse_price(obj['exit_price']), 'entry_time': parse_time(obj.get('entry_time')),
+    }
+
+
+def parse_fill(obj):
+    # 回傳 DBManager.apply_fill 的參數
+    return {
+        'pair': parse_pair(obj.get('pair')), 'side': parse_side(obj.get('side')), 'lots': parse_lots(obj.get('lots')),
+        'price': parse_price(obj['price']), 'fill_time': parse_time(obj.get('fill_time')),
+    }
+
+
+PARSERS = {'trade': parse_trade, 'fill': parse_fill}
+
+
+def parse_filters(get):
+    # get(name) 取 CLI 參數 (vars(args).get) 或 query string；回傳 (sort, limit, build_trade_filter 的篩選條件)
+    filters = {
+        'start_ts': parse_day(get('from')), 'end_ts': parse_day(get('to'), end_of_day=True),
+        'pair': get('pair').upper().strip() if get('pair') else None,
+        'direction': get('direction').upper() if get('direction') else None,
+        'outcome': get('outcome') or None,
+    }
+    sort = get('sort') or 'newest'
+    if sort not in TRADE_SORTS:
+        raise ValueError(f"排序必須是 {', '.join(TRADE_SORTS)} 之一")
+    limit = int(get('limit')) if get('limit') else None
+    return sort, limit, {k: v for k, v in filters.items() if v is not None}
+
+
+def iter_trades(db, sort='newest', limit=None, page_size=LIST_PAGE_SIZE, **filters):
+    # 以 keyset 分頁逐頁 yield Trade list，記憶體只留一頁
+    cursor, remaining = None, limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        trades = db.get_trades_page(cursor, size, sort, **filters)
+        if not trades: return
+        yield trades
+        if len(trades) < size: return
+        cursor = trade_page_cursor(trades[-1], sort)
+        if remaining is not None:
+            remaining -= len(trades)
+
+
+def json_default(value):
+    # numpy 數值、datetime、寫入失敗的例外
+    if hasattr(value, 'item'): return value.item()
+    if hasattr(value, 'tolist'): return value.tolist()
+    if isinstance(value, datetime): return str(value)
+    if isinstance(value, Exception): return {'error': str(value)}
+    raise TypeError(f"無法轉成 JSON: {type(value).__name__}")
+
+
+def to_json(value):
+    return json.dumps(value, ensure_ascii=False, default=json_default)
+
+
+def trade_json(trade):
+    return to_json({k: trade[k] for k in LIST_FIELDS})
+
+
+def result_json(result):
+    # write_batch 的單筆結果：交易為 (id, 損益欄位)，成交為 record_fill 的 dict，失敗為 Exception
+    if isinstance(result, Exception): return {'error': str(result)}
+    if isinstance(result, tuple): return {'id': result[0], **result[1]}
+    return result
+
+
+def get_stats(db, **filters):
+    result = db.get_advanced_stats(**filters)
+    return {k: v for k, v in result.items() if k not in STATS_SKIP_KEYS}
+
+# =========================================================================
+# 群組提交：單一寫入執行緒，一次取出佇列中所有待寫入的交易/成交，一個 transaction 寫完只 commit 一次
+# =========================================================================
+
+class GroupCommitter:
+    """把多個來源 (HTTP 連線) 的寫入集中到一個執行緒。
+
+    submit() 回傳 concurrent.futures.Future，在所屬那一批 commit 之後才有結果；
+    佇列裡累積多少就一起寫多少 (最多 max_batch 筆)，沒有負載時不會多等。
+    """
+
+    def __init__(self, db, max_batch=GROUP_COMMIT_MAX):
+        self.db = db
+        self.max_batch = max_batch
+        self.queue = queue.SimpleQueue()
+        self.batches = 0
+        self.ops = 0
+        self.thread = threading.Thread(target=self.run, name="group-commit", daemon=True)
+        self.thread.start()
+
+    def submit(self, kind, args):
+        future = Future()
+        self.queue.put((kind, args, future))
+        return future
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None: return
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    # 關閉訊號留給下一輪，先把手上這批寫完
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+            try:
+                results = self.db.write_batch([(kind, args) for kind, args, _ in batch])
+            except Exception as ex:
+                results = [ex] * len(batch)
+            self.batches += 1
+            self.ops += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+# =========================================================================
+# 本機 HTTP/JSON API
+# =========================================================================
+
+class JournalServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 多個機器人同時連線；預設的 listen backlog 只有 5
+    request_queue_size = 128
+
+    def __init__(self, address, db_path):
+        super().__init__(address, JournalRequestHandler)
+        self.db_path = db_path
+        self.writer_db = DBManager(db_path)
+        if self.writer_db.error_msg:
+            raise SystemExit(self.writer_db.error_msg)
+        self.committer = GroupCommitter(self.writer_db)
+        # 唯讀連線池：每個請求借一條，用完放回
+        self.idle_readers = queue.SimpleQueue()
+
+    @contextmanager
+    def reader(self):
+        try:
+            db = self.idle_readers.get_nowait()
+        except queue.Empty:
+            db = DBManager(self.db_path, read_only=True)
+        try:
+            yield db
+        finally:
+            self.idle_readers.put(db)
+
+    def server_close(self):
+        super().server_close()
+        self.committer.close()
+        self.writer_db.conn.close()
+        while True:
+            try:
+                self.idle_readers.get_nowait().conn.close()
+            except queue.Empty:
+                break
+
+
+class JournalRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1：保持連線 (機器人連續送單不必每次重連) 與 chunked 串流
+    protocol_version = "HTTP/1.1"
+    # 標頭與內容分兩次寫出，不關 Nagle 會和對方的 delayed ACK 互等約 40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, value, status=200):
+        body = to_json(value).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == "/health":
+                c = self.server.committer
+                return self.send_json({"status": "ok", "queued": c.queue.qsize(), "batches": c.batches, "ops": c.ops})
+            if url.path == "/trades":
+                return self.stream_trades(*parse_filters(query.get))
+            if url.path == "/stats":
+                _, _, filters = parse_filters(query.get)
+                with self.server.reader() as db:
+                    return self.send_json(get_stats(db, **filters))
+            if url.path == "/positions":
+                with self.server.reader() as db:
+                    return self.send_json(db.get_open_positions())
+        except ValueError as ex:
+            return self.send_json({"error": str(ex)}, 400)
+        self.send_json({"error": "not found"}, 404)
+
+    def stream_trades(self, sort, limit, filters):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        with self.server.reader() as db:
+            for trades in iter_trades(db, sort, limit, **filters):
+                self.send_chunk("".join(trade_json(t) + "\n" for t in trades).encode('utf-8'))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        kind = {"/trades": "trade", "/fills": "fill"}.get(urlsplit(self.path).path)
+        if kind is None:
+            return self.send_json({"error": "not found"}, 404)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError(f"Content-Length 錯誤: {length}")
+            text = self.rfile.read(length).decode('utf-8').strip()
+            try:
+                # 整個 body 是一個 JSON 值：物件 (可以是排版過的多行)，或物件的陣列
+                data = json.loads(text)
+                items, single = (data, False) if isinstance(data, list) else ([data], True)
+            except ValueError:
+                if "\n" not in text: raise
+                # NDJSON：每行一個物件
+                items, single = [json.loads(line) for line in text.splitlines() if line.strip()], False
+        except ValueError as ex:
+            # 含 UTF-8 解碼錯誤 (UnicodeDecodeError 是 ValueError)
+            return self.send_json({"error": f"請求內容錯誤: {ex}"}, 400)
+        # 先全部解析、排進佇列再一起等結果，同一個請求的多筆會落在同一批
+        futures = []
+        for obj in items:
+            try:
+                futures.append(self.server.committer.submit(kind, PARSERS[kind](obj)))
+            except (AttributeError, KeyError, TypeError, ValueError) as ex:
+                futures.append(ValueError(f"欄位錯誤: {ex}"))
+        results = []
+        for f in futures:
+            if isinstance(f, Exception):
+                results.append({"error": str(f)})
+                continue
+            try:
+                results.append(result_json(f.result()))
+            except Exception as ex:
+                results.append({"error": str(ex)})
+        if single:
+            return self.send_json(results[0], 400 if "error" in results[0] else 200)
+        self.send_json({"results": results})
+
+# =========================================================================
+# 命令列
+# =========================================================================
+
+def read_ndjson(path):
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_ops(db, kind, objects):
+    # 每 GROUP_COMMIT_MAX 筆一次 write_batch (一次 commit)；依輸入順序逐筆輸出 NDJSON 結果，回傳失敗筆數
+    failed = 0
+    # 解析後的參數，或解析失敗的 ValueError
+    pending = []
+
+    def flush():
+        nonlocal failed
+        results = iter(db.write_batch([(kind, args) for args in pending if not isinstance(args, Exception)]))
+        for args in pending:
+            result = args if isinstance(args, Exception) else next(results)
+            failed += isinstance(result, Exception)
+            print(to_json(result_json(result)))
+        pending.clear()
+
+    for obj in objects:
+        try:
+            pending.append(PARSERS[kind](obj))
+        except (AttributeError, KeyError, TypeError, ValueError) as ex:
+            pending.append(ValueError(f"欄位錯誤: {ex}"))
+        if len(pending) >= GROUP_COMMIT_MAX:
+            flush()
+    if pending:
+        flush()
+    return failed
+
+
+def cmd_add(db, args):
+    if args.ndjson:
+        return write_ops(db, 'trade', read_ndjson(args.ndjson))
+    if args.exit_price is None:
+        raise SystemExit("用法: add PAIR BUY|SELL LOTS ENTRY EXIT 或 add --ndjson FILE")
+    return write_ops(db, 'trade', [{'pair': args.pair, 'direction': args.direction, 'lots': args.lots,
+                                    'entry_price': args.entry_price, 'exit_price': args.exit_price, 'entry_time': args.time}])
+
+
+def cmd_fill(db, args):
+    if args.ndjson:
+        return write_ops(db, 'fill', read_ndjson(args.ndjson))
+    if args.price is None:
+        raise SystemExit("用法: fill PAIR BUY|SELL LOTS PRICE 或 fill --ndjson FILE")
+    return write_ops(db, 'fill', [{'pair': args.pair, 'side': args.side, 'lots': args.lots, 'price': args.price, 'fill_time': args.time}])
+
+
+def text_cell(value, spec):
+    # 表格輸出：NULL (舊資料) 印成空白格，format(None, '.2f') 會丟 TypeError
+    return "" if value is None else format(value, spec)
+
+
+def pnl_cell(trade):
+    # 美元損益只印數字；換不成美元的交叉盤附上幣別
+    if trade.pnl_currency is None:
+        return text_cell(trade.pnl_usd, '.2f')
+    return f"{text_cell(trade.pnl_quote, '.2f')} {trade.pnl_currency}"
+
+
+def cmd_list(db, args):
+    sort, limit, filters = parse_filters(vars(args).get)
+    out = sys.stdout
+    if args.format == "csv":
+        import csv
+        w = csv.writer(out)
+        w.writerow(LIST_FIELDS)
+        for trades in iter_trades(db, sort, limit, **filters):
+            w.writerows([t[k] for k in LIST_FIELDS] for t in trades)
+    elif args.format == "ndjson":
+        for trades in iter_trades(db, sort, limit, **filters):
+            out.write("".join(trade_json(t) + "\n" for t in trades))
+    else:
+        for trades in iter_trades(db, sort, limit, **filters):
+            out.write("".join(f"{t.id:>8}  {(t.entry_time or '')[:16]:<16}  {t.pair:<8} {t.direction:<4} {text_cell(t.lots, 'g'):>8} {pnl_cell(t):>12}\n" for t in trades))
+    return 0
+
+
+def cmd_stats(db, args):
+    _, _, filters = parse_filters(vars(args).get)
+    print(json.dumps(get_stats(db, **filters), ensure_ascii=False, indent=2, default=json_default))
+    return 0
+
+
+def cmd_positions(db, args):
+    for p in db.get_open_positions():
+        print(to_json(p))
+    return 0
+
+
+def cmd_import(db, args):
+    from importer import iter_statement
+    inserted, total = db.import_trades(iter_statement(args.file))
+    print(f"新增 {inserted} 筆，重複略過 {total - inserted} 筆")
+    return 0
+
+
+def cmd_export(db, args):
+    _, _, filters = parse_filters(vars(args).get)
+    written = db.export_csv(args.path, filters.get('start_ts'), filters.get('end_ts'), filters.get('pair'), args.gzip)
+    print(f"已匯出 {written} 筆: {args.path}")
+    return 0
+
+
+def cmd_serve(db, args):
+    path = db.db_file
+    db.conn.close()
+    server = JournalServer((args.host, args.port), path)
+    print(f"交易日記 API: http://{args.host}:{server.server_port} ({path})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def add_filter_args(p):
+    p.add_argument("--pair")
+    p.add_argument("--from", metavar="YYYY-MM-DD")
+    p.add_argument("--to", metavar="YYYY-MM-DD")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL, help="帳戶名稱")
+    parser.add_argument("--dir", default=".", help="日記檔所在目錄")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("add", help="新增來回交易 (損益依合約規則計算)")
+    p.add_argument("pair", nargs="?")
+    p.add_argument("direction", nargs="?", type=str.upper, choices=SIDES)
+    p.add_argument("lots", nargs="?", type=float)
+    p.add_argument("entry_price", nargs="?", type=float)
+    p.add_argument("exit_price", nargs="?", type=float)
+    p.add_argument("--time", help="進場時間 (ISO 格式，預設現在)")
+    p.add_argument("--ndjson", metavar="FILE", help="批次新增，每行一筆 JSON；- 為 stdin")
+    p.set_defaults(run=cmd_add)
+
+    p = sub.add_parser("fill", help="記錄成交 (加碼/減碼/反手，依設定的 FIFO / 平均成本配對)")
+    p.add_argument("pair", nargs="?")
+    p.add_argument("side", nargs="?", type=str.upper, choices=SIDES)
+    p.add_argument("lots", nargs="?", type=float)
+    p.add_argument("price", nargs="?", type=float)
+    p.add_argument("--time", help="成交時間 (ISO 格式，預設現在)")
+    p.add_argument("--ndjson", metavar="FILE", help="批次記錄，每行一筆 JSON；- 為 stdin")
+    p.set_defaults(run=cmd_fill)
+
+    p = sub.add_parser("list", help="列出交易")
+    add_filter_args(p)
+    p.add_argument("--direction", type=str.upper, choices=SIDES)
+    p.add_argument("--outcome", choices=("win", "loss"))
+    p.add_argument("--sort", default="newest", choices=list(TRADE_SORTS))
+    p.add_argument("--limit", type=int)
+    p.add_argument("--format", default="table", choices=("table", "ndjson", "csv"))
+    p.set_defaults(run=cmd_list)
+
+    p = sub.add_parser("stats", help="統計 (JSON)")
+    add_filter_args(p)
+    p.set_defaults(run=cmd_stats)
+
+    p = sub.add_parser("positions", help="未平倉部位 (NDJSON)")
+    p.set_defaults(run=cmd_positions)
+
+    p = sub.add_parser("import", help="匯入對帳單 (CSV / MT4 / MT5)")
+    p.add_argument("file")
+    p.set_defaults(run=cmd_import)
+
+    p = sub.add_parser("export", help="匯出 CSV")
+    p.add_argument("path")
+    add_filter_args(p)
+    p.add_argument("--gzip", action="store_true")
+    p.set_defaults(run=cmd_export)
+
+    p = sub.add_parser("serve", help="啟動本機 HTTP/JSON API")
+    p.add_argument("--host", default=DEFAULT_HOST)
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.set_defaults(run=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db = DBManager(JournalRegistry(args.dir).path_for(args.journal))
+    if db.error_msg:
+        print(db.error_msg, file=sys.stderr)
+        return 2
+    try:
+        return 1 if args.run(db, args) else 0
+    except ValueError as ex:
+        print(ex, file=sys.stderr)
+        return 2
+    finally:
+        if db.conn:
+            db.conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import csv
+import codecs
+from datetime import datetime
+from html.parser import HTMLParser
+
+# =========================================================================
+# 對帳單解析 (CSV / MT4 / MT5)
+# 每個 parser 都是 generator，逐列 yield 正規化後的 dict：
+#   {'ticket', 'pair', 'direction', 'lots', 'entry_price', 'exit_price', 'entry_time'}
+# 損益不採用券商欄位，交給 DBManager.import_trades 用 App 的合約規則計算。
+# =========================================================================
+
+READ_CHUNK = 64 * 1024
+
+# 欄位別名 (小寫)；MT4/MT5 報表的開倉/平倉價都叫 "Price"，沒有明確別名時取第 1/2 個，時間 "Time" 同理。
+# 不收 "id"：App 自己匯出的 CSV 的 ID 是本機流水號，不是券商單號，拿來去重會誤判
+COLUMN_ALIASES = {
+    'ticket': ('ticket', 'position', 'order', 'deal'),
+    'pair': ('symbol', 'item', 'pair'),
+    'direction': ('type', 'direction', 'dir', 'side'),
+    'lots': ('volume', 'size', 'lots'),
+    'entry_price': ('open price', 'entry price', 'entry_price', 'entry'),
+    'exit_price': ('close price', 'exit price', 'exit_price', 'exit'),
+    'entry_time': ('open time', 'entry time', 'entry_time', 'time'),
+    'exit_time': ('close time', 'exit time', 'exit_time'),
+}
+# 一列裡至少有這麼多格是已知欄位名稱就視為表頭 (資料列的格子是數字、商品與 buy/sell)
+HEADER_MIN_NAMES = 3
+HEADER_NAMES = {alias for aliases in COLUMN_ALIASES.values() for alias in aliases} | {'price'}
+
+TIME_FORMATS = ("%Y.%m.%d %H:%M:%S", "%Y.%m.%d %H:%M", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M:%S")
+
+
+def is_header(cells):
+    return sum(c.strip().lower() in HEADER_NAMES for c in cells) >= HEADER_MIN_NAMES
+
+
+def map_columns(headers):
+    """把表頭對應到正規化欄位的索引；缺少必要欄位，或看不出是已平倉交易的表時回傳 None。"""
+    names = [h.strip().lower() for h in headers]
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in names:
+                mapping[field] = names.index(alias)
+                break
+    # 沒有明確的平倉價欄時，要有平倉時間欄才算已平倉的表：
+    # MT4 的 Open Trades 也有兩個 "Price"，但第二個是現價，且平倉時間那欄沒有表頭
+    closed = 'exit_price' in mapping or 'exit_time' in mapping
+    prices = [i for i, n in enumerate(names) if n == 'price']
+    if 'entry_price' not in mapping and prices:
+        mapping['entry_price'] = prices[0]
+    if 'exit_price' not in mapping and len(prices) > 1:
+        mapping['exit_price'] = prices[1]
+    times = [i for i, n in enumerate(names) if n == 'time']
+    if 'exit_time' not in mapping and len(times) > 1:
+        # MT5 的 Positions 表：開倉/平倉時間都叫 "Time"
+        mapping['exit_time'] = times[1]
+        closed = True
+    required = ('pair', 'direction', 'lots', 'entry_price', 'exit_price')
+    return mapping if closed and all(f in mapping for f in required) else None
+
+
+def parse_number(text):
+    # MT5 的手數可能是 "0.10 / 0.10"，金額可能有空白千分位
+    return float(text.split('/')[0].replace(' ', '').replace('\xa0', '').replace(',', ''))
+
+
+def parse_time(text):
+    text = text.strip()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    return datetime.fromisoformat(text)
+
+
+def normalize_row(cells, mapping):
+    """依表頭對應把一列轉成 dict；不是已平倉的 BUY/SELL 交易 (入金、掛單、小計列) 回傳 None。"""
+    try:
+        direction = cells[mapping['direction']].strip().upper()
+        if direction not in ("BUY", "SELL"):
+            return None
+        pair = cells[mapping['pair']].strip().upper()
+        if not pair:
+            return None
+        if 'exit_time' in mapping and not cells[mapping['exit_time']].strip():
+            return None
+        row = {
+            'ticket': (cells[mapping['ticket']].strip() or None) if 'ticket' in mapping else None,
+            'pair': pair,
+            'direction': direction,
+            'lots': parse_number(cells[mapping['lots']]),
+            'entry_price': parse_number(cells[mapping['entry_price']]),
+            'exit_price': parse_number(cells[mapping['exit_price']]),
+            'entry_time': parse_time(cells[mapping['entry_time']]) if 'entry_time' in mapping else datetime.now(),
+        }
+    except (IndexError, ValueError):
+        return None
+    return row
+
+
+def open_text(path):
+    # MT5 的 HTML 報表是 UTF-16，其他多半是 UTF-8 (可能帶 BOM)
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = 'utf-16'
+    elif head.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    else:
+        encoding = 'utf-8'
+    return open(path, 'r', encoding=encoding, errors='replace', newline='')
+
+
+def iter_csv_trades(path):
+    with open_text(path) as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        mapping = None
+        for n, cells in enumerate(reader):
+            if n == 0 or is_header(cells):
+                # 同 StatementTableParser：多段報表每個表頭都重新對應，對不上就略過直到下一個表頭
+                mapping = map_columns(cells)
+                continue
+            if mapping is None:
+                continue
+            row = normalize_row(cells, mapping)
+            if row:
+                yield row
+
+
+class StatementTableParser(HTMLParser):
+    """把 <tr> 逐列收集成儲存格文字；遇到像表頭的列就換成它的欄位對應 (對不上就清空，直到下一個表頭)。"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.mapping = None
+        self.rows = []
+        self.cells = None
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self.cells = []
+        elif tag in ('td', 'th') and self.cells is not None:
+            self.cell = []
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+    def handle_endtag(self, tag):
+        if tag in ('td', 'th') and self.cell is not None:
+            self.cells.append(' '.join(''.join(self.cell).split()))
+            self.cell = None
+        elif tag == 'tr' and self.cells is not None:
+            self.end_row(self.cells)
+            self.cells = None
+
+    def end_row(self, cells):
+        if is_header(cells):
+            # 每個表頭都重設：MT5 的 Orders / Deals 表不能沿用前面 Positions 表的對應
+            self.mapping = map_columns(cells)
+        elif self.mapping:
+            row = normalize_row(cells, self.mapping)
+            if row:
+                self.rows.append(row)
+
+
+def iter_html_trades(path):
+    parser = StatementTableParser()
+    with open_text(path) as f:
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            # 每讀一塊就把已完成的列交出去，記憶體只保留當前這一塊
+            yield from parser.rows
+            parser.rows.clear()
+    parser.close()
+    yield from parser.rows
+
+
+def iter_statement(path):
+    """依副檔名選 parser：.htm/.html 視為 MT4/MT5 報表，其餘當 CSV。"""
+    if path.lower().endswith(('.htm', '.html')):
+        return iter_html_trades(path)
+    return iter_csv_trades(path)
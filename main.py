@@ -1,10 +1,23 @@
 import flet as ft
 import sqlite3
 import os
+import re
+from pathlib import Path
 import csv
+import gzip
 import random
-from datetime import datetime
+import asyncio
+import functools
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+import calendar
+from datetime import datetime, date, timedelta
 import sys
+import positions
+import profiling
+# importer / stats (會帶入 numpy) 延到第一次用到時才載入，不拖慢啟動
 
 # =========================================================================
 # 1. 資料庫與路徑設定 (最終修正)
@@ -12,7 +25,69 @@ import sys
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # 修正 DB 路徑問題：讓 DB 檔案名在根目錄，Flet 會自動找到 App 的安全目錄。
-DB_FILE = "trading_data.db" 
+DB_FILE = "trading_data.db"
+# 多帳戶：每個帳戶一個日記檔，預設帳戶沿用 DB_FILE，其餘為 journal_<名稱>.db (與 DB_FILE 同目錄)
+DEFAULT_JOURNAL = "預設"
+JOURNAL_PREFIX, JOURNAL_SUFFIX = "journal_", ".db"
+# SQLite 預設一條連線最多 ATTACH 10 個資料庫，跨帳戶總覽依此分批
+MAX_ATTACHED = 10
+# 紀錄頁每次載入的筆數 (keyset 分頁)
+HISTORY_PAGE_SIZE = 50
+# 資料庫結構版本 (存在 PRAGMA user_version)，每加一個 migration 就 +1
+SCHEMA_VERSION = 13
+# 會直接改寫已存損益的最後一個 migration；從更舊的版本升級前先自動留一份快照
+PNL_REWRITE_VERSION = 13
+# 紀錄頁排序: key -> (排序欄位, 方向, 顯示名稱)；同值時再以 id 排，作為 keyset 分頁的游標。
+# id 以外的欄位以 coalesce(欄位, 0) 排序與比較 (舊資料可能是 NULL，與統計把 NULL 當 0 一致)
+TRADE_SORTS = {
+    "newest": ("id", "DESC", "最新紀錄"),
+    "time_desc": ("entry_ts", "DESC", "時間 新→舊"),
+    "time_asc": ("entry_ts", "ASC", "時間 舊→新"),
+    "pnl_desc": ("pnl_usd", "DESC", "損益 高→低"),
+    "pnl_asc": ("pnl_usd", "ASC", "損益 低→高"),
+}
+# 時間分桶彙總 (trade_rollups)：period -> 由 entry_ts 算出 bucket 的 SQL 運算式 (當地時間)。
+# week 以該週星期一的日期當 bucket；weekday 為 0=週日 ... 6=週六
+ROLLUP_PERIODS = {
+    "day": "date(coalesce(entry_ts, 0), 'unixepoch', 'localtime')",
+    "week": "date(coalesce(entry_ts, 0), 'unixepoch', 'localtime', 'weekday 0', '-6 days')",
+    "month": "strftime('%Y-%m', coalesce(entry_ts, 0), 'unixepoch', 'localtime')",
+    "hour": "strftime('%H', coalesce(entry_ts, 0), 'unixepoch', 'localtime')",
+    "weekday": "strftime('%w', coalesce(entry_ts, 0), 'unixepoch', 'localtime')",
+}
+# 損益日曆熱圖的色階 (淺 -> 深)，週/月檢視顯示的最近期數
+HEATMAP_GREENS = ("green50", "green100", "green200", "green300", "green400", "green600")
+HEATMAP_REDS = ("red50", "red100", "red200", "red300", "red400", "red600")
+ROLLUP_RECENT_BUCKETS = 12
+WEEKDAY_NAMES = ("週日", "週一", "週二", "週三", "週四", "週五", "週六")
+# 權益曲線圖最多送到前端的點數 (依區段保留最低/最高點)
+EQUITY_CHART_POINTS = 400
+# 輸入頁即時損益預估：連續輸入時最多每 0.1 秒推一次畫面
+PREVIEW_DEBOUNCE_SEC = 0.1
+# 心得搜尋每頁筆數；搜尋結果摘要中關鍵字前後的標記 (UI 端轉成粗體)
+SEARCH_PAGE_SIZE = 30
+HIGHLIGHT_START, HIGHLIGHT_END = "\x02", "\x03"
+# 非同步資料層的唯讀連線數 (WAL 下與寫入互不阻塞)
+DB_READER_COUNT = 2
+# 匯入對帳單時每批 executemany 的筆數
+IMPORT_BATCH_SIZE = 1000
+# 匯出 CSV 時每次 fetchmany 的筆數與寫檔緩衝大小
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BUFFER_SIZE = 1 << 16
+EXPORT_COLUMNS = ('id', 'pair', 'direction', 'lots', 'entry_price', 'exit_price', 'coalesce(pnl_usd, pnl_quote)', "coalesce(pnl_currency, 'USD')", 'entry_time', "coalesce(note, '')")
+EXPORT_HEADER = ["ID", "Pair", "Dir", "Lots", "Entry", "Exit", "PnL", "Currency", "Time", "Note"]
+# 快照備份：放在資料庫旁的 backups/，檔名 <資料庫檔名>_YYYYmmdd_HHMMSS.db；
+# backup API 每步複製的頁數 (每步之間讓出 GIL 並回報進度)、預設保留份數與自動備份間隔
+BACKUP_DIR = "backups"
+BACKUP_STEP_PAGES = 1024
+BACKUP_KEEP = 7
+BACKUP_INTERVAL_HOURS = 24.0
+# 自動備份排程多久檢查一次是否該備份
+BACKUP_CHECK_SEC = 60
+# 列表查詢讀出的 trades 欄位 (不含心得，心得在開明細時才讀)；pair / direction 給 sys.intern 用，不可為 NULL
+TRADE_SELECT = "id, coalesce(pair, ''), coalesce(direction, ''), lots, entry_price, exit_price, pnl_usd, entry_time, entry_ts, ticket, pnl_quote, pnl_currency"
+# ft.Tabs 的分頁索引
+TAB_ENTRY, TAB_HISTORY, TAB_STATS, TAB_SETTINGS = 0, 1, 2, 3
 
 # 設定圖示路徑
 ICON_SRC = "/icon.jpg" 
@@ -82,17 +157,163 @@ PIG_QUOTES = [
     "這裡沒有明牌，只有紀律！"
 ]
 
+# 預設商品表 (symbol, contract_size, pip_size, quote_currency)；
+# contract_size 為 None 表示沿用設定頁的外匯/黃金/加密貨幣合約。
+# 損益存美元：非美元報價只支援美元為基準貨幣的商品 (USDJPY)，用平倉價換算；
+# 商品表沒有的交叉盤 (EURJPY) 沒有匯率可換，損益以報價幣別另外存 (見 pnl_fields)
+DEFAULT_INSTRUMENTS = [
+    ("XAUUSD", None, 0.01, "USD"),
+    ("EURUSD", None, 0.0001, "USD"),
+    ("GBPUSD", None, 0.0001, "USD"),
+    ("USDJPY", None, 0.01, "JPY"),
+    ("US30", 1.0, 1.0, "USD"),
+    ("NAS100", 1.0, 1.0, "USD"),
+    ("BTCUSD", None, 1.0, "USD"),
+    ("ETHUSD", None, 0.01, "USD"),
+    ("SOLUSD", None, 0.01, "USD"),
+]
+
+def category_contract_size(pair, settings):
+    # 商品表沒有指定合約大小時，依商品名稱歸類到設定頁的三種合約
+    if "XAU" in pair or "GOLD" in pair: return settings['gold']
+    if any(k in pair for k in ["BTC","ETH","SOL"]): return settings['crypto']
+    return settings['forex']
+
+def default_quote(pair):
+    # 商品表沒有的商品：USDxxx 外匯以 xxx 報價，其他視為美元報價
+    return pair[3:] if len(pair) == 6 and pair.startswith("USD") else "USD"
+
+def check_quote(symbol, quote):
+    # 報價幣別要能用這筆交易自己的價格換成美元
+    if quote != "USD" and symbol != "USD" + quote:
+        raise ValueError("非美元報價只支援 USDxxx 商品 (損益以平倉價換算成美元)")
+
+# 常見的貨幣代碼，用來認出商品表沒有的外匯交叉盤 (EURJPY、XAUEUR)
+FX_CURRENCIES = {"USD", "EUR", "JPY", "GBP", "CHF", "AUD", "NZD", "CAD", "HKD", "SGD", "CNH", "SEK", "NOK", "DKK", "ZAR", "MXN", "TRY", "PLN"}
+
+def pnl_currency_for(pair, quote):
+    # calc_pnl 結果的幣別：美元報價或已用平倉價換算的 USDxxx 是美元；
+    # 其他以非美元報價的外匯/貴金屬 (EURJPY) 價差損益是報價幣別，這筆交易自己的價格換不成美元
+    if quote == "USD" and len(pair) == 6 and pair[3:] != "USD" and pair[3:] in FX_CURRENCIES:
+        return pair[3:]
+    return "USD"
+
+def pnl_fields(pnl, currency):
+    # trades 的損益欄位：pnl_usd 只存美元 (統計、彙總只加總這欄)；換不成美元的放 pnl_quote 並記下幣別，不混在同一欄
+    if currency == "USD":
+        return {'pnl_usd': pnl, 'pnl_quote': None, 'pnl_currency': None}
+    return {'pnl_usd': None, 'pnl_quote': pnl, 'pnl_currency': currency}
+
+def display_pnl(trade):
+    # 顯示用的 (金額, 幣別)：交叉盤用報價幣別的損益；舊資料的 NULL 當 0
+    if trade['pnl_usd'] is None and trade['pnl_currency']:
+        return trade['pnl_quote'] or 0.0, trade['pnl_currency']
+    return trade['pnl_usd'] or 0.0, "USD"
+
+def format_pnl(amount, currency="USD"):
+    return f"${amount:.2f}" if currency == "USD" else f"{amount:.2f} {currency}"
+
+def calc_pnl(direction, lots, entry, exit_p, contract, quote="USD"):
+    # 手動輸入、即時預估與匯入共用的損益計算 (純函式，不碰資料庫)，回傳美元。
+    # USDxxx 的價差損益是 xxx，除以平倉價 (1 美元 = exit_p xxx) 換成美元
+    pnl = (exit_p - entry if direction=="BUY" else entry - exit_p) * lots * contract
+    return pnl / exit_p if quote != "USD" and exit_p else pnl
+
+def calc_pips(direction, entry, exit_p, pip):
+    # 以商品的最小跳動計的有利價差；沒有設定最小跳動時回傳 None
+    if not pip: return None
+    return (exit_p - entry if direction=="BUY" else entry - exit_p) / pip
+
+def trade_page_cursor(trade, sort='newest'):
+    # 分頁游標：(排序欄位值, id)，傳給 get_trades_page 的 after；NULL 與查詢的 coalesce 一樣當 0
+    value = trade[TRADE_SORTS[sort][0]]
+    return (0 if value is None else value, trade['id'])
+
+def parse_day(text, end_of_day=False):
+    # "YYYY-MM-DD" -> 當天 00:00:00 (或 23:59:59) 的 epoch；空字串回傳 None，格式錯誤丟 ValueError
+    if not text or not text.strip(): return None
+    day = datetime.strptime(text.strip(), "%Y-%m-%d")
+    return int(day.timestamp()) + (86399 if end_of_day else 0)
+
+def mark_snippet(text, query, width=24):
+    # LIKE 退回路徑用：擷取第一個命中位置前後的文字並加上標記
+    pos = text.lower().find(query.lower())
+    if pos < 0: return text[:width * 2]
+    start = max(pos - width, 0)
+    end = pos + len(query)
+    return ("…" if start else "") + text[start:pos] + HIGHLIGHT_START + text[pos:end] + HIGHLIGHT_END + text[end:end + width] + ("…" if end + width < len(text) else "")
+
+class Trade:
+    """trades 的一列。列表查詢不載入心得 (note 為 None)，get_trade_by_id 才連同心得讀出。
+
+    相容舊的 dict 介面：trade['pair']、dict(trade) 都可以用。
+    """
+    __slots__ = ('id', 'pair', 'direction', 'lots', 'entry_price', 'exit_price', 'pnl_usd', 'entry_time', 'entry_ts', 'ticket', 'pnl_quote', 'pnl_currency', 'note')
+
+    def __init__(self, id, pair, direction, lots, entry_price, exit_price, pnl_usd, entry_time, entry_ts, ticket, pnl_quote=None, pnl_currency=None, note=None):
+        self.id = id
+        self.pair = pair
+        self.direction = direction
+        self.lots = lots
+        self.entry_price = entry_price
+        self.exit_price = exit_price
+        self.pnl_usd = pnl_usd
+        self.entry_time = entry_time
+        self.entry_ts = entry_ts
+        self.ticket = ticket
+        self.pnl_quote = pnl_quote
+        self.pnl_currency = pnl_currency
+        self.note = note
+
+    def keys(self):
+        return self.__slots__
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+def trades_from_rows(rows):
+    # rows 為 SELECT TRADE_SELECT 的 tuple；pair / direction 只有少數幾種值，
+    # intern 後所有列共用同一個字串物件 (100 萬筆約省 100 MB)
+    intern = sys.intern
+    return [Trade(r[0], intern(r[1]), intern(r[2]), r[3], r[4], r[5], r[6], r[7], r[8], r[9], r[10], r[11]) for r in rows]
+
 class DBManager:
-    def __init__(self):
+    def __init__(self, db_file=DB_FILE, read_only=False):
+        self.db_file = db_file
         self.cursor = None
         self.conn = None
         self.error_msg = None
+        # {symbol: contract_size}，None 代表需要重新載入 (設定或商品表變更後)
+        self.contract_cache = None
+        self.contract_defaults = None
+        # 各商品的未平倉部位 {pair: positions.PositionBook}，寫入連線第一次用到時從 position_lots 載入
+        self.position_books = {}
+        # 上次檢查時的 PRAGMA data_version；其他連線 (另一個 App 視窗、cli.py serve) 寫入後會改變
+        self.data_version = None
+        # 全文檢索的 tokenizer ('trigram' / 'unicode61')，None 表示沒有 FTS5 表
+        self.fts_tokenizer = None
         
         try:
-            self.conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+            self.conn = sqlite3.connect(db_file, check_same_thread=False)
             self.cursor = self.conn.cursor()
-            self.create_tables()
-            self.check_and_migrate()
+            if read_only:
+                # 唯讀連線 (AsyncDBManager 的讀取池)：schema 由寫入連線負責
+                self.cursor.execute('PRAGMA query_only=ON')
+            else:
+                # WAL: 讀寫互不阻塞；NORMAL 在 WAL 下只在 checkpoint 時 fsync
+                self.cursor.execute('PRAGMA journal_mode=WAL')
+                self.cursor.execute('PRAGMA synchronous=NORMAL')
+                # 已是最新版本的資料庫直接跳過建表與 migration (建表時會掃一次 trades 初始化統計)
+                self.cursor.execute('PRAGMA user_version')
+                if self.cursor.fetchone()[0] != SCHEMA_VERSION:
+                    self.create_tables()
+                    self.check_and_migrate()
+            self.detect_fts()
+            if not read_only:
+                self.upgrade_fts()
         except Exception as e:
             error_detail = str(e)
             if "unable to open database file" in error_detail:
@@ -112,7 +333,9 @@ class DBManager:
                 exit_price REAL,
                 pnl_usd REAL,
                 entry_time TEXT,
-                note TEXT DEFAULT ''
+                note TEXT DEFAULT '',
+                entry_ts INTEGER,
+                ticket TEXT
             )
         ''')
         self.cursor.execute('''
@@ -128,45 +351,332 @@ class DBManager:
         if self.cursor.fetchone()[0] == 0:
             self.cursor.execute('INSERT INTO settings (id, contract_forex, contract_gold, contract_crypto, thumbs_up_count) VALUES (1, 100000.0, 100.0, 1.0, 0)')
             self.conn.commit()
+        self.create_stats_table()
         self.conn.commit()
 
+    def create_stats_table(self):
+        # 統計彙總表 (只有 id=1 一列)，由 trigger 在新增/刪除/修改損益時同步更新
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS trade_stats (
+                id INTEGER PRIMARY KEY,
+                trade_count INTEGER DEFAULT 0,
+                wins INTEGER DEFAULT 0,
+                losses INTEGER DEFAULT 0,
+                gross_profit REAL DEFAULT 0.0,
+                gross_loss REAL DEFAULT 0.0,
+                net REAL DEFAULT 0.0
+            )
+        ''')
+        # 舊資料庫第一次升級時用全表重算一次當起點
+        self.cursor.execute('''
+            INSERT OR IGNORE INTO trade_stats (id, trade_count, wins, losses, gross_profit, gross_loss, net)
+            SELECT 1, count(*),
+                   coalesce(sum(pnl_usd > 0), 0),
+                   coalesce(sum(pnl_usd < 0), 0),
+                   coalesce(sum(max(coalesce(pnl_usd, 0), 0)), 0.0),
+                   coalesce(sum(max(-coalesce(pnl_usd, 0), 0)), 0.0),
+                   coalesce(sum(pnl_usd), 0.0)
+            FROM trades
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_trade_stats_insert AFTER INSERT ON trades BEGIN
+                UPDATE trade_stats SET
+                    trade_count = trade_count + 1,
+                    wins = wins + (coalesce(NEW.pnl_usd, 0) > 0),
+                    losses = losses + (coalesce(NEW.pnl_usd, 0) < 0),
+                    gross_profit = gross_profit + max(coalesce(NEW.pnl_usd, 0), 0),
+                    gross_loss = gross_loss + max(-coalesce(NEW.pnl_usd, 0), 0),
+                    net = net + coalesce(NEW.pnl_usd, 0)
+                WHERE id = 1;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_trade_stats_delete AFTER DELETE ON trades BEGIN
+                UPDATE trade_stats SET
+                    trade_count = trade_count - 1,
+                    wins = wins - (coalesce(OLD.pnl_usd, 0) > 0),
+                    losses = losses - (coalesce(OLD.pnl_usd, 0) < 0),
+                    gross_profit = gross_profit - max(coalesce(OLD.pnl_usd, 0), 0),
+                    gross_loss = gross_loss - max(-coalesce(OLD.pnl_usd, 0), 0),
+                    net = net - coalesce(OLD.pnl_usd, 0)
+                WHERE id = 1;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_trade_stats_update AFTER UPDATE OF pnl_usd ON trades BEGIN
+                UPDATE trade_stats SET
+                    wins = wins - (coalesce(OLD.pnl_usd, 0) > 0) + (coalesce(NEW.pnl_usd, 0) > 0),
+                    losses = losses - (coalesce(OLD.pnl_usd, 0) < 0) + (coalesce(NEW.pnl_usd, 0) < 0),
+                    gross_profit = gross_profit - max(coalesce(OLD.pnl_usd, 0), 0) + max(coalesce(NEW.pnl_usd, 0), 0),
+                    gross_loss = gross_loss - max(-coalesce(OLD.pnl_usd, 0), 0) + max(-coalesce(NEW.pnl_usd, 0), 0),
+                    net = net - coalesce(OLD.pnl_usd, 0) + coalesce(NEW.pnl_usd, 0)
+                WHERE id = 1;
+            END
+        ''')
+
     def check_and_migrate(self):
+        # 依 PRAGMA user_version 依序執行尚未套用的 migration，每一步各自 commit
         if not self.cursor: return
-        try:
-            self.cursor.execute("SELECT note FROM trades LIMIT 1")
-        except:
-            self.cursor.execute("ALTER TABLE trades ADD COLUMN note TEXT DEFAULT ''")
-            self.conn.commit()
-        try:
-            self.cursor.execute("SELECT contract_crypto FROM settings LIMIT 1")
-        except:
-            self.cursor.execute("ALTER TABLE settings ADD COLUMN contract_crypto REAL DEFAULT 1.0")
-            self.conn.commit()
-        try:
-            self.cursor.execute("SELECT thumbs_up_count FROM settings LIMIT 1")
-        except:
-            self.cursor.execute("ALTER TABLE settings ADD COLUMN thumbs_up_count INTEGER DEFAULT 0")
-            self.conn.commit()
+        self.cursor.execute('PRAGMA user_version')
+        version = self.cursor.fetchone()[0]
+        migrations = [self.migrate_v1, self.migrate_v2, self.migrate_v3, self.migrate_v4, self.migrate_v5, self.migrate_v6, self.migrate_v7, self.migrate_v8, self.migrate_v9,
+                      self.migrate_v10, self.migrate_v11, self.migrate_v12, self.migrate_v13]
+        self.cursor.execute('SELECT EXISTS (SELECT 1 FROM trades)')
+        if version < PNL_REWRITE_VERSION and self.cursor.fetchone()[0]:
+            # 之後的 migration 會直接改寫已存的損益 (v10 換算、v13 搬欄位)，先留一份升級前的快照，不清舊快照
+            self.create_backup(keep=None)
+        for target, step in enumerate(migrations, start=1):
+            if version < target:
+                step()
+                self.cursor.execute(f'PRAGMA user_version = {target}')
+                self.conn.commit()
+
+    def add_column_if_missing(self, table, column, decl):
+        self.cursor.execute(f'PRAGMA table_info({table})')
+        if column not in [r[1] for r in self.cursor.fetchall()]:
+            self.cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+    def migrate_v1(self):
+        # 舊版 App 陸續加上的欄位
+        self.add_column_if_missing('trades', 'note', "TEXT DEFAULT ''")
+        self.add_column_if_missing('settings', 'contract_crypto', 'REAL DEFAULT 1.0')
+        self.add_column_if_missing('settings', 'thumbs_up_count', 'INTEGER DEFAULT 0')
+
+    def migrate_v2(self):
+        # entry_time 是 str(datetime.now()) 的本地時間字串，換成整數 epoch 並建立索引
+        self.add_column_if_missing('trades', 'entry_ts', 'INTEGER')
+        self.cursor.execute("UPDATE trades SET entry_ts = CAST(strftime('%s', entry_time, 'utc') AS INTEGER) WHERE entry_ts IS NULL")
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_pair_ts ON trades (pair, entry_ts)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_ts ON trades (entry_ts)')
+
+    def migrate_v3(self):
+        # 匯入對帳單用券商 ticket 去重；手動輸入的交易 ticket 為 NULL
+        self.add_column_if_missing('trades', 'ticket', 'TEXT')
+        self.cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_trades_ticket ON trades (ticket) WHERE ticket IS NOT NULL')
+
+    def migrate_v4(self):
+        # 每個商品的合約大小 / 最小跳動 / 報價幣別
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS instruments (
+                symbol TEXT PRIMARY KEY,
+                contract_size REAL,
+                pip_size REAL,
+                quote_currency TEXT
+            )
+        ''')
+        self.cursor.executemany('INSERT OR IGNORE INTO instruments (symbol, contract_size, pip_size, quote_currency) VALUES (?, ?, ?, ?)', DEFAULT_INSTRUMENTS)
+
+    def migrate_v6(self):
+        # 紀錄頁依損益排序
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_pnl ON trades(pnl_usd, id)')
+
+    def migrate_v7(self):
+        # 日/週/月、時段、星期的損益彙總表，每個 (period, bucket, pair) 一列
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS trade_rollups (
+                period TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                pair TEXT NOT NULL,
+                trade_count INTEGER DEFAULT 0,
+                wins INTEGER DEFAULT 0,
+                losses INTEGER DEFAULT 0,
+                gross_profit REAL DEFAULT 0.0,
+                gross_loss REAL DEFAULT 0.0,
+                net REAL DEFAULT 0.0,
+                PRIMARY KEY (period, bucket, pair)
+            ) WITHOUT ROWID
+        ''')
+        self.rebuild_trade_rollups(commit=False)
+
+    def migrate_v8(self):
+        # 部位/成交：fills 保存每一筆成交，position_lots 是目前未平倉的進場 (依 id 為 FIFO 順序)
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fills (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                pair TEXT NOT NULL,
+                side TEXT NOT NULL,
+                lots REAL NOT NULL,
+                price REAL NOT NULL,
+                fill_time TEXT,
+                fill_ts INTEGER,
+                realized_pnl REAL DEFAULT 0.0
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS position_lots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                pair TEXT NOT NULL,
+                direction TEXT NOT NULL,
+                lots REAL NOT NULL,
+                price REAL NOT NULL,
+                open_ts INTEGER,
+                fill_id INTEGER
+            )
+        ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_position_lots_pair ON position_lots (pair, id)')
+        self.add_column_if_missing('settings', 'lot_matching', "TEXT DEFAULT 'fifo'")
+
+    def migrate_v9(self):
+        # 快照備份的保留份數與自動備份間隔 (小時，0 為關閉)
+        self.add_column_if_missing('settings', 'backup_keep', f'INTEGER DEFAULT {BACKUP_KEEP}')
+        self.add_column_if_missing('settings', 'backup_interval_hours', f'REAL DEFAULT {BACKUP_INTERVAL_HOURS}')
+
+    def migrate_v10(self):
+        # 以前 pnl_usd 存的是報價幣別的損益 (USDJPY 是日圓)；能換算的 USDxxx 以平倉價換成美元，彙總跟著重算。
+        # 換不成美元的交叉盤留給 v13 搬到 pnl_quote
+        self.contract_cache = None
+        self.cursor.execute('SELECT pair FROM trades UNION SELECT pair FROM fills')
+        for (pair,) in self.cursor.fetchall():
+            if pair and self.get_contract(pair)[1] != "USD":
+                self.cursor.execute('UPDATE trades SET pnl_usd = pnl_usd / exit_price WHERE pair = ? AND exit_price > 0', (pair,))
+                self.cursor.execute('UPDATE fills SET realized_pnl = realized_pnl / price WHERE pair = ? AND price > 0', (pair,))
+        self.rebuild_trade_rollups(commit=False)
+
+    def migrate_v11(self):
+        # 紀錄頁依時間/損益排序改以 coalesce(欄位, 0) 做 keyset 分頁，索引換成同樣的運算式
+        self.cursor.execute('DROP INDEX IF EXISTS idx_trades_pnl')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_pnl_sort ON trades (coalesce(pnl_usd, 0), id)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_ts_sort ON trades (coalesce(entry_ts, 0), id)')
+
+    def migrate_v12(self):
+        # 新增/刪除由 add_trade / delete_trade 累加彙總；直接改損益、時間或商品 (校正、換算) 由 trigger 搬移到新的 bucket
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_trade_rollups_update AFTER UPDATE OF pnl_usd, entry_ts, pair ON trades BEGIN
+                {self.rollup_upsert(f"{self.rollup_select(ref='OLD', sign='-')} UNION ALL {self.rollup_select(ref='NEW')}")};
+                DELETE FROM trade_rollups WHERE trade_count <= 0;
+            END
+        ''')
+
+    def migrate_v13(self):
+        # 交叉盤 (EURJPY) 的損益是報價幣別，不能留在 pnl_usd：搬到 pnl_quote 並記下幣別，pnl_usd 設 NULL。
+        # trade_stats / trade_rollups 由 UPDATE OF pnl_usd 的 trigger 扣掉；成交的已實現損益同樣不再混進美元
+        self.add_column_if_missing('trades', 'pnl_quote', 'REAL')
+        self.add_column_if_missing('trades', 'pnl_currency', 'TEXT')
+        self.contract_cache = None
+        self.cursor.execute('SELECT pair FROM trades UNION SELECT pair FROM fills')
+        for (pair,) in self.cursor.fetchall():
+            currency = pair and pnl_currency_for(pair, self.get_contract(pair)[1])
+            if currency and currency != "USD":
+                self.cursor.execute('UPDATE trades SET pnl_quote = pnl_usd, pnl_currency = ?, pnl_usd = NULL WHERE pair = ? AND pnl_usd IS NOT NULL',
+                                    (currency, pair))
+                self.cursor.execute('UPDATE fills SET realized_pnl = NULL WHERE pair = ?', (pair,))
+
+    def migrate_v5(self):
+        # 心得/商品全文檢索：FTS5 external content 表，由 trigger 與 trades 同步。
+        # trigram 才能搜中文片段 (SQLite 3.34+)；不支援 FTS5 的 SQLite 就略過，搜尋改走 LIKE，
+        # 之後每次開啟由 upgrade_fts 重試
+        tokenizer = self.best_fts_tokenizer()
+        if tokenizer:
+            self.create_fts(tokenizer)
+
+    def best_fts_tokenizer(self):
+        # 這個 SQLite 能用的最佳 tokenizer；沒有 FTS5 時回傳 None
+        for tokenizer in ('trigram', 'unicode61'):
+            try:
+                self.cursor.execute(f"CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='{tokenizer}')")
+                self.cursor.execute('DROP TABLE temp.fts_probe')
+                return tokenizer
+            except sqlite3.OperationalError:
+                continue
+        return None
+
+    def create_fts(self, tokenizer):
+        self.cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS trades_fts USING fts5(note, pair, content='trades', content_rowid='id', tokenize='{tokenizer}')")
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_trades_fts_insert AFTER INSERT ON trades BEGIN
+                INSERT INTO trades_fts (rowid, note, pair) VALUES (NEW.id, NEW.note, NEW.pair);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_trades_fts_delete AFTER DELETE ON trades BEGIN
+                INSERT INTO trades_fts (trades_fts, rowid, note, pair) VALUES ('delete', OLD.id, OLD.note, OLD.pair);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_trades_fts_update AFTER UPDATE OF note, pair ON trades BEGIN
+                INSERT INTO trades_fts (trades_fts, rowid, note, pair) VALUES ('delete', OLD.id, OLD.note, OLD.pair);
+                INSERT INTO trades_fts (rowid, note, pair) VALUES (NEW.id, NEW.note, NEW.pair);
+            END
+        ''')
+        self.cursor.execute("INSERT INTO trades_fts (trades_fts) VALUES ('rebuild')")
+
+    def detect_fts(self):
+        self.cursor.execute("SELECT sql FROM sqlite_master WHERE name='trades_fts'")
+        row = self.cursor.fetchone()
+        self.fts_tokenizer = ('trigram' if 'trigram' in row[0] else 'unicode61') if row else None
+
+    def upgrade_fts(self):
+        # migrate_v5 當時沒有 FTS5 或只有 unicode61 (舊版系統 SQLite)：換到支援的 SQLite 後在開啟時補建 / 換成 trigram
+        if self.fts_tokenizer == 'trigram': return
+        tokenizer = self.best_fts_tokenizer()
+        if tokenizer is None or tokenizer == self.fts_tokenizer: return
+        for name in ('trg_trades_fts_insert', 'trg_trades_fts_delete', 'trg_trades_fts_update'):
+            self.cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        self.cursor.execute('DROP TABLE IF EXISTS trades_fts')
+        self.create_fts(tokenizer)
+        self.conn.commit()
+        self.fts_tokenizer = tokenizer
 
     def get_settings(self):
         if not self.cursor: 
-            return {"forex": 100000.0, "gold": 100.0, "crypto": 1.0, "thumbs": 0}
+            return {"forex": 100000.0, "gold": 100.0, "crypto": 1.0, "thumbs": 0, "lot_matching": positions.MATCH_FIFO,
+                "backup_keep": BACKUP_KEEP, "backup_interval": BACKUP_INTERVAL_HOURS}
         
         try:
-            self.cursor.execute('SELECT contract_forex, contract_gold, contract_crypto, thumbs_up_count FROM settings WHERE id=1')
+            self.cursor.execute('SELECT contract_forex, contract_gold, contract_crypto, thumbs_up_count, lot_matching, backup_keep, backup_interval_hours FROM settings WHERE id=1')
             row = self.cursor.fetchone()
             if row:
                 crypto = row[2] if len(row) > 2 else 1.0
                 thumbs = row[3] if len(row) > 3 else 0
-                return {"forex": row[0], "gold": row[1], "crypto": crypto, "thumbs": thumbs}
+                return {"forex": row[0], "gold": row[1], "crypto": crypto, "thumbs": thumbs, "lot_matching": row[4] or positions.MATCH_FIFO,
+                        "backup_keep": row[5], "backup_interval": row[6]}
         except:
             pass
-        return {"forex": 100000.0, "gold": 100.0, "crypto": 1.0, "thumbs": 0}
+        return {"forex": 100000.0, "gold": 100.0, "crypto": 1.0, "thumbs": 0, "lot_matching": positions.MATCH_FIFO,
+                "backup_keep": BACKUP_KEEP, "backup_interval": BACKUP_INTERVAL_HOURS}
 
     def update_settings(self, forex, gold, crypto):
         if not self.cursor: return
         self.cursor.execute('UPDATE settings SET contract_forex=?, contract_gold=?, contract_crypto=? WHERE id=1', (forex, gold, crypto))
         self.conn.commit()
+        self.contract_cache = None
+
+    def get_instruments(self):
+        if not self.cursor: return []
+        self.cursor.execute('SELECT symbol, contract_size, pip_size, quote_currency FROM instruments ORDER BY symbol')
+        return [{"symbol": r[0], "contract_size": r[1], "pip_size": r[2], "quote_currency": r[3]} for r in self.cursor.fetchall()]
+
+    def upsert_instrument(self, symbol, contract_size, pip_size, quote_currency):
+        if not self.cursor: return
+        check_quote(symbol, quote_currency)
+        self.cursor.execute('''
+            INSERT INTO instruments (symbol, contract_size, pip_size, quote_currency) VALUES (?, ?, ?, ?)
+            ON CONFLICT(symbol) DO UPDATE SET contract_size=excluded.contract_size, pip_size=excluded.pip_size, quote_currency=excluded.quote_currency
+        ''', (symbol, contract_size, pip_size, quote_currency))
+        self.conn.commit()
+        self.contract_cache = None
+
+    def load_contract_cache(self):
+        # 一次讀入商品表與設定；之後每個商品的合約查詢都是 dict 查找
+        self.contract_defaults = self.get_settings()
+        self.contract_cache = {}
+        if not self.cursor: return
+        self.cursor.execute('SELECT symbol, contract_size, quote_currency, pip_size FROM instruments')
+        for symbol, size, quote, pip in self.cursor.fetchall():
+            if size is None:
+                size = category_contract_size(symbol, self.contract_defaults)
+            # 舊版可能存過無法換算的報價幣別 (交叉盤)，這種照舊當美元
+            quote = quote if quote and symbol == "USD" + quote else "USD"
+            self.contract_cache[symbol] = (size, quote, pip)
+
+    def get_contract(self, pair):
+        # (合約大小, 報價幣別, 最小跳動)；前兩項依序傳給 calc_pnl
+        if self.contract_cache is None:
+            self.load_contract_cache()
+        contract = self.contract_cache.get(pair)
+        if contract is None:
+            contract = self.contract_cache[pair] = (category_contract_size(pair, self.contract_defaults), default_quote(pair), None)
+        return contract
 
     def increment_thumbs_up(self):
         if not self.cursor: return 0
@@ -181,42 +691,465 @@ class DBManager:
         self.conn.commit()
         return 0
 
+    def insert_trade(self, data, entry_time):
+        # 寫入一筆來回交易並更新彙總表；不 commit，與呼叫端同一個 transaction。
+        # 損益欄位見 pnl_fields (只給 pnl_usd 也可以)
+        self.cursor.execute('''
+            INSERT INTO trades (pair, direction, lots, entry_price, exit_price, pnl_usd, pnl_quote, pnl_currency, entry_time, note, entry_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, '', ?)
+        ''', (data['pair'], data['direction'], data['lots'], data['entry_price'], data['exit_price'], data['pnl_usd'],
+              data.get('pnl_quote'), data.get('pnl_currency'), str(entry_time), int(entry_time.timestamp())))
+        trade_id = self.cursor.lastrowid
+        self.apply_trade_rollup(trade_id, 1)
+        return trade_id
+
     def add_trade(self, data):
         if not self.cursor: return False
         try:
-            self.cursor.execute('''
-                INSERT INTO trades (pair, direction, lots, entry_price, exit_price, pnl_usd, entry_time, note)
-                VALUES (?, ?, ?, ?, ?, ?, ?, '')
-            ''', (data['pair'], data['direction'], data['lots'], data['entry_price'], data['exit_price'], data['pnl_usd'], str(datetime.now())))
+            trade_id = self.insert_trade(data, datetime.now())
             self.conn.commit()
-            return True
+            return trade_id
         except:
+            self.conn.rollback()
             return False
 
+    def set_lot_matching(self, method):
+        if not self.cursor: return
+        self.cursor.execute('UPDATE settings SET lot_matching=? WHERE id=1', (method,))
+        self.conn.commit()
+
+    def set_backup_policy(self, keep, interval_hours):
+        if not self.cursor: return
+        self.cursor.execute('UPDATE settings SET backup_keep=?, backup_interval_hours=? WHERE id=1', (keep, interval_hours))
+        self.conn.commit()
+
+    def get_position_book(self, pair):
+        version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if version != self.data_version:
+            # 別的連線改過資料庫，記憶體中的部位可能過期，全部重新載入
+            self.data_version = version
+            self.position_books = {}
+        book = self.position_books.get(pair)
+        if book is None:
+            self.cursor.execute('SELECT direction, lots, price, open_ts, fill_id, id FROM position_lots WHERE pair=? ORDER BY id', (pair,))
+            rows = self.cursor.fetchall()
+            book = self.position_books[pair] = positions.PositionBook(
+                rows[0][0] if rows else None, [positions.Lot(*r[1:]) for r in rows], track=True)
+        return book
+
+    def record_fill(self, pair, side, lots, price, fill_time=None):
+        # 套用一筆成交 (加碼、減碼或反手)：平倉的部分依設定的 FIFO / 平均成本配對，
+        # 每段配對寫成 trades 的一筆來回交易，現有的紀錄與統計頁面不必改。
+        # 回傳 {'fill_id', 'trade_ids', 'realized', 'currency', 'direction', 'size', 'avg_price'}；realized 的幣別是 currency
+        if not self.cursor: return None
+        try:
+            if not self.conn.in_transaction:
+                # 先讀部位再寫入：一開始就拿寫入鎖 (見 write_batch)
+                self.cursor.execute('BEGIN IMMEDIATE')
+            result = self.apply_fill(pair, side, lots, price, fill_time)
+            self.conn.commit()
+        except:
+            self.conn.rollback()
+            self._reload_positions_after_rollback(pair)
+            raise
+        return result
+
+    def _reload_positions_after_rollback(self, pair=None):
+        # 撤回後記憶體中的部位可能已經改了，下次從 (已撤回的) position_lots 重新載入；pair 為 None 時全部重載
+        if pair is None:
+            self.position_books = {}
+        else:
+            self.position_books.pop(pair, None)
+
+    def apply_fill(self, pair, side, lots, price, fill_time=None):
+        # record_fill 的本體；不 commit，與呼叫端同一個 transaction
+        if side not in ("BUY", "SELL"):
+            raise ValueError(f"成交方向必須是 BUY 或 SELL: {side!r}")
+        if not lots > 0:
+            raise ValueError(f"手數必須大於 0: {lots!r}")
+        fill_time = fill_time or datetime.now()
+        fill_ts = int(fill_time.timestamp())
+        book = self.get_position_book(pair)
+        self.cursor.execute('INSERT INTO fills (pair, side, lots, price, fill_time, fill_ts) VALUES (?, ?, ?, ?, ?, ?)',
+                            (pair, side, lots, price, str(fill_time), fill_ts))
+        fill_id = self.cursor.lastrowid
+        trips = book.fill(side, lots, price, fill_ts, fill_id, self.get_settings()['lot_matching'])
+        size, quote, _ = self.get_contract(pair)
+        currency = pnl_currency_for(pair, quote)
+        trade_ids, realized = [], 0.0
+        for trip in trips:
+            pnl = calc_pnl(trip['direction'], trip['lots'], trip['entry_price'], trip['exit_price'], size, quote)
+            realized += pnl
+            trade_ids.append(self.insert_trade(dict(trip, pair=pair, **pnl_fields(pnl, currency)), datetime.fromtimestamp(trip['entry_ts'])))
+        # fills.realized_pnl 只存美元，交叉盤的已實現損益在各筆 trades 的 pnl_quote
+        self.cursor.execute('UPDATE fills SET realized_pnl=? WHERE id=?', (realized if currency == "USD" else None, fill_id))
+        # 只寫回這筆成交動到的 Lot：新進場 INSERT、配對完 DELETE、部分平倉或平均成本合併 UPDATE
+        for lot in book.take_changes():
+            if lot.lots <= positions.EPSILON:
+                if lot.row_id is not None:
+                    self.cursor.execute('DELETE FROM position_lots WHERE id=?', (lot.row_id,))
+            elif lot.row_id is None:
+                self.cursor.execute('INSERT INTO position_lots (pair, direction, lots, price, open_ts, fill_id) VALUES (?, ?, ?, ?, ?, ?)',
+                                    (pair, book.direction, lot.lots, lot.price, lot.ts, lot.fill_id))
+                lot.row_id = self.cursor.lastrowid
+            else:
+                self.cursor.execute('UPDATE position_lots SET lots=?, price=? WHERE id=?', (lot.lots, lot.price, lot.row_id))
+        return {'fill_id': fill_id, 'trade_ids': trade_ids, 'realized': realized, 'currency': currency,
+                'direction': book.direction, 'size': book.size, 'avg_price': book.average_price()}
+
+    def apply_trade(self, pair, direction, lots, entry_price, exit_price, entry_time=None):
+        # 以 App 的合約規則算損益後寫入一筆來回交易；不 commit。回傳 (id, 損益欄位 dict，見 pnl_fields)
+        size, quote, _ = self.get_contract(pair)
+        pnl = pnl_fields(calc_pnl(direction, lots, entry_price, exit_price, size, quote), pnl_currency_for(pair, quote))
+        data = {'pair': pair, 'direction': direction, 'lots': lots, 'entry_price': entry_price, 'exit_price': exit_price, **pnl}
+        return self.insert_trade(data, entry_time or datetime.now()), pnl
+
+    def write_batch(self, ops):
+        # 群組提交：ops 為 [('trade', apply_trade 的參數) / ('fill', apply_fill 的參數)]，整批一個 transaction、
+        # 最後只 commit 一次。每筆各自一個 SAVEPOINT，單筆失敗只撤回那一筆 (結果放 Exception)，其他照常寫入。
+        if not self.cursor: return []
+        results = []
+        if not self.conn.in_transaction:
+            # 先明確 BEGIN，最外層的 RELEASE 才不會各自 commit。用 IMMEDIATE 一開始就拿寫入鎖：
+            # 批次裡先讀 (data_version、設定、部位) 再寫，WAL 下若別的 process (App / serve) 在中間 commit 過，
+            # 讀交易升級成寫交易會直接 SQLITE_BUSY (不等 busy timeout)，整批失敗
+            self.cursor.execute('BEGIN IMMEDIATE')
+        try:
+            for kind, args in ops:
+                self.cursor.execute('SAVEPOINT batch_item')
+                try:
+                    results.append(self.apply_fill(**args) if kind == 'fill' else self.apply_trade(**args))
+                except Exception as ex:
+                    self.cursor.execute('ROLLBACK TO batch_item')
+                    if kind == 'fill':
+                        self._reload_positions_after_rollback(args.get('pair'))
+                    results.append(ex)
+                self.cursor.execute('RELEASE batch_item')
+            self.conn.commit()
+        except:
+            self.conn.rollback()
+            self._reload_positions_after_rollback()
+            raise
+        return results
+
+    def get_open_positions(self):
+        if not self.cursor: return []
+        cur = self.conn.cursor()
+        cur.execute('''
+            SELECT pair, direction, sum(lots), sum(lots * price) / sum(lots), count(*), min(open_ts)
+            FROM position_lots GROUP BY pair ORDER BY pair
+        ''')
+        return [{"pair": r[0], "direction": r[1], "size": r[2], "avg_price": r[3], "lot_count": r[4], "open_ts": r[5]} for r in cur.fetchall()]
+
+    def import_trades(self, rows, batch_size=IMPORT_BATCH_SIZE, on_progress=None):
+        # rows 為 importer 產生的正規化 dict (可為 generator)；全部在同一個 transaction 內分批 executemany，
+        # ticket 已存在的列由 INSERT OR IGNORE 略過。回傳 (新增筆數, 處理筆數)。
+        if not self.cursor: return 0, 0
+        contract = self.get_contract
+
+        def trade_params(r):
+            size, quote, _ = contract(r['pair'])
+            pnl = pnl_fields(calc_pnl(r['direction'], r['lots'], r['entry_price'], r['exit_price'], size, quote), pnl_currency_for(r['pair'], quote))
+            return (r['pair'], r['direction'], r['lots'], r['entry_price'], r['exit_price'], pnl['pnl_usd'], pnl['pnl_quote'], pnl['pnl_currency'],
+                    str(r['entry_time']), int(r['entry_time'].timestamp()), r['ticket'])
+
+        params = map(trade_params, rows)
+        cur = self.conn.cursor()
+        inserted = total = 0
+        try:
+            while True:
+                batch = list(itertools.islice(params, batch_size))
+                if not batch: break
+                cur.executemany('''
+                    INSERT OR IGNORE INTO trades (pair, direction, lots, entry_price, exit_price, pnl_usd, pnl_quote, pnl_currency, entry_time, note, entry_ts, ticket)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, '', ?, ?)
+                ''', batch)
+                inserted += cur.rowcount
+                total += len(batch)
+                if on_progress: on_progress(total)
+            # 大量匯入後整表重算彙總，比逐筆累加快
+            if inserted:
+                self.rebuild_trade_rollups(commit=False)
+            self.conn.commit()
+        except:
+            self.conn.rollback()
+            raise
+        return inserted, total
+
+    def build_trade_filter(self, start_ts=None, end_ts=None, pair=None, direction=None, outcome=None, min_lots=None, max_lots=None):
+        # 組出 WHERE 子句與參數 (時間為 entry_ts epoch，包含兩端)。
+        # 所有條件都是參數化的；outcome 為 'win' (損益 > 0) 或 'loss' (損益 < 0)
+        clauses, params = [], []
+        if pair:
+            clauses.append('pair = ?')
+            params.append(pair)
+        if direction:
+            clauses.append('direction = ?')
+            params.append(direction)
+        if outcome == 'win':
+            clauses.append('pnl_usd > 0')
+        elif outcome == 'loss':
+            clauses.append('pnl_usd < 0')
+        if start_ts is not None:
+            clauses.append('entry_ts >= ?')
+            params.append(start_ts)
+        if end_ts is not None:
+            clauses.append('entry_ts <= ?')
+            params.append(end_ts)
+        if min_lots is not None:
+            clauses.append('lots >= ?')
+            params.append(min_lots)
+        if max_lots is not None:
+            clauses.append('lots <= ?')
+            params.append(max_lots)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def build_trade_query(self, columns='*', sort='newest', after=None, limit=None, **filters):
+        # 篩選 + 排序 + keyset 分頁組成一條 SELECT；after 是上一頁最後一列的 trade_page_cursor()
+        key, order, _ = TRADE_SORTS[sort]
+        if key != 'id':
+            # 與 migrate_v11 的運算式索引相同，NULL 的列也排得到、游標不會是 NULL
+            key = f'coalesce({key}, 0)'
+        where, params = self.build_trade_filter(**filters)
+        if after is not None:
+            op = '<' if order == 'DESC' else '>'
+            if key == 'id':
+                seek, seek_params = f'id {op} ?', [after[-1]]
+            else:
+                # 運算式索引上的 row value 比較不會拿來定位，另外加上第一欄的範圍讓 SQLite 走 SEARCH
+                seek, seek_params = f'{key} {op}= ? AND ({key}, id) {op} (?, ?)', [after[0], *after]
+            where = (where + ' AND ' if where else ' WHERE ') + seek
+            params += seek_params
+        sql = f'SELECT {columns} FROM trades{where} ORDER BY {key} {order}' + ('' if key == 'id' else f', id {order}')
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return sql, params
+
+    def count_trades(self, start_ts=None, end_ts=None, pair=None, **filters):
+        if not self.cursor: return 0
+        where, params = self.build_trade_filter(start_ts, end_ts, pair, **filters)
+        cur = self.conn.cursor()
+        cur.execute('SELECT count(*) FROM trades' + where, params)
+        return cur.fetchone()[0]
+
+    def iter_trade_chunks(self, columns, start_ts=None, end_ts=None, pair=None, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+        # 以獨立 cursor + fetchmany 逐塊讀出 tuple，不會一次載入整張表
+        if not self.cursor: return
+        where, params = self.build_trade_filter(start_ts, end_ts, pair, **filters)
+        cur = self.conn.cursor()
+        cur.execute(f'SELECT {", ".join(columns)} FROM trades{where} ORDER BY id', params)
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk: break
+            yield chunk
+
+    def get_trade_columns(self, start_ts=None, end_ts=None, pair=None, **filters):
+        # 統計引擎用：依時間排序一次載入四個欄位，轉成 stats.TradeColumns
+        import stats
+        if not self.cursor: return stats.columns_from_rows([])
+        where, params = self.build_trade_filter(start_ts, end_ts, pair, **filters)
+        cur = self.conn.cursor()
+        cur.execute(f"SELECT coalesce(pnl_usd, 0.0), coalesce(lots, 0.0), coalesce(pair, ''), coalesce(entry_ts, 0) FROM trades{where} ORDER BY entry_ts, id", params)
+        return stats.columns_from_rows(cur.fetchall())
+
+    def search_trades(self, query, limit=SEARCH_PAGE_SIZE, offset=0):
+        # 依相關度 (bm25) 搜尋心得與商品，回傳含標記摘要的結果。trigram 只能比對 3 個字以上；
+        # unicode61 把連續的中文當成一個詞，搜不到片段 (英數字以字首比對)。這些情況與沒有 FTS5 時退回 LIKE 掃描
+        query = query.strip()
+        if not self.cursor or not query: return []
+        cur = self.conn.cursor()
+        if self.fts_tokenizer == 'trigram' and len(query) >= 3 or self.fts_tokenizer == 'unicode61' and query.isascii():
+            cur.execute('''
+                SELECT t.id, t.pair, t.direction, t.pnl_usd, snippet(trades_fts, -1, ?, ?, '…', 12), t.pnl_quote, t.pnl_currency
+                FROM trades_fts JOIN trades t ON t.id = trades_fts.rowid
+                WHERE trades_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?
+            ''', (HIGHLIGHT_START, HIGHLIGHT_END, '"' + query.replace('"', '""') + '"' + ('' if self.fts_tokenizer == 'trigram' else '*'), limit, offset))
+            rows = cur.fetchall()
+        else:
+            pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            cur.execute('''
+                SELECT id, pair, direction, pnl_usd, CASE WHEN note LIKE ? ESCAPE '\\' THEN note ELSE pair END, pnl_quote, pnl_currency
+                FROM trades WHERE note LIKE ? ESCAPE '\\' OR pair LIKE ? ESCAPE '\\'
+                ORDER BY id DESC LIMIT ? OFFSET ?
+            ''', (pattern, pattern, pattern, limit, offset))
+            rows = [r[:4] + (mark_snippet(r[4] or "", query),) + r[5:] for r in cur.fetchall()]
+        return [{"id": r[0], "pair": r[1], "direction": r[2], "pnl_usd": r[3], "snippet": r[4], "pnl_quote": r[5], "pnl_currency": r[6]} for r in rows]
+
+    def get_advanced_stats(self, start_ts=None, end_ts=None, pair=None, max_points=None, **filters):
+        # max_points: 把 equity_curve 換成縮減後的 (索引, 值)，只把畫圖需要的點傳回 UI
+        import stats
+        result = stats.compute_stats(self.get_trade_columns(start_ts, end_ts, pair, **filters))
+        if max_points:
+            result["equity_curve"] = stats.downsample_minmax(result["equity_curve"], max_points)
+        return result
+
+    def get_trades_version(self):
+        # (最大 id, 筆數)：新增、匯入、刪除都會改變，用來判斷統計快取是否過期
+        if not self.cursor: return (0, 0)
+        cur = self.conn.cursor()
+        cur.execute('SELECT (SELECT max(id) FROM trades), (SELECT trade_count FROM trade_stats WHERE id=1)')
+        return cur.fetchone()
+
+    def export_csv(self, path, start_ts=None, end_ts=None, pair=None, compress=False, on_progress=None, cancel_event=None):
+        # 串流寫出 CSV (可選 gzip)，記憶體用量與筆數無關。先寫到 .part 暫存檔，完成才改名，
+        # 失敗或取消都不會留下半份檔案 (也不會蓋掉同名的舊檔)。回傳寫出筆數；被取消時回傳 None
+        written = 0
+        cancelled = False
+        part = path + '.part'
+        try:
+            if compress:
+                f = gzip.open(part, 'wt', newline='', encoding='utf-8-sig')
+            else:
+                f = open(part, 'w', newline='', encoding='utf-8-sig', buffering=EXPORT_BUFFER_SIZE)
+            with f:
+                w = csv.writer(f)
+                w.writerow(EXPORT_HEADER)
+                for chunk in self.iter_trade_chunks(EXPORT_COLUMNS, start_ts, end_ts, pair):
+                    if cancel_event is not None and cancel_event.is_set():
+                        cancelled = True
+                        break
+                    w.writerows(chunk)
+                    written += len(chunk)
+                    if on_progress: on_progress(written)
+            if not cancelled:
+                os.replace(part, path)
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+        return None if cancelled else written
+
+    # --- 快照備份 / 還原 (SQLite online backup API) ---
+    def backup_dir(self):
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_file)), BACKUP_DIR)
+
+    def list_backups(self):
+        # 這個資料庫的快照，新 -> 舊：[{'path', 'name', 'time', 'size'}]
+        folder = self.backup_dir()
+        if not os.path.isdir(folder): return []
+        # 檔名時間到微秒 (同一秒內的兩份不會互相覆蓋)；舊版只到秒的檔名也認得
+        pattern = re.compile(re.escape(Path(self.db_file).stem) + r'_(\d{8}_\d{6}(?:_\d{6})?)\.db')
+        backups = []
+        for name in os.listdir(folder):
+            m = pattern.fullmatch(name)
+            if m:
+                path = os.path.join(folder, name)
+                stamp = m.group(1)
+                backups.append({'path': path, 'name': name, 'time': datetime.strptime(stamp, '%Y%m%d_%H%M%S_%f' if len(stamp) > 15 else '%Y%m%d_%H%M%S'),
+                                'size': os.path.getsize(path)})
+        backups.sort(key=lambda b: b['time'], reverse=True)
+        return backups
+
+    def prune_backups(self, keep):
+        # 只保留最新的 keep 份 (至少一份)
+        for b in self.list_backups()[max(keep, 1):]:
+            os.remove(b['path'])
+
+    def backup_due(self, interval_hours):
+        # 自動備份：最新快照已超過間隔，且資料庫 (含 WAL) 在那之後有寫入
+        if not interval_hours or interval_hours <= 0: return False
+        backups = self.list_backups()
+        if not backups: return True
+        latest = backups[0]['time']
+        if datetime.now() - latest < timedelta(hours=interval_hours): return False
+        modified = max(os.path.getmtime(f) for f in (self.db_file, self.db_file + '-wal') if os.path.exists(f))
+        return datetime.fromtimestamp(modified) > latest
+
+    def create_backup(self, keep=BACKUP_KEEP, on_progress=None, cancel_event=None):
+        # 線上熱備份：先在這條連線開讀取交易固定住快照 (WAL 下不擋寫入，複製途中的新寫入也不會讓 backup 重來)，
+        # 再每步複製 BACKUP_STEP_PAGES 頁到暫存檔，完成才改名，清單裡不會出現半份快照。
+        # 回傳快照路徑；被取消時刪除暫存檔並回傳 None。keep=None 表示不清舊快照
+        if not self.conn: return None
+        folder = self.backup_dir()
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{Path(self.db_file).stem}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.db")
+        part = path + '.part'
+        if os.path.exists(part):
+            os.remove(part)
+
+        def step(status, remaining, total):
+            if cancel_event is not None and cancel_event.is_set():
+                raise InterruptedError
+            if on_progress: on_progress(total - remaining, total)
+
+        started = not self.conn.in_transaction
+        if started:
+            self.conn.execute('BEGIN')
+            self.conn.execute('SELECT count(*) FROM sqlite_master').fetchone()
+        target = sqlite3.connect(part)
+        try:
+            self.conn.backup(target, pages=BACKUP_STEP_PAGES, progress=step)
+            # 快照改回一般 journal，單一檔案即可搬移或唯讀開啟
+            target.execute('PRAGMA journal_mode=DELETE')
+        except InterruptedError:
+            target.close()
+            os.remove(part)
+            return None
+        finally:
+            target.close()
+            if started:
+                self.conn.rollback()
+        os.replace(part, path)
+        if keep is not None:
+            self.prune_backups(keep)
+        return path
+
+    def restore_backup(self, path, keep=BACKUP_KEEP):
+        # 還原快照：先以唯讀開啟做 integrity_check 與版本檢查，目前的資料庫先留一份快照，
+        # 再用 backup API 整個蓋回這條 (寫入) 連線；讀取連線會自動看到新內容。
+        # 還原完才依 keep 清舊快照 (keep=None 不清)，安全快照是最新的一份，一定會留下
+        if not self.conn: return None
+        src = sqlite3.connect(Path(path).resolve().as_uri() + '?mode=ro', uri=True)
+        try:
+            try:
+                check = src.execute('PRAGMA integrity_check').fetchone()[0]
+            except sqlite3.DatabaseError as ex:
+                check = str(ex)
+            if check != 'ok':
+                raise ValueError(f"快照已損毀: {check}")
+            if not src.execute("SELECT 1 FROM sqlite_master WHERE name='trades'").fetchone():
+                raise ValueError("不是交易日記的快照")
+            version = src.execute('PRAGMA user_version').fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise ValueError("快照來自較新版本的 App")
+            # 要還原的可能正是最舊的一份，這份安全快照先不清舊的
+            safety = self.create_backup(keep=None)
+            src.backup(self.conn, pages=BACKUP_STEP_PAGES)
+        finally:
+            src.close()
+        if version != SCHEMA_VERSION:
+            self.create_tables()
+            self.check_and_migrate()
+        # 快取都屬於還原前的資料
+        self.contract_cache = None
+        self.position_books = {}
+        self.detect_fts()
+        self.upgrade_fts()
+        if keep is not None:
+            self.prune_backups(keep)
+        return safety
+
     def get_all_trades(self):
+        # 回傳 Trade (不含心得)；只要部分欄位的大量讀取 (匯出、統計) 請用 iter_trade_chunks / get_trade_columns
         if not self.cursor: return []
-        self.cursor.execute('SELECT * FROM trades ORDER BY id DESC')
-        rows = self.cursor.fetchall()
-        trades = []
-        col_names = [description[0] for description in self.cursor.description]
-        for r in rows:
-            trade_dict = dict(zip(col_names, r))
-            if 'note' not in trade_dict or trade_dict['note'] is None:
-                trade_dict['note'] = ""
-            trades.append(trade_dict)
-        return trades
+        cur = self.conn.cursor()
+        cur.execute(f'SELECT {TRADE_SELECT} FROM trades ORDER BY id DESC')
+        return trades_from_rows(cur)
+
+    def get_trades_page(self, after=None, limit=HISTORY_PAGE_SIZE, sort='newest', **filters):
+        # Keyset 分頁：依 sort 排序取 after 之後的 limit 筆，after 為 None 時從第一筆開始。
+        # 預設排序下 after 也可以直接給 id
+        if not self.cursor: return []
+        if after is not None and not isinstance(after, tuple):
+            after = (after,)
+        self.cursor.execute(*self.build_trade_query(TRADE_SELECT, sort, after, limit, **filters))
+        return trades_from_rows(self.cursor.fetchall())
 
     def get_trade_by_id(self, trade_id):
         if not self.cursor: return None
-        self.cursor.execute('SELECT * FROM trades WHERE id=?', (trade_id,))
+        self.cursor.execute(f"SELECT {TRADE_SELECT}, coalesce(note, '') FROM trades WHERE id=?", (trade_id,))
         row = self.cursor.fetchone()
-        if row:
-            col_names = [description[0] for description in self.cursor.description]
-            trade_dict = dict(zip(col_names, row))
-            if 'note' not in trade_dict or trade_dict['note'] is None:
-                trade_dict['note'] = ""
-            return trade_dict
-        return None
+        return Trade(*row) if row else None
 
     def update_trade_note(self, trade_id, note_content):
         if not self.cursor: return
@@ -224,17 +1157,290 @@ class DBManager:
         self.conn.commit()
 
     def delete_trade(self, trade_id):
+        if not self.cursor: return False
+        try:
+            self.apply_trade_rollup(trade_id, -1)
+            self.cursor.execute('DELETE FROM trades WHERE id=?', (trade_id,))
+            self.conn.commit()
+            return True
+        except:
+            self.conn.rollback()
+            return False
+
+    def rollup_select(self, where='', sign='', ref=None):
+        # 各 period 的分組彙總 SELECT (UNION ALL)；增量更新、整表重算與 trigger 共用同一組運算式，結果才會一致。
+        # ref 為 'OLD' / 'NEW' 時是 trigger 裡單一列的值 (沒有 FROM，聚合函式就是那一列)
+        col = f'{ref}.' if ref else ''
+        source = '' if ref else f' FROM trades{where}'
+        return ' UNION ALL '.join(f'''
+            SELECT '{period}', {expr.replace('entry_ts', col + 'entry_ts')}, coalesce({col}pair, ''), {sign}count(*),
+                   {sign}sum(coalesce({col}pnl_usd, 0) > 0), {sign}sum(coalesce({col}pnl_usd, 0) < 0),
+                   {sign}sum(max(coalesce({col}pnl_usd, 0), 0)), {sign}sum(max(-coalesce({col}pnl_usd, 0), 0)), {sign}sum(coalesce({col}pnl_usd, 0))
+            {source} GROUP BY 2, 3
+        ''' for period, expr in ROLLUP_PERIODS.items())
+
+    def rollup_upsert(self, select):
+        # 把 select 的每一列累加進彙總表
+        return f'''
+            INSERT INTO trade_rollups (period, bucket, pair, trade_count, wins, losses, gross_profit, gross_loss, net)
+            SELECT * FROM ({select}) WHERE true
+            ON CONFLICT (period, bucket, pair) DO UPDATE SET
+                trade_count = trade_count + excluded.trade_count,
+                wins = wins + excluded.wins,
+                losses = losses + excluded.losses,
+                gross_profit = gross_profit + excluded.gross_profit,
+                gross_loss = gross_loss + excluded.gross_loss,
+                net = net + excluded.net
+        '''
+
+    def apply_trade_rollup(self, trade_id, sign):
+        # 新增後 (sign=1) 或刪除前 (sign=-1) 把單筆交易累加進彙總表；不 commit，與呼叫端同一個 transaction
+        self.cursor.execute(self.rollup_upsert(self.rollup_select(' WHERE id = ?', '-' if sign < 0 else '')), (trade_id,) * len(ROLLUP_PERIODS))
+        if sign < 0:
+            self.cursor.execute('DELETE FROM trade_rollups WHERE trade_count <= 0')
+
+    def rebuild_trade_rollups(self, commit=True):
+        # 整表重算 trade_rollups (匯入後、或校正浮點累積誤差)
         if not self.cursor: return
-        self.cursor.execute('DELETE FROM trades WHERE id=?', (trade_id,))
+        self.cursor.execute('DELETE FROM trade_rollups')
+        self.cursor.execute(f'INSERT INTO trade_rollups (period, bucket, pair, trade_count, wins, losses, gross_profit, gross_loss, net) {self.rollup_select()}')
+        if commit: self.conn.commit()
+
+    def get_rollups(self, period, start=None, end=None, pair=None):
+        # 讀某個 period 的彙總 (bucket 由小到大)；未指定 pair 時合併所有商品。start/end 為 bucket 字串，包含兩端
+        if not self.cursor: return []
+        clauses, params = ['period = ?'], [period]
+        if start is not None:
+            clauses.append('bucket >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('bucket <= ?')
+            params.append(end)
+        if pair:
+            clauses.append('pair = ?')
+            params.append(pair)
+        import stats
+        cur = self.conn.cursor()
+        cur.execute(f'''
+            SELECT bucket, sum(trade_count), sum(wins), sum(losses), sum(gross_profit), sum(gross_loss), sum(net)
+            FROM trade_rollups WHERE {' AND '.join(clauses)} GROUP BY bucket ORDER BY bucket
+        ''', params)
+        return [dict(stats.summary(*r[1:]), bucket=r[0]) for r in cur.fetchall()]
+
+    def get_trade_stats(self):
+        empty = {"count": 0, "wins": 0, "losses": 0, "gross_profit": 0.0, "gross_loss": 0.0, "net": 0.0}
+        if not self.cursor: return empty
+        self.cursor.execute('SELECT trade_count, wins, losses, gross_profit, gross_loss, net FROM trade_stats WHERE id=1')
+        row = self.cursor.fetchone()
+        if not row: return empty
+        return {"count": row[0], "wins": row[1], "losses": row[2], "gross_profit": row[3], "gross_loss": row[4], "net": row[5]}
+
+    def rebuild_trade_stats(self):
+        # 全表重算彙總 (校正浮點累積誤差，或大量匯入後使用)
+        if not self.cursor: return
+        self.cursor.execute('DELETE FROM trade_stats')
+        self.create_stats_table()
         self.conn.commit()
 
-db = DBManager()
+class AsyncDBManager:
+    """DBManager 的非同步包裝，給 async 的 Flet handler 使用。
+
+    會改資料的方法 (與合約快取) 全部排進單一寫入執行緒，共用的 cursor 不會被
+    併發的 handler 搶用；讀取方法走 WAL 下的唯讀連線池，每個讀取執行緒各有一條連線。
+    所有 DBManager 的公開方法都可以直接 await，例如 ``await db.get_trade_stats()``；
+    開啟效能紀錄時每次呼叫的執行時間與回傳筆數記在 profiling (不含排隊等執行緒的時間)。
+    建構時不開資料庫；第一次 await open() (或任何方法) 時才在寫入執行緒開啟並檢查 schema。
+    """
+
+    READ_METHODS = frozenset([
+        'get_trades_page', 'get_trade_by_id', 'get_all_trades', 'get_trade_stats', 'get_settings',
+        'get_instruments', 'count_trades', 'get_trade_columns', 'get_advanced_stats', 'export_csv',
+        'search_trades', 'get_rollups', 'get_trades_version', 'get_open_positions',
+        'create_backup', 'list_backups', 'backup_due',
+    ])
+
+    def __init__(self, db_file=DB_FILE, readers=DB_READER_COUNT):
+        self.db_file = db_file
+        self.writer = None
+        self.opening = None
+        self.writer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self.reader_pool = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self.local = threading.local()
+        self.readers = []
+
+    @property
+    def error_msg(self):
+        return self.writer.error_msg if self.writer else None
+
+    def open_writer(self):
+        if self.writer is None:
+            self.writer = DBManager(self.db_file)
+        return self.writer
+
+    def open(self):
+        # 只排一次；寫入執行緒是 FIFO，之後排進去的寫入一定在開啟之後執行
+        if self.opening is None:
+            self.opening = self.writer_pool.submit(self.open_writer)
+        return asyncio.wrap_future(self.opening)
+
+    def reader(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = DBManager(self.db_file, read_only=True)
+            self.readers.append(db)
+        return db
+
+    def run_on_reader(self, name, *args, **kwargs):
+        return profiling.call_timed(self.reader(), name, *args, **kwargs)
+
+    def run_on_writer(self, name, *args, **kwargs):
+        return profiling.call_timed(self.writer, name, *args, **kwargs)
+
+    async def run_write(self, name, *args, **kwargs):
+        self.open()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.writer_pool, functools.partial(self.run_on_writer, name, *args, **kwargs))
+
+    async def run_read(self, name, *args, **kwargs):
+        # 讀取連線不建表，要等寫入連線完成 schema 檢查
+        await self.open()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.reader_pool, functools.partial(self.run_on_reader, name, *args, **kwargs))
+
+    async def get_contract(self, pair):
+        # 快取命中時直接回傳，不必排隊等寫入執行緒 (例如匯入進行中)
+        cache = self.writer.contract_cache if self.writer else None
+        if cache is not None and pair in cache:
+            return cache[pair]
+        return await self.run_write('get_contract', pair)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(DBManager, name, None)):
+            raise AttributeError(name)
+        run = self.run_read if name in self.READ_METHODS else self.run_write
+        return functools.partial(run, name)
+
+    def close(self):
+        self.writer_pool.shutdown(wait=True)
+        self.reader_pool.shutdown(wait=True)
+        for d in self.readers + ([self.writer] if self.writer else []):
+            if d.conn:
+                d.conn.close()
+
+class JournalRegistry:
+    """帳戶日記的登錄表：帳戶名稱 <-> 檔案，並保留已開啟的 AsyncDBManager。
+
+    每個帳戶各有自己的連線、寫入/讀取執行緒與合約快取；切換帳戶不會關掉舊的，
+    進行中的寫入照常完成，切回來也不必重新開檔。
+    """
+
+    def __init__(self, directory=os.curdir):
+        self.directory = directory
+        self.open_journals = {}
+
+    def path_for(self, name):
+        if name == DEFAULT_JOURNAL:
+            return os.path.join(self.directory, DB_FILE)
+        return os.path.join(self.directory, JOURNAL_PREFIX + name + JOURNAL_SUFFIX)
+
+    def list_journals(self):
+        names = [DEFAULT_JOURNAL]
+        for f in sorted(os.listdir(self.directory)):
+            if f.startswith(JOURNAL_PREFIX) and f.endswith(JOURNAL_SUFFIX):
+                names.append(f[len(JOURNAL_PREFIX):-len(JOURNAL_SUFFIX)])
+        return names
+
+    def open(self, name):
+        journal = self.open_journals.get(name)
+        if journal is None:
+            journal = self.open_journals[name] = AsyncDBManager(self.path_for(name))
+        return journal
+
+    def discard(self, name):
+        # 開啟失敗的帳戶不留在登錄表，下次切換時重新開檔
+        journal = self.open_journals.pop(name, None)
+        if journal is not None:
+            journal.close()
+
+    def create(self, name):
+        # 名稱會成為檔名的一部分，只允許文字、數字、底線與減號
+        name = name.strip()
+        if not re.fullmatch(r'[\w\-]+', name) or name == DEFAULT_JOURNAL:
+            raise ValueError("帳戶名稱只能包含文字、數字、_ 與 -")
+        if os.path.exists(self.path_for(name)):
+            raise ValueError(f"帳戶已存在: {name}")
+        return self.open(name)
+
+    def get_cross_summary(self):
+        # 跨帳戶總覽：各帳戶檔案 ATTACH 到同一條連線 (唯讀)，以 UNION ALL 彙總查詢直接讀
+        # trade_stats / trade_rollups，不把交易載入 Python。超過 MAX_ATTACHED 個帳戶時分批再合併。
+        # 打不開的帳戶不列入合計，放在 failed (帳戶 -> 錯誤訊息)
+        import stats
+        names, failed = [], {}
+        for name in self.list_journals():
+            if name not in self.open_journals:
+                # 沒開過的帳戶先確認 schema 是最新 (已是最新時只讀 user_version)
+                check = DBManager(self.path_for(name))
+                if check.conn:
+                    check.conn.close()
+                if check.error_msg:
+                    failed[name] = check.error_msg
+                    continue
+            names.append(name)
+        accounts, pairs = [], {}
+        conn = sqlite3.connect(':memory:', uri=True)
+        try:
+            for i in range(0, len(names), MAX_ATTACHED):
+                batch = names[i:i + MAX_ATTACHED]
+                for j, name in enumerate(batch):
+                    conn.execute(f'ATTACH DATABASE ? AS j{j}', (Path(self.path_for(name)).resolve().as_uri() + '?mode=ro',))
+                rows = conn.execute(' UNION ALL '.join(
+                    f'SELECT ?, trade_count, wins, losses, gross_profit, gross_loss, net FROM j{j}.trade_stats WHERE id = 1'
+                    for j in range(len(batch))), batch).fetchall()
+                accounts += [dict(stats.summary(*r[1:]), name=r[0]) for r in rows]
+                for r in conn.execute(f'''
+                    SELECT pair, sum(trade_count), sum(wins), sum(losses), sum(gross_profit), sum(gross_loss), sum(net)
+                    FROM ({' UNION ALL '.join(f"SELECT * FROM j{j}.trade_rollups WHERE period = 'month'" for j in range(len(batch)))})
+                    GROUP BY pair
+                '''):
+                    p = pairs.setdefault(r[0], [0, 0, 0, 0.0, 0.0, 0.0])
+                    for k, v in enumerate(r[1:]):
+                        p[k] += v
+                for j in range(len(batch)):
+                    conn.execute(f'DETACH DATABASE j{j}')
+        finally:
+            conn.close()
+        totals = [sum(a[k] for a in accounts) for k in ("count", "wins", "losses", "gross_profit", "gross_loss", "net")]
+        return {
+            "accounts": accounts,
+            "total": stats.summary(*totals),
+            "per_pair": {pair: stats.summary(*p) for pair, p in pairs.items()},
+            "failed": failed,
+        }
+
+    async def cross_summary(self):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get_cross_summary)
+
+    def close_all(self):
+        for journal in self.open_journals.values():
+            journal.close()
+        self.open_journals.clear()
+
+journals = JournalRegistry()
+# 目前使用中的帳戶；UI 一律透過這個名稱存取，切換帳戶時由 use_journal 換掉
+db = journals.open(DEFAULT_JOURNAL)
+
+def use_journal(name):
+    global db
+    db = journals.open(name)
+    return db
 
 # =========================================================================
 # 2. Flet APP 介面
 # =========================================================================
 
-def main(page: ft.Page):
+async def main(page: ft.Page):
     page.title = "招財黑豬交易日記 (V7.4)"
     page.theme_mode = "LIGHT"
     page.window_width = 400
@@ -294,9 +1500,105 @@ def main(page: ft.Page):
         bgcolor="#e0e0e0",
     )
 
+    # --- 帳戶切換 (每個帳戶一個日記檔，由 journals 登錄表管理) ---
+    journal_state = {"name": DEFAULT_JOURNAL}
+    btn_journal_menu = ft.PopupMenuButton(icon="account_balance_wallet", tooltip="切換帳戶")
+    page.appbar.actions = [btn_journal_menu]
+
+    def refresh_journal_menu():
+        current = journal_state["name"]
+        btn_journal_menu.items = [
+            ft.PopupMenuItem(text=name, checked=name == current, data=name, on_click=switch_journal_click)
+            for name in journals.list_journals()
+        ] + [
+            ft.PopupMenuItem(),
+            ft.PopupMenuItem(text="新增帳戶", icon="add", on_click=open_new_journal_click),
+            ft.PopupMenuItem(text="跨帳戶總覽", icon="summarize", on_click=cross_summary_click),
+        ]
+        page.appbar.title.value = "交易日記" if current == DEFAULT_JOURNAL else f"交易日記 · {current}"
+
+    async def switch_journal(name):
+        # 先開新帳戶，成功才換掉全域的 db；失敗時留在原本的帳戶
+        journal = journals.open(name)
+        await journal.open()
+        if journal.error_msg:
+            journals.discard(name)
+            return show_msg(journal.error_msg, "red")
+        use_journal(name)
+        journal_state["name"] = name
+        # 快取與分頁內容都屬於上一個帳戶，全部重建
+        stats_cache["key"] = None
+        refresh_journal_menu()
+        dirty_tabs.update(tab_loaders)
+        await rebuild_if_dirty(t.selected_index)
+        show_msg(f"已切換到帳戶: {name}")
+
+    async def switch_journal_click(e):
+        if e.control.data != journal_state["name"]:
+            await switch_journal(e.control.data)
+
+    txt_new_journal = ft.TextField(label="帳戶名稱", hint_text="例如 prop_a、波段")
+
+    async def create_journal_click(e):
+        try:
+            journals.create(txt_new_journal.value or "")
+        except ValueError as ex:
+            return show_msg(str(ex), "red")
+        dlg_new_journal.open = False
+        name = txt_new_journal.value.strip()
+        txt_new_journal.value = ""
+        await switch_journal(name)
+
+    dlg_new_journal = ft.AlertDialog(
+        title=ft.Text("新增帳戶"),
+        content=txt_new_journal,
+        actions=[ft.ElevatedButton("建立", on_click=create_journal_click)],
+    )
+    page.overlay.append(dlg_new_journal)
+
+    def open_new_journal_click(e):
+        dlg_new_journal.open = True
+        page.update()
+
+    dlg_cross_summary = ft.AlertDialog(title=ft.Text("跨帳戶總覽"), content=ft.Column([ft.Text("載入中...")], height=400, scroll="auto"))
+    page.overlay.append(dlg_cross_summary)
+
+    def summary_row(label, r, bold=False):
+        weight = "bold" if bold else None
+        return ft.DataRow(cells=[
+            ft.DataCell(ft.Text(label, weight=weight)),
+            ft.DataCell(ft.Text(str(r['count']), weight=weight)),
+            ft.DataCell(ft.Text(f"{r['win_rate']:.1f}%", weight=weight)),
+            ft.DataCell(ft.Text(f"${r['net']:.2f}", weight=weight, color="green" if r['net'] >= 0 else "red")),
+        ])
+
+    def summary_table(first_column, rows):
+        return ft.Row([ft.DataTable(
+            columns=[ft.DataColumn(ft.Text(first_column)), ft.DataColumn(ft.Text("筆數"), numeric=True), ft.DataColumn(ft.Text("勝率"), numeric=True), ft.DataColumn(ft.Text("淨利"), numeric=True)],
+            rows=rows, column_spacing=20,
+        )], scroll="auto")
+
+    async def cross_summary_click(e):
+        dlg_cross_summary.open = True
+        page.update()
+        try:
+            summary = await journals.cross_summary()
+        except Exception as ex:
+            dlg_cross_summary.content.controls = [ft.Text(f"Error: {ex}", color="red")]
+            return page.update()
+        dlg_cross_summary.content.controls = [
+            summary_table("帳戶", [summary_row(a['name'], a) for a in summary['accounts']] + [summary_row("合計", summary['total'], bold=True)]),
+            ft.Text("商品 (所有帳戶)", size=16, weight="bold"),
+            summary_table("商品", [summary_row(pair, p) for pair, p in sorted(summary['per_pair'].items(), key=lambda kv: -kv[1]['net'])]),
+        ] + [ft.Text(f"無法開啟 {name}: {msg}", size=12, color="red") for name, msg in summary['failed'].items()]
+        page.update()
+
+    refresh_journal_menu()
+
     # --- Tab 1: 輸入 ---
-    def on_menu_item_click(e):
+    async def on_menu_item_click(e):
         txt_pair.value = e.control.data
+        await update_pnl_preview()
         page.update()
 
     common_pairs = ["XAUUSD", "EURUSD", "GBPUSD", "USDJPY", "US30", "NAS100", "BTCUSD", "ETHUSD", "SOLUSD"]
@@ -308,8 +1610,39 @@ def main(page: ft.Page):
     txt_entry = ft.TextField(label="進場價", keyboard_type="number")
     txt_exit = ft.TextField(label="出場價", keyboard_type="number")
     lbl_pnl_preview = ft.Text("預估: $0.00", size=16, weight="bold")
+    preview_task = [None]
+
+    async def update_pnl_preview():
+        # 只用快取的合約大小與純函式計算，不碰 SQLite
+        try:
+            pair = txt_pair.value.upper().strip() if txt_pair.value else ""
+            size, quote, pip = await db.get_contract(pair)
+            entry, exit_p = float(txt_entry.value), float(txt_exit.value)
+            pnl = calc_pnl(dd_direction.value, float(txt_lots.value), entry, exit_p, size, quote)
+        except (TypeError, ValueError):
+            lbl_pnl_preview.value = "預估: $0.00"
+            lbl_pnl_preview.color = None
+            return
+        pips = calc_pips(dd_direction.value, entry, exit_p, pip)
+        lbl_pnl_preview.value = f"預估: {format_pnl(pnl, pnl_currency_for(pair, quote))}" + (f" ({pips:+.1f} 點)" if pips is not None else "")
+        lbl_pnl_preview.color = "green" if pnl >= 0 else "red"
+
+    async def flush_pnl_preview():
+        await asyncio.sleep(PREVIEW_DEBOUNCE_SEC)
+        preview_task[0] = None
+        await update_pnl_preview()
+        page.update()
+
+    async def on_entry_change(e):
+        # 第一次按鍵排一個延遲更新，期間內的後續按鍵併入同一次更新 (讀取當下最新的值)
+        if preview_task[0] is None:
+            preview_task[0] = asyncio.create_task(flush_pnl_preview())
 
-    def save_trade_click(e):
+    for field in (txt_pair, dd_direction, txt_lots, txt_entry, txt_exit):
+        field.on_change = on_entry_change
+
+    @profiling.profiled
+    async def save_trade_click(e):
         try:
             pair = txt_pair.value.upper().strip() if txt_pair.value else ""
             if not pair: return show_msg("請輸入商品", "red")
@@ -317,56 +1650,126 @@ def main(page: ft.Page):
             entry = float(txt_entry.value)
             exit_p = float(txt_exit.value)
             
-            settings = db.get_settings()
-            contract = settings['gold'] if "XAU" in pair or "GOLD" in pair else (settings['crypto'] if any(k in pair for k in ["BTC","ETH","SOL"]) else settings['forex'])
-            pnl = (exit_p - entry if dd_direction.value=="BUY" else entry - exit_p) * lots * contract
+            size, quote, _ = await db.get_contract(pair)
+            pnl = calc_pnl(dd_direction.value, lots, entry, exit_p, size, quote)
+            currency = pnl_currency_for(pair, quote)
             
-            data = {'pair': pair, 'direction': dd_direction.value, 'lots': lots, 'entry_price': entry, 'exit_price': exit_p, 'pnl_usd': pnl}
-            if db.add_trade(data):
-                show_msg(f"保存成功! ${pnl:.2f}")
-                refresh_all_data()
+            data = {'pair': pair, 'direction': dd_direction.value, 'lots': lots, 'entry_price': entry, 'exit_price': exit_p, **pnl_fields(pnl, currency)}
+            new_id = await db.add_trade(data)
+            if new_id:
+                # 紀錄頁已建好且是預設排序、無篩選時只插入新的一列，否則等切過去再整頁載入
+                if TAB_HISTORY in dirty_tabs or history_state["filters"] or history_state["sort"] != "newest":
+                    await invalidate(TAB_HISTORY, TAB_STATS)
+                else:
+                    prepend_history_row(await db.get_trade_by_id(new_id))
+                    await invalidate(TAB_STATS)
+                show_msg(f"保存成功! {format_pnl(pnl, currency)}")
             else:
                 show_msg("保存失敗 (DB錯誤)", "red")
         except:
             show_msg("輸入錯誤", "red")
 
+    # --- 部位 (分批進出)：每筆成交由 DBManager.record_fill 配對，平倉部分寫成 trades ---
+    txt_fill_pair = ft.TextField(label="商品", expand=True)
+    dd_fill_side = ft.Dropdown(label="買/賣", options=[ft.dropdown.Option("BUY"), ft.dropdown.Option("SELL")], value="BUY", expand=True)
+    txt_fill_lots = ft.TextField(label="手數", keyboard_type="number", expand=True)
+    txt_fill_price = ft.TextField(label="成交價", keyboard_type="number", expand=True)
+    col_positions = ft.Column(spacing=5)
+
+    def close_position_click(e):
+        # 把反向、同手數帶進成交表單，只差填入價格
+        p = e.control.data
+        txt_fill_pair.value = p['pair']
+        dd_fill_side.value = "SELL" if p['direction'] == "BUY" else "BUY"
+        txt_fill_lots.value = f"{p['size']:g}"
+        txt_fill_price.value = ""
+        page.update()
+
+    async def load_positions():
+        col_positions.controls = [
+            ft.Row([
+                ft.Text(f"{p['pair']} {'多' if p['direction'] == 'BUY' else '空'} {p['size']:g} 手 @ {p['avg_price']:.5g}", expand=True),
+                ft.Text(f"{p['lot_count']} 筆", size=12, color="grey"),
+                ft.TextButton("平倉", data=p, on_click=close_position_click),
+            ])
+            for p in await db.get_open_positions()
+        ] or [ft.Text("沒有未平倉部位", size=12, color="grey")]
+
+    @profiling.profiled
+    async def submit_fill_click(e):
+        try:
+            pair = txt_fill_pair.value.upper().strip() if txt_fill_pair.value else ""
+            if not pair: return show_msg("請輸入商品", "red")
+            lots = float(txt_fill_lots.value)
+            price = float(txt_fill_price.value)
+            if lots <= 0: raise ValueError
+        except (TypeError, ValueError):
+            return show_msg("輸入錯誤", "red")
+        try:
+            result = await db.record_fill(pair, dd_fill_side.value, lots, price)
+        except Exception as ex:
+            return show_msg(f"成交記錄失敗: {ex}", "red")
+        await load_positions()
+        if result['trade_ids']:
+            await invalidate(TAB_HISTORY, TAB_STATS)
+            show_msg(f"平倉 {len(result['trade_ids'])} 筆，已實現 ${result['realized']:.2f}")
+        else:
+            show_msg(f"已{'加碼' if result['size'] > lots else '建立'}部位")
+
     tab_entry = ft.Container(
         content=ft.Column([
             ft.Text("新增交易", size=20, weight="bold"),
             txt_pair, dd_direction, txt_lots, txt_entry, txt_exit,
             ft.ElevatedButton("💾 保存交易", on_click=save_trade_click, height=50, bgcolor="blue", color="white"),
-            lbl_pnl_preview
+            lbl_pnl_preview,
+            ft.Divider(),
+            ft.Text("部位 (分批進出)", size=20, weight="bold"),
+            ft.Row([txt_fill_pair, dd_fill_side]),
+            ft.Row([txt_fill_lots, txt_fill_price]),
+            ft.ElevatedButton("送出成交", icon="swap_vert", on_click=submit_fill_click),
+            col_positions,
         ], spacing=15, scroll="auto"), 
         padding=20
     )
 
     # --- Tab 2: 紀錄 ---
-    lv_history = ft.ListView(expand=True, spacing=10, padding=20)
+    lv_history = ft.ListView(expand=True, spacing=10, padding=20, on_scroll_interval=100)
+    # 已顯示的列 {trade_id: Container}，新增/刪除時只動受影響的那一列
+    history_rows = {}
+    # filters 是傳給 DBManager.build_trade_filter 的關鍵字參數，統計頁也可以套用同一組
+    history_state = {"cursor": None, "has_more": True, "sort": "newest", "filters": {}}
+    lbl_history_empty = ft.Text("尚無紀錄")
     txt_detail_note = ft.TextField(label="心得", multiline=True, min_lines=5)
     current_trade_id = None
     
+    btn_save_note = ft.ElevatedButton("保存心得")
     dlg_detail = ft.AlertDialog(
         title=ft.Text("詳細資料"),
         content=ft.Column([ft.Text("載入中...")], height=400, scroll="adaptive"),
-        actions=[ft.ElevatedButton("保存心得", on_click=lambda e: save_note_click(e))]
+        actions=[btn_save_note]
     )
     page.overlay.append(dlg_detail)
 
-    def save_note_click(e):
+    async def save_note_click(e):
         if current_trade_id:
-            db.update_trade_note(current_trade_id, txt_detail_note.value)
-            show_msg("已更新")
+            await db.update_trade_note(current_trade_id, txt_detail_note.value)
+            # 心得不影響紀錄列與統計，不需重建任何分頁
             dlg_detail.open = False
-            page.update()
-            refresh_all_data()
+            if search_state["query"]:
+                # 心得變了，搜尋結果的排序與摘要也要跟著更新
+                await run_search(search_state["query"])
+            show_msg("已更新")
+
+    btn_save_note.on_click = save_note_click
 
-    def open_detail_click(e):
+    @profiling.profiled
+    async def open_detail_click(e):
         nonlocal current_trade_id
         current_trade_id = e.control.data
-        trade = db.get_trade_by_id(current_trade_id)
+        trade = await db.get_trade_by_id(current_trade_id)
         if not trade: return
         txt_detail_note.value = trade['note']
-        pnl = trade['pnl_usd']
+        pnl, currency = display_pnl(trade)
         color = "green" if pnl >= 0 else "red"
         
         dlg_detail.content.controls = [
@@ -374,56 +1777,255 @@ def main(page: ft.Page):
             ft.Divider(),
             ft.Text(f"時間: {trade['entry_time'][:16]}"),
             ft.Text(f"進場: {trade['entry_price']} / 出場: {trade['exit_price']}"),
-            ft.Text(f"手數: {trade['lots']} / 損益: ${pnl:.2f}", weight="bold", color=color),
+            ft.Text(f"手數: {trade['lots']} / 損益: {format_pnl(pnl, currency)}", weight="bold", color=color),
             ft.Divider(),
             txt_detail_note
         ]
         dlg_detail.open = True
         page.update()
 
-    def delete_trade_click(e):
-        db.delete_trade(e.control.data)
-        refresh_all_data()
+    async def delete_trade_click(e):
+        trade_id = e.control.data
+        if not await db.delete_trade(trade_id):
+            return show_msg("刪除失敗 (DB錯誤)", "red")
+        row = history_rows.pop(trade_id, None)
+        if row in lv_history.controls:
+            lv_history.controls.remove(row)
+        if not history_rows:
+            if history_state["has_more"]:
+                await load_more_history()
+            else:
+                lv_history.controls.append(lbl_history_empty)
+        await invalidate(TAB_STATS)
         show_msg("已刪除", "orange")
 
-    def load_history_data():
-        lv_history.controls.clear()
+    def build_history_row(t):
+        pnl, currency = display_pnl(t)
+        color = "green" if pnl >= 0 else "red"
+        return ft.Container(
+            content=ft.Row([
+                ft.Icon("trending_up" if pnl>=0 else "trending_down", color=color),
+                ft.Column([
+                    ft.Text(f"{t['pair']} {t['direction']}", weight="bold"),
+                    ft.Text(format_pnl(pnl, currency), color=color)
+                ], expand=True),
+                ft.IconButton(icon="edit", icon_color="blue", data=t['id'], on_click=open_detail_click),
+                ft.IconButton(icon="delete", icon_color="red", data=t['id'], on_click=delete_trade_click),
+            ]),
+            padding=10, bgcolor="white", border_radius=5
+        )
+
+    def prepend_history_row(t):
+        if not t: return
+        if lbl_history_empty in lv_history.controls:
+            lv_history.controls.remove(lbl_history_empty)
+        row = build_history_row(t)
+        history_rows[t['id']] = row
+        lv_history.controls.insert(0, row)
+
+    @profiling.profiled
+    async def load_more_history():
+        # 只把下一頁附加到列表尾端，已顯示的列不重建
+        if not history_state["has_more"]: return
         try:
-            trades = db.get_all_trades()
-            if not trades:
-                lv_history.controls.append(ft.Text("尚無紀錄"))
+            sort = history_state["sort"]
+            trades = await db.get_trades_page(history_state["cursor"], HISTORY_PAGE_SIZE, sort, **history_state["filters"])
+            if len(trades) < HISTORY_PAGE_SIZE:
+                history_state["has_more"] = False
             for t in trades:
-                color = "green" if t['pnl_usd'] >= 0 else "red"
-                row = ft.Container(
-                    content=ft.Row([
-                        ft.Icon("trending_up" if t['pnl_usd']>=0 else "trending_down", color=color),
-                        ft.Column([
-                            ft.Text(f"{t['pair']} {t['direction']}", weight="bold"),
-                            ft.Text(f"${t['pnl_usd']:.2f}", color=color)
-                        ], expand=True),
-                        ft.IconButton(icon="edit", icon_color="blue", data=t['id'], on_click=open_detail_click),
-                        ft.IconButton(icon="delete", icon_color="red", data=t['id'], on_click=delete_trade_click),
-                    ]),
-                    padding=10, bgcolor="white", border_radius=5
-                )
+                row = build_history_row(t)
+                history_rows[t['id']] = row
                 lv_history.controls.append(row)
+            if trades:
+                history_state["cursor"] = trade_page_cursor(trades[-1], sort)
+            if not history_rows:
+                lv_history.controls.append(lbl_history_empty)
         except Exception as e:
+            history_state["has_more"] = False
             lv_history.controls.append(ft.Text(f"Error: {e}"))
+
+    async def on_history_scroll(e):
+        # 捲到接近底部時才載入下一頁
+        if history_state["has_more"] and e.pixels >= e.max_scroll_extent - 200:
+            await load_more_history()
+            page.update()
+
+    lv_history.on_scroll = on_history_scroll
+
+    @profiling.profiled
+    async def load_history_data():
+        lv_history.controls.clear()
+        history_rows.clear()
+        history_state["cursor"] = None
+        history_state["has_more"] = True
+        await load_more_history()
+        if search_state["query"]:
+            await run_search(search_state["query"])
+
+    # --- 心得搜尋 (FTS5) ---
+    txt_search = ft.TextField(label="搜尋心得 / 商品", prefix_icon="search", expand=True, dense=True)
+    lv_search = ft.ListView(expand=True, spacing=10, padding=20, on_scroll_interval=100, visible=False)
+    search_state = {"query": "", "offset": 0, "has_more": False}
+
+    def highlight_spans(snippet):
+        # 把 HIGHLIGHT_START/END 之間的文字轉成粗體的 TextSpan
+        spans = []
+        for i, part in enumerate(snippet.replace(HIGHLIGHT_END, HIGHLIGHT_START).split(HIGHLIGHT_START)):
+            if not part: continue
+            if i % 2:
+                spans.append(ft.TextSpan(part, style=ft.TextStyle(weight="bold", bgcolor="yellow100")))
+            else:
+                spans.append(ft.TextSpan(part))
+        return spans
+
+    def build_search_row(r):
+        pnl, currency = display_pnl(r)
+        color = "green" if pnl >= 0 else "red"
+        return ft.Container(
+            content=ft.Row([
+                ft.Column([
+                    ft.Row([
+                        ft.Text(f"{r['pair']} {r['direction']}", weight="bold"),
+                        ft.Text(format_pnl(pnl, currency), color=color),
+                    ]),
+                    ft.Text(spans=highlight_spans(r['snippet']), size=13, color="grey800"),
+                ], expand=True, spacing=2),
+                ft.IconButton(icon="edit", icon_color="blue", data=r['id'], on_click=open_detail_click),
+            ]),
+            padding=10, bgcolor="white", border_radius=5
+        )
+
+    async def load_more_search():
+        if not search_state["has_more"]: return
+        results = await db.search_trades(search_state["query"], SEARCH_PAGE_SIZE, search_state["offset"])
+        search_state["offset"] += len(results)
+        search_state["has_more"] = len(results) == SEARCH_PAGE_SIZE
+        lv_search.controls.extend(build_search_row(r) for r in results)
+        if not lv_search.controls:
+            lv_search.controls.append(ft.Text("找不到符合的紀錄"))
+
+    @profiling.profiled
+    async def run_search(query):
+        search_state.update(query=query, offset=0, has_more=True)
+        lv_search.controls.clear()
+        try:
+            await load_more_search()
+        except Exception as e:
+            search_state["has_more"] = False
+            lv_search.controls.append(ft.Text(f"Error: {e}"))
+
+    async def on_search_submit(e):
+        query = txt_search.value.strip()
+        if query:
+            await run_search(query)
+        else:
+            search_state["query"] = ""
+            lv_search.controls.clear()
+        lv_search.visible = bool(query)
+        lv_history.visible = not query
+        page.update()
+
+    async def clear_search_click(e):
+        txt_search.value = ""
+        await on_search_submit(e)
+
+    async def on_search_scroll(e):
+        if search_state["has_more"] and e.pixels >= e.max_scroll_extent - 200:
+            await load_more_search()
+            page.update()
+
+    txt_search.on_submit = on_search_submit
+    lv_search.on_scroll = on_search_scroll
+
+    # --- 紀錄篩選與排序 (組成 SQL 由 DBManager.build_trade_query 負責) ---
+    txt_filter_pair = ft.TextField(label="商品", dense=True, expand=True)
+    dd_filter_direction = ft.Dropdown(label="方向", dense=True, expand=True, value="", options=[ft.dropdown.Option("", "全部"), ft.dropdown.Option("BUY"), ft.dropdown.Option("SELL")])
+    dd_filter_outcome = ft.Dropdown(label="結果", dense=True, expand=True, value="", options=[ft.dropdown.Option("", "全部"), ft.dropdown.Option("win", "獲利"), ft.dropdown.Option("loss", "虧損")])
+    txt_filter_from = ft.TextField(label="開始日期", hint_text="YYYY-MM-DD", dense=True, expand=True)
+    txt_filter_to = ft.TextField(label="結束日期", hint_text="YYYY-MM-DD", dense=True, expand=True)
+    txt_filter_min_lots = ft.TextField(label="最小手數", dense=True, expand=True, keyboard_type="number")
+    txt_filter_max_lots = ft.TextField(label="最大手數", dense=True, expand=True, keyboard_type="number")
+    dd_sort = ft.Dropdown(label="排序", dense=True, expand=True, value="newest", options=[ft.dropdown.Option(k, v[2]) for k, v in TRADE_SORTS.items()])
+    lbl_filter_status = ft.Text("", size=12, color="grey")
+
+    def read_history_filters():
+        # 表單 -> build_trade_filter 的關鍵字參數，只放有填的欄位；格式錯誤丟 ValueError
+        filters = {
+            "pair": txt_filter_pair.value.upper().strip() if txt_filter_pair.value else None,
+            "direction": dd_filter_direction.value or None,
+            "outcome": dd_filter_outcome.value or None,
+            "start_ts": parse_day(txt_filter_from.value),
+            "end_ts": parse_day(txt_filter_to.value, end_of_day=True),
+            "min_lots": float(txt_filter_min_lots.value) if txt_filter_min_lots.value and txt_filter_min_lots.value.strip() else None,
+            "max_lots": float(txt_filter_max_lots.value) if txt_filter_max_lots.value and txt_filter_max_lots.value.strip() else None,
+        }
+        return {k: v for k, v in filters.items() if v is not None}
+
+    @profiling.profiled
+    async def apply_filters_click(e):
+        try:
+            filters = read_history_filters()
+        except ValueError:
+            return show_msg("篩選格式錯誤 (日期 YYYY-MM-DD，手數為數字)", "red")
+        history_state["filters"] = filters
+        history_state["sort"] = dd_sort.value or "newest"
+        count = await db.count_trades(**filters)
+        lbl_filter_status.value = f"篩選中：{count} 筆" if filters else ""
+        await load_history_data()
+        # 統計頁若選了「套用紀錄篩選」，下次切過去要重算
+        dirty_tabs.add(TAB_STATS)
         page.update()
 
+    async def reset_filters_click(e):
+        for field in (txt_filter_pair, txt_filter_from, txt_filter_to, txt_filter_min_lots, txt_filter_max_lots):
+            field.value = ""
+        dd_filter_direction.value = dd_filter_outcome.value = ""
+        dd_sort.value = "newest"
+        await apply_filters_click(e)
+
+    filter_panel = ft.Container(
+        content=ft.Column([
+            ft.Row([txt_filter_pair, dd_filter_direction, dd_filter_outcome]),
+            ft.Row([txt_filter_from, txt_filter_to]),
+            ft.Row([txt_filter_min_lots, txt_filter_max_lots, dd_sort]),
+            ft.Row([
+                ft.ElevatedButton("套用", icon="filter_alt", on_click=apply_filters_click),
+                ft.TextButton("清除篩選", on_click=reset_filters_click),
+            ]),
+        ], spacing=10),
+        padding=ft.padding.only(left=20, right=20, top=10), visible=False,
+    )
+
+    def toggle_filters_click(e):
+        filter_panel.visible = not filter_panel.visible
+        page.update()
+
+    tab_history = ft.Column([
+        ft.Container(
+            content=ft.Row([
+                txt_search,
+                ft.IconButton(icon="clear", tooltip="清除搜尋", on_click=clear_search_click),
+                ft.IconButton(icon="filter_list", tooltip="篩選 / 排序", on_click=toggle_filters_click),
+            ]),
+            padding=ft.padding.only(left=20, right=10, top=10),
+        ),
+        filter_panel,
+        ft.Container(content=lbl_filter_status, padding=ft.padding.only(left=20)),
+        lv_history,
+        lv_search,
+    ], expand=True, spacing=0)
+
     # --- 紀律計數器邏輯 ---
     lbl_thumbs = ft.Text("0", size=40, weight="bold", color="blue")
 
-    def thumbs_click(e):
-        lbl_thumbs.value = str(db.increment_thumbs_up())
+    async def thumbs_click(e):
+        lbl_thumbs.value = str(await db.increment_thumbs_up())
         quote = random.choice(PIG_QUOTES)
         show_msg(f"🐷：{quote}", "blue")
-        page.update()
     
-    def reset_thumbs(e):
-        lbl_thumbs.value = str(db.reset_thumbs_up())
+    async def reset_thumbs(e):
+        lbl_thumbs.value = str(await db.reset_thumbs_up())
         show_msg("紀律重置！重新做人！", "orange")
-        page.update()
 
     thumbs_section = ft.Container(
         content=ft.Column([
@@ -460,24 +2062,204 @@ def main(page: ft.Page):
             width=150, padding=10, bgcolor="#f0f0f0", border_radius=10
         )
 
-    def load_stats_data():
-        trades = db.get_all_trades()
+    @profiling.profiled
+    async def load_stats_data():
+        filters = history_state["filters"] if chk_stats_filtered.value else {}
+        # 有篩選時整組統計都從篩選後的子集合算；否則基本數字直接讀 trade_stats 彙總表
+        advanced = await get_cached_advanced_stats(filters) if filters else None
+        s = advanced or await db.get_trade_stats()
+        lbl_thumbs.value = str((await db.get_settings())['thumbs'])
         stats_container.controls.clear()
-        stats_container.controls.append(thumbs_section)
-        
-        net = sum(t['pnl_usd'] for t in trades)
-        wins = [t for t in trades if t['pnl_usd'] > 0]
-        rate = (len(wins)/len(trades)*100) if trades else 0
-        
+        stats_container.controls.extend([thumbs_section, chk_stats_filtered])
+
+        net = s['net']
+        rate = (s['wins']/s['count']*100) if s['count'] else 0
+
         row1 = ft.Row([create_stat_card("淨利", f"${net:.2f}", "green" if net>=0 else "red", "淨利說明"), create_stat_card("勝率", f"{rate:.1f}%", "blue", "勝率說明")], alignment="center")
-        
+        row2 = ft.Row([create_stat_card("總獲利", f"${s['gross_profit']:.2f}", "green", "所有獲利單的損益總和"), create_stat_card("總虧損", f"${s['gross_loss']:.2f}", "red", "所有虧損單的損益總和 (取絕對值)")], alignment="center")
+        row3 = ft.Row([create_stat_card("交易筆數", str(s['count']), "black", "已記錄的交易總數"), create_stat_card("勝 / 敗", f"{s['wins']} / {s['losses']}", "blue", "獲利單與虧損單的筆數 (損益為 0 不計)")], alignment="center")
+
         stats_container.controls.extend([
             ft.Divider(),
-            ft.Text("帳戶數據", size=20, weight="bold", text_align="center"),
-            row1
+            ft.Text("篩選結果" if filters else "帳戶數據", size=20, weight="bold", text_align="center"),
+            row1, row2, row3
+        ])
+        if s['count']:
+            advanced = advanced or await get_cached_advanced_stats(filters)
+            stats_container.controls.extend(build_equity_chart(*advanced['equity_curve']))
+            stats_container.controls.extend(build_advanced_stats(advanced))
+            # 彙總表只以商品分桶，篩選條件中只有 pair 會套用到日曆
+            rollup_state["pair"] = filters.get("pair")
+            await load_rollups()
+            stats_container.controls.append(rollup_section)
+
+    # 進階統計 (含縮減後的權益曲線) 以資料版本 + 篩選條件為 key 快取，交易沒變就不重算
+    stats_cache = {"key": None, "advanced": None}
+
+    async def get_cached_advanced_stats(filters):
+        key = (tuple(await db.get_trades_version()), tuple(sorted(filters.items())))
+        if stats_cache["key"] != key:
+            stats_cache["advanced"] = await db.get_advanced_stats(max_points=EQUITY_CHART_POINTS, **filters)
+            stats_cache["key"] = key
+        return stats_cache["advanced"]
+
+    def build_equity_chart(xs, ys):
+        if not ys: return []
+        lo, hi = min(min(ys), 0.0), max(max(ys), 0.0)
+        pad = (hi - lo) * 0.05 or 1.0
+        chart = ft.LineChart(
+            data_series=[ft.LineChartData(
+                data_points=[ft.LineChartDataPoint(x + 1, round(y, 2)) for x, y in zip(xs, ys)],
+                color="blue", stroke_width=2, below_line_bgcolor="blue50",
+            )],
+            min_x=1, max_x=xs[-1] + 1, min_y=lo - pad, max_y=hi + pad, baseline_y=0,
+            left_axis=ft.ChartAxis(labels_size=50),
+            bottom_axis=ft.ChartAxis(labels_size=30, labels_interval=max((xs[-1] + 1) // 4, 1)),
+            horizontal_grid_lines=ft.ChartGridLines(color="grey200", width=1),
+            tooltip_bgcolor="white", height=240, expand=True,
+        )
+        return [
+            ft.Divider(),
+            ft.Text("權益曲線", size=20, weight="bold", text_align="center"),
+            ft.Container(content=chart, padding=ft.padding.only(right=20, top=10)),
+        ]
+
+    def fmt_ratio(value):
+        return "—" if value is None else f"{value:.2f}"
+
+    def build_advanced_stats(a):
+        rows = [
+            ("獲利因子", fmt_ratio(a['profit_factor']), "blue", "總獲利 ÷ 總虧損，大於 1 代表整體賺錢"),
+            ("期望值", f"${a['expectancy']:.2f}", "green" if a['expectancy']>=0 else "red", "平均每筆交易的損益"),
+            ("最大回撤", f"${a['max_drawdown']:.2f}", "red", "權益曲線從高點回落的最大金額"),
+            ("回撤持續", f"{a['max_drawdown_duration']} 筆", "red", "最大回撤從前高到重新創高 (或至今) 經過的交易筆數"),
+            ("平均獲利", f"${a['avg_win']:.2f}", "green", "獲利單的平均損益"),
+            ("平均虧損", f"${a['avg_loss']:.2f}", "red", "虧損單的平均損益"),
+            ("Sharpe", fmt_ratio(a['sharpe']), "blue", "每筆平均損益 ÷ 損益標準差 (未年化)"),
+            ("Sortino", fmt_ratio(a['sortino']), "blue", "每筆平均損益 ÷ 下檔標準差 (未年化)"),
+            ("最長連勝", f"{a['max_win_streak']} 筆", "green", "連續獲利的最多筆數"),
+            ("最長連敗", f"{a['max_loss_streak']} 筆", "red", "連續虧損的最多筆數"),
+        ]
+        cards = [create_stat_card(*r) for r in rows]
+        pair_table = ft.DataTable(
+            columns=[ft.DataColumn(ft.Text("商品")), ft.DataColumn(ft.Text("筆數"), numeric=True), ft.DataColumn(ft.Text("勝率"), numeric=True), ft.DataColumn(ft.Text("淨利"), numeric=True)],
+            rows=[
+                ft.DataRow(cells=[ft.DataCell(ft.Text(pair)), ft.DataCell(ft.Text(str(p['count']))), ft.DataCell(ft.Text(f"{p['win_rate']:.1f}%")), ft.DataCell(ft.Text(f"${p['net']:.2f}", color="green" if p['net']>=0 else "red"))])
+                for pair, p in sorted(a['per_pair'].items(), key=lambda kv: -kv[1]['net'])
+            ],
+            column_spacing=20,
+        )
+        return [
+            ft.Divider(),
+            ft.Text("進階統計", size=20, weight="bold", text_align="center"),
+            *[ft.Row(cards[i:i+2], alignment="center") for i in range(0, len(cards), 2)],
+            ft.Text("商品明細", size=16, weight="bold"),
+            ft.Row([pair_table], scroll="auto"),
+        ]
+
+    # --- 損益日曆 / 時段表現 (讀 trade_rollups 彙總表) ---
+    rollup_state = {"period": "day", "month": date.today().replace(day=1), "pair": None}
+    rollup_calendar = ft.Column(spacing=4)
+    rollup_tables = ft.Column(spacing=10)
+    lbl_rollup_title = ft.Text("", size=16, weight="bold")
+
+    def heat_color(net, max_abs):
+        if not net or not max_abs: return "grey100"
+        shades = HEATMAP_GREENS if net > 0 else HEATMAP_REDS
+        return shades[min(int(abs(net) / max_abs * len(shades)), len(shades) - 1)]
+
+    def heat_cell(label, r, max_abs, width=44):
+        net = r['net'] if r else 0.0
+        return ft.Container(
+            content=ft.Column([
+                ft.Text(label, size=10, color="grey700"),
+                ft.Text(f"{net:+.0f}" if r else "", size=10, weight="bold"),
+            ], spacing=0, horizontal_alignment="center"),
+            width=width, height=40, bgcolor=heat_color(net, max_abs), border_radius=4, alignment=ft.alignment.center,
+            tooltip=f"{label}: {r['count']} 筆 / 勝率 {r['win_rate']:.0f}% / ${net:.2f}" if r else None,
+        )
+
+    def build_month_calendar(month, buckets):
+        by_day = {r['bucket']: r for r in buckets}
+        max_abs = max((abs(r['net']) for r in buckets), default=0.0)
+        rows = [ft.Row([ft.Container(ft.Text(n, size=10, color="grey"), width=44, alignment=ft.alignment.center) for n in WEEKDAY_NAMES[1:] + WEEKDAY_NAMES[:1]], spacing=4)]
+        for week in calendar.monthcalendar(month.year, month.month):
+            rows.append(ft.Row([
+                heat_cell(str(d), by_day.get(month.replace(day=d).isoformat()), max_abs) if d else ft.Container(width=44, height=40)
+                for d in week
+            ], spacing=4))
+        return rows
+
+    def build_bucket_strip(buckets, fmt):
+        max_abs = max((abs(r['net']) for r in buckets), default=0.0)
+        return [ft.Row([heat_cell(fmt(r['bucket']), r, max_abs, width=70) for r in buckets], spacing=4, wrap=True)]
+
+    def build_rollup_table(title, label_of, buckets):
+        return ft.Column([
+            ft.Text(title, size=16, weight="bold"),
+            ft.Row([ft.DataTable(
+                columns=[ft.DataColumn(ft.Text("")), ft.DataColumn(ft.Text("筆數"), numeric=True), ft.DataColumn(ft.Text("勝率"), numeric=True), ft.DataColumn(ft.Text("淨利"), numeric=True), ft.DataColumn(ft.Text("期望值"), numeric=True)],
+                rows=[
+                    ft.DataRow(cells=[ft.DataCell(ft.Text(label_of(r['bucket']))), ft.DataCell(ft.Text(str(r['count']))), ft.DataCell(ft.Text(f"{r['win_rate']:.1f}%")),
+                                      ft.DataCell(ft.Text(f"${r['net']:.2f}", color="green" if r['net'] >= 0 else "red")), ft.DataCell(ft.Text(f"${r['expectancy']:.2f}"))])
+                    for r in buckets
+                ],
+                column_spacing=20, data_row_min_height=32, data_row_max_height=32,
+            )], scroll="auto"),
         ])
+
+    @profiling.profiled
+    async def load_rollups():
+        period, month, pair = rollup_state["period"], rollup_state["month"], rollup_state["pair"]
+        btn_rollup_prev.visible = btn_rollup_next.visible = period == "day"
+        if period == "day":
+            last_day = calendar.monthrange(month.year, month.month)[1]
+            buckets = await db.get_rollups("day", month.isoformat(), month.replace(day=last_day).isoformat(), pair)
+            lbl_rollup_title.value = month.strftime("%Y-%m")
+            rollup_calendar.controls = build_month_calendar(month, buckets)
+        else:
+            buckets = (await db.get_rollups(period, None, None, pair))[-ROLLUP_RECENT_BUCKETS:]
+            lbl_rollup_title.value = f"最近 {ROLLUP_RECENT_BUCKETS} {'週' if period == 'week' else '個月'}"
+            rollup_calendar.controls = build_bucket_strip(buckets, (lambda b: b[5:]) if period == "week" else (lambda b: b))
+        hours = await db.get_rollups("hour", None, None, pair)
+        weekdays = sorted(await db.get_rollups("weekday", None, None, pair), key=lambda r: (int(r['bucket']) + 6) % 7)
+        rollup_tables.controls = [
+            build_rollup_table("各時段表現", lambda b: f"{b}:00", hours),
+            build_rollup_table("星期表現", lambda b: WEEKDAY_NAMES[int(b)], weekdays),
+        ]
+
+    async def on_rollup_period_change(e):
+        rollup_state["period"] = seg_rollup_period.value
+        await load_rollups()
+        page.update()
+
+    async def shift_rollup_month(e):
+        month = rollup_state["month"]
+        month = month + timedelta(days=32) if e.control.data > 0 else month - timedelta(days=1)
+        rollup_state["month"] = month.replace(day=1)
+        await load_rollups()
         page.update()
 
+    seg_rollup_period = ft.Dropdown(
+        value="day", width=120, dense=True, on_change=on_rollup_period_change,
+        options=[ft.dropdown.Option("day", "日"), ft.dropdown.Option("week", "週"), ft.dropdown.Option("month", "月")],
+    )
+    btn_rollup_prev = ft.IconButton(icon="chevron_left", data=-1, on_click=shift_rollup_month)
+    btn_rollup_next = ft.IconButton(icon="chevron_right", data=1, on_click=shift_rollup_month)
+    rollup_section = ft.Column([
+        ft.Divider(),
+        ft.Text("損益日曆", size=20, weight="bold", text_align="center"),
+        ft.Row([seg_rollup_period, btn_rollup_prev, lbl_rollup_title, btn_rollup_next]),
+        ft.Row([rollup_calendar], scroll="auto"),
+        rollup_tables,
+    ], spacing=10)
+
+    async def on_stats_filtered_change(e):
+        await load_stats_data()
+        page.update()
+
+    chk_stats_filtered = ft.Checkbox(label="只統計紀錄頁的篩選結果", value=False, on_change=on_stats_filtered_change)
+
     tab_stats = ft.Container(content=stats_container, padding=20)
 
     # --- Tab 4: 設定 ---
@@ -485,69 +2267,449 @@ def main(page: ft.Page):
     txt_gold = ft.TextField(label="黃金合約")
     txt_crypto = ft.TextField(label="加密貨幣合約")
 
-    def save_set_click(e):
+    async def save_set_click(e):
         try:
-            db.update_settings(float(txt_forex.value), float(txt_gold.value), float(txt_crypto.value))
+            await db.update_settings(float(txt_forex.value), float(txt_gold.value), float(txt_crypto.value))
             show_msg("已更新")
         except:
             show_msg("錯誤", "red")
 
-    def export_csv_click(e):
+    # --- 商品表 (每個商品的合約大小 / 最小跳動 / 報價幣別) ---
+    txt_inst_symbol = ft.TextField(label="商品代號", expand=True)
+    txt_inst_contract = ft.TextField(label="合約大小 (空白沿用上方分類)", expand=True, keyboard_type="number")
+    txt_inst_pip = ft.TextField(label="最小跳動", expand=True, keyboard_type="number")
+    txt_inst_quote = ft.TextField(label="報價幣別", expand=True)
+    col_instruments = ft.Column(spacing=2)
+
+    async def load_instruments_list():
+        col_instruments.controls = [
+            ft.Text(f"{i['symbol']}: 合約 {i['contract_size'] if i['contract_size'] is not None else '(分類預設)'} / 跳動 {i['pip_size']} / {i['quote_currency']}", size=12, color="grey")
+            for i in await db.get_instruments()
+        ]
+
+    async def save_instrument_click(e):
+        try:
+            symbol = txt_inst_symbol.value.upper().strip() if txt_inst_symbol.value else ""
+            if not symbol: return show_msg("請輸入商品代號", "red")
+            contract = float(txt_inst_contract.value) if txt_inst_contract.value and txt_inst_contract.value.strip() else None
+            pip = float(txt_inst_pip.value) if txt_inst_pip.value and txt_inst_pip.value.strip() else None
+            quote = txt_inst_quote.value.upper().strip() if txt_inst_quote.value and txt_inst_quote.value.strip() else "USD"
+            check_quote(symbol, quote)
+            await db.upsert_instrument(symbol, contract, pip, quote)
+            await load_instruments_list()
+            show_msg("已更新商品")
+        except ValueError as ex:
+            show_msg(str(ex) if str(ex).startswith("非美元") else "錯誤", "red")
+        except:
+            show_msg("錯誤", "red")
+
+    # --- 匯出 CSV (讀取執行緒 + 進度 + 取消) ---
+    txt_export_pair = ft.TextField(label="商品 (空白為全部)", expand=True)
+    txt_export_from = ft.TextField(label="起始日 YYYY-MM-DD", expand=True)
+    txt_export_to = ft.TextField(label="結束日 YYYY-MM-DD", expand=True)
+    chk_export_gzip = ft.Checkbox(label="gzip 壓縮 (.csv.gz)", value=False)
+    pb_export = ft.ProgressBar(visible=False)
+    lbl_export = ft.Text("", size=12, color="grey")
+    export_cancel = threading.Event()
+
+    def get_export_dir():
+        # 舊版 Flet 的 Page 沒有 platform_directory，退回資料庫所在的工作目錄
+        platform_dir = getattr(page, "platform_directory", None)
+        return platform_dir.files if platform_dir else os.getcwd()
+
+    async def run_export(path, start_ts, end_ts, pair, compress, total):
+        last_update = [0.0]
+
+        def on_progress(count):
+            # 在讀取執行緒中呼叫；page.update() 本身有鎖保護
+            now = time.monotonic()
+            if now - last_update[0] >= 0.2:
+                last_update[0] = now
+                pb_export.value = count / total
+                lbl_export.value = f"匯出中... {count} / {total}"
+                page.update()
+
         try:
-            trades = db.get_all_trades()
-            if not trades: return show_msg("沒資料", "red")
-            
-            show_msg(f"匯出功能在 Android 上可能需要權限，請注意！", "orange")
-            
-            export_path = os.path.join(page.platform_directory.files, f"export_{datetime.now().strftime('%Y%m%d')}.csv")
-            
-            with open(export_path, 'w', newline='', encoding='utf-8-sig') as f:
-                w = csv.writer(f)
-                w.writerow(["ID", "Pair", "Dir", "Lots", "Entry", "Exit", "PnL", "Time", "Note"])
-                for t in trades:
-                    w.writerow([t['id'], t['pair'], t['direction'], t['lots'], t['entry_price'], t['exit_price'], t['pnl_usd'], t['entry_time'], t['note']])
-            
-            show_msg(f"匯出檔案已建立，但可能無法直接存取。", "orange")
-            
+            written = await db.export_csv(path, start_ts, end_ts, pair, compress, on_progress, export_cancel)
+            if written is None:
+                msg, color = "已取消匯出", "orange"
+            else:
+                msg, color = f"已匯出 {written} 筆: {path}", "green"
+        except Exception as ex:
+            msg, color = f"匯出失敗: {ex}", "red"
+        pb_export.visible = False
+        lbl_export.value = ""
+        btn_export.disabled = False
+        btn_export_cancel.visible = False
+        show_msg(msg, color)
+
+    @profiling.profiled
+    async def export_csv_click(e):
+        try:
+            pair = txt_export_pair.value.upper().strip() if txt_export_pair.value else None
+            start_ts = parse_day(txt_export_from.value)
+            end_ts = parse_day(txt_export_to.value, end_of_day=True)
+        except ValueError:
+            return show_msg("日期格式錯誤 (YYYY-MM-DD)", "red")
+        total = await db.count_trades(start_ts, end_ts, pair)
+        if not total: return show_msg("沒資料", "red")
+
+        compress = bool(chk_export_gzip.value)
+        name = f"export_{datetime.now().strftime('%Y%m%d')}{'_' + pair if pair else ''}.csv{'.gz' if compress else ''}"
+        path = os.path.join(get_export_dir(), name)
+        export_cancel.clear()
+        pb_export.value = 0
+        pb_export.visible = True
+        btn_export.disabled = True
+        btn_export_cancel.visible = True
+        lbl_export.value = f"匯出中... 0 / {total}"
+        page.update()
+        await run_export(path, start_ts, end_ts, pair, compress, total)
+
+    def cancel_export_click(e):
+        export_cancel.set()
+
+    btn_export = ft.ElevatedButton("匯出 CSV", icon="download", on_click=export_csv_click, bgcolor="green", color="white")
+    btn_export_cancel = ft.TextButton("取消匯出", icon="close", on_click=cancel_export_click, visible=False)
+
+    # --- 匯入對帳單 (在 DB 寫入執行緒解析與寫入，不阻塞 UI) ---
+    pb_import = ft.ProgressBar(visible=False)
+    lbl_import = ft.Text("", size=12, color="grey")
+
+    async def run_import(path):
+        last_update = [0.0]
+
+        def on_progress(count):
+            # 最多每 0.2 秒推一次進度到前端
+            now = time.monotonic()
+            if now - last_update[0] >= 0.2:
+                last_update[0] = now
+                lbl_import.value = f"匯入中... 已處理 {count} 筆"
+                page.update()
+
+        try:
+            from importer import iter_statement
+            inserted, total = await db.import_trades(iter_statement(path), IMPORT_BATCH_SIZE, on_progress)
+            await invalidate(TAB_HISTORY, TAB_STATS)
+            msg, color = f"匯入完成: 新增 {inserted} 筆，重複略過 {total - inserted} 筆", "green"
+        except Exception as ex:
+            msg, color = f"匯入失敗: {ex}", "red"
+        pb_import.visible = False
+        lbl_import.value = ""
+        btn_import.disabled = False
+        show_msg(msg, color)
+
+    async def rebuild_summaries_click(e):
+        # 統計彙總與損益日曆整表重算 (校正浮點累積誤差，或外部改過資料庫之後)
+        await db.rebuild_trade_stats()
+        await db.rebuild_trade_rollups()
+        await invalidate(TAB_STATS)
+        show_msg("已重算統計彙總")
+
+    # --- 快照備份 / 還原 (讀取執行緒分段複製，不擋 UI 也不擋寫入) ---
+    txt_backup_keep = ft.TextField(label="保留份數", expand=True, keyboard_type="number")
+    txt_backup_interval = ft.TextField(label="自動備份間隔 (小時，0 為關閉)", expand=True, keyboard_type="number")
+    pb_backup = ft.ProgressBar(visible=False)
+    lbl_backup = ft.Text("", size=12, color="grey")
+    col_backups = ft.Column(spacing=2)
+    backup_cancel = threading.Event()
+    backup_state = {"running": False, "keep": BACKUP_KEEP, "interval": BACKUP_INTERVAL_HOURS, "restore_path": None, "task": None}
+
+    async def load_backups_list():
+        col_backups.controls = [
+            ft.Row([
+                ft.Text(f"{b['time']:%Y-%m-%d %H:%M:%S}  ({b['size'] / 1048576:.1f} MB)", size=12, color="grey", expand=True),
+                ft.IconButton("restore", tooltip="還原這份快照", data=b['path'], on_click=open_restore_click),
+            ])
+            for b in await db.list_backups()
+        ] or [ft.Text("尚無快照", size=12, color="grey")]
+
+    async def run_backup(show_progress=True):
+        # 手動與自動備份共用；同時只跑一份
+        if backup_state["running"]: return None
+        backup_state["running"] = True
+        last_update = [0.0]
+
+        def on_progress(done, total):
+            now = time.monotonic()
+            if show_progress and now - last_update[0] >= 0.2:
+                last_update[0] = now
+                pb_backup.value = done / total if total else None
+                lbl_backup.value = f"備份中... {done} / {total} 頁"
+                page.update()
+
+        backup_cancel.clear()
+        try:
+            return await db.create_backup(backup_state["keep"], on_progress, backup_cancel)
+        finally:
+            backup_state["running"] = False
+
+    async def backup_now_click(e):
+        if backup_state["running"]: return show_msg("備份進行中", "orange")
+        pb_backup.value = 0
+        pb_backup.visible = True
+        btn_backup.disabled = True
+        btn_backup_cancel.visible = True
+        lbl_backup.value = "備份中..."
+        page.update()
+        try:
+            path = await run_backup()
+            msg, color = ("已取消備份", "orange") if path is None else (f"已備份: {path}", "green")
+        except Exception as ex:
+            msg, color = f"備份失敗: {ex}", "red"
+        pb_backup.visible = False
+        lbl_backup.value = ""
+        btn_backup.disabled = False
+        btn_backup_cancel.visible = False
+        await load_backups_list()
+        show_msg(msg, color)
+
+    def cancel_backup_click(e):
+        backup_cancel.set()
+
+    async def save_backup_policy_click(e):
+        try:
+            keep = int(txt_backup_keep.value)
+            interval = float(txt_backup_interval.value)
+            if keep < 1 or interval < 0: raise ValueError
+        except (TypeError, ValueError):
+            return show_msg("保留份數至少 1，間隔不可為負", "red")
+        await db.set_backup_policy(keep, interval)
+        backup_state["keep"], backup_state["interval"] = keep, interval
+        show_msg("已更新備份設定")
+
+    def open_restore_click(e):
+        backup_state["restore_path"] = e.control.data
+        dlg_restore.content = ft.Text(f"以這份快照覆蓋目前的資料？\n{os.path.basename(e.control.data)}\n(還原前會先自動備份目前的資料)")
+        dlg_restore.open = True
+        page.update()
+
+    def close_restore_dlg(e):
+        dlg_restore.open = False
+        page.update()
+
+    async def confirm_restore_click(e):
+        dlg_restore.open = False
+        page.update()
+        if backup_state["running"]: return show_msg("備份進行中，請稍後再還原", "orange")
+        backup_state["running"] = True
+        try:
+            await db.restore_backup(backup_state["restore_path"], backup_state["keep"])
         except Exception as ex:
-            show_msg(f"匯出失敗: {ex}", "red")
+            return show_msg(f"還原失敗: {ex}", "red")
+        finally:
+            backup_state["running"] = False
+        # 所有分頁與快取都屬於還原前的資料
+        stats_cache["key"] = None
+        dirty_tabs.update(tab_loaders)
+        await rebuild_if_dirty(t.selected_index)
+        await load_backups_list()
+        show_msg("已還原快照")
 
-    def load_settings_data():
-        s = db.get_settings()
+    dlg_restore = ft.AlertDialog(
+        title=ft.Text("還原快照"),
+        actions=[
+            ft.TextButton("取消", on_click=close_restore_dlg),
+            ft.ElevatedButton("還原", on_click=confirm_restore_click, bgcolor="red", color="white"),
+        ],
+    )
+    page.overlay.append(dlg_restore)
+
+    async def auto_backup_loop():
+        # 自動備份排程：定期檢查目前帳戶的最新快照是否已超過間隔 (且之後有寫入)
+        while True:
+            await asyncio.sleep(BACKUP_CHECK_SEC)
+            try:
+                if not backup_state["running"] and await db.backup_due(backup_state["interval"]):
+                    if await run_backup(show_progress=False) and t.selected_index == TAB_SETTINGS:
+                        await load_backups_list()
+                        page.update()
+            except Exception as ex:
+                show_msg(f"自動備份失敗: {ex}", "red")
+
+    btn_backup = ft.ElevatedButton("立即備份", icon="backup", on_click=backup_now_click)
+    btn_backup_cancel = ft.TextButton("取消備份", icon="close", on_click=cancel_backup_click, visible=False)
+
+    async def on_import_picked(e):
+        if not e.files: return
+        path = e.files[0].path
+        if not path: return show_msg("無法取得檔案路徑", "red")
+        pb_import.visible = True
+        lbl_import.value = "匯入中..."
+        btn_import.disabled = True
+        page.update()
+        await run_import(path)
+
+    import_picker = ft.FilePicker(on_result=on_import_picked)
+    page.overlay.append(import_picker)
+    btn_import = ft.ElevatedButton("匯入對帳單 (CSV / MT4 / MT5)", icon="upload_file", on_click=lambda e: import_picker.pick_files(allowed_extensions=["csv", "htm", "html"]))
+
+    async def load_settings_data():
+        s = await db.get_settings()
         txt_forex.value = str(s['forex'])
         txt_gold.value = str(s['gold'])
         txt_crypto.value = str(s['crypto'])
-        lbl_thumbs.value = str(s['thumbs'])
+        dd_lot_matching.value = s['lot_matching']
+        backup_state["keep"], backup_state["interval"] = s['backup_keep'], s['backup_interval']
+        txt_backup_keep.value = str(s['backup_keep'])
+        txt_backup_interval.value = f"{s['backup_interval']:g}"
+        await load_instruments_list()
+        await load_backups_list()
+        if panel_diagnostics.visible:
+            refresh_diagnostics()
+
+    async def on_lot_matching_change(e):
+        await db.set_lot_matching(dd_lot_matching.value)
+        show_msg("已更新部位配對方式")
+
+    dd_lot_matching = ft.Dropdown(
+        label="部位平倉配對", on_change=on_lot_matching_change,
+        options=[ft.dropdown.Option(positions.MATCH_FIFO, "先進先出 (FIFO)"), ft.dropdown.Option(positions.MATCH_AVERAGE, "平均成本")],
+    )
+
+    # --- 診斷面板 (效能紀錄)：長按「合約設定」標題才顯示；以 JOURNAL_PROFILE=1 啟動時直接顯示 ---
+    col_diagnostics = ft.Column(spacing=10)
+
+    def diagnostics_table(first_column, group, last_column, last_value):
+        return ft.Row([ft.DataTable(
+            columns=[ft.DataColumn(ft.Text(first_column))] + [
+                ft.DataColumn(ft.Text(label), numeric=True) for label in ("次數", "p50 ms", "p95 ms", "p99 ms", "最大 ms", last_column)],
+            rows=[ft.DataRow(cells=[ft.DataCell(ft.Text(name, size=12))] + [
+                ft.DataCell(ft.Text(v, size=12)) for v in (
+                    str(r['count']), f"{r['p50_ms']:.1f}", f"{r['p95_ms']:.1f}", f"{r['p99_ms']:.1f}", f"{r['max_ms']:.1f}", last_value(r))])
+                for name, r in group.items()],
+            column_spacing=16,
+        )], scroll="auto")
+
+    def refresh_diagnostics(e=None):
+        snap = profiling.snapshot()
+        col_diagnostics.controls = [
+            diagnostics_table("Handler", snap["handler"], "更新/指令", lambda r: f"{r['updates']}/{r['commands']}"),
+            diagnostics_table("查詢", snap["query"], "筆數", lambda r: str(r['rows'])),
+        ] if snap["handler"] or snap["query"] else [ft.Text("尚無紀錄", size=12, color="grey")]
+        if e is not None: page.update()
+
+    def toggle_profiling(e):
+        profiling.set_enabled(sw_profiling.value)
+        show_msg("已開啟效能紀錄" if profiling.enabled else "已關閉效能紀錄")
+
+    def reset_diagnostics_click(e):
+        profiling.reset()
+        refresh_diagnostics(e)
+
+    def dump_diagnostics_click(e):
+        path = os.path.join(get_export_dir(), f"diagnostics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        try:
+            profiling.dump(path)
+            show_msg(f"已輸出: {path}")
+        except OSError as ex:
+            show_msg(f"輸出失敗: {ex}", "red")
+
+    def reveal_diagnostics(e):
+        panel_diagnostics.visible = True
+        refresh_diagnostics(e)
+
+    sw_profiling = ft.Switch(label="啟用效能紀錄", value=profiling.enabled, on_change=toggle_profiling)
+    panel_diagnostics = ft.Column([
+        ft.Divider(),
+        ft.Text("診斷", size=20, weight="bold"),
+        sw_profiling,
+        ft.Row([
+            ft.OutlinedButton("重新整理", icon="refresh", on_click=refresh_diagnostics),
+            ft.OutlinedButton("清除", icon="delete_sweep", on_click=reset_diagnostics_click),
+            ft.OutlinedButton("輸出 JSON", icon="save_alt", on_click=dump_diagnostics_click),
+        ], wrap=True),
+        col_diagnostics,
+    ], spacing=10, visible=profiling.enabled)
 
     tab_settings = ft.Container(
         content=ft.Column([
-            ft.Text("合約設定", size=20, weight="bold"),
+            ft.GestureDetector(content=ft.Text("合約設定", size=20, weight="bold"), on_long_press_start=reveal_diagnostics),
             txt_forex, txt_gold, txt_crypto,
             ft.ElevatedButton("更新設定", on_click=save_set_click),
+            dd_lot_matching,
+            ft.Text("商品表", size=16, weight="bold"),
+            col_instruments,
+            ft.Row([txt_inst_symbol, txt_inst_contract]),
+            ft.Row([txt_inst_pip, txt_inst_quote]),
+            ft.ElevatedButton("保存商品", on_click=save_instrument_click),
             ft.Divider(),
             ft.Text("資料管理", size=20, weight="bold"),
-            ft.ElevatedButton("匯出 CSV", icon="download", on_click=export_csv_click, bgcolor="green", color="white")
+            txt_export_pair,
+            ft.Row([txt_export_from, txt_export_to]),
+            chk_export_gzip,
+            ft.Row([btn_export, btn_export_cancel]),
+            pb_export, lbl_export,
+            btn_import, pb_import, lbl_import,
+            ft.OutlinedButton("重算統計彙總", icon="refresh", on_click=rebuild_summaries_click),
+            ft.Text("快照備份", size=16, weight="bold"),
+            ft.Row([txt_backup_keep, txt_backup_interval]),
+            ft.ElevatedButton("更新備份設定", on_click=save_backup_policy_click),
+            ft.Row([btn_backup, btn_backup_cancel]),
+            pb_backup, lbl_backup,
+            col_backups,
+            panel_diagnostics,
         ], spacing=20, scroll="auto"),
         padding=20
     )
 
-    def refresh_all_data():
-        load_history_data()
-        load_stats_data()
-        load_settings_data()
+    # --- 分頁失效追蹤 ---
+    # 每個動作只把受影響的分頁標記為 dirty，切到該分頁時才重建；
+    # 畫面變更由各 handler 最後一次 page.update() (通常是 show_msg) 送出。
+    tab_loaders = {TAB_ENTRY: load_positions, TAB_HISTORY: load_history_data, TAB_STATS: load_stats_data, TAB_SETTINGS: load_settings_data}
+    dirty_tabs = set(tab_loaders)
+
+    async def rebuild_if_dirty(index):
+        if index in dirty_tabs:
+            dirty_tabs.discard(index)
+            await tab_loaders[index]()
+
+    async def invalidate(*indexes):
+        dirty_tabs.update(indexes)
+        await rebuild_if_dirty(t.selected_index)
+
+    # 紀錄/統計/設定的控制項第一次切到該分頁時才掛上 Tabs，第一個畫面只送輸入頁
+    tab_contents = {TAB_HISTORY: tab_history, TAB_STATS: tab_stats, TAB_SETTINGS: tab_settings}
+
+    def attach_tab(index):
+        tab = t.tabs[index]
+        if tab.content is None and index in tab_contents:
+            tab.content = tab_contents.pop(index)
+
+    @profiling.profiled
+    async def on_tab_change(e):
+        attach_tab(t.selected_index)
+        await rebuild_if_dirty(t.selected_index)
+        page.update()
 
     t = ft.Tabs(
         selected_index=0,
+        on_change=on_tab_change,
         tabs=[
             ft.Tab(text="輸入", icon="edit", content=tab_entry),
-            ft.Tab(text="紀錄", icon="list", content=lv_history),
-            ft.Tab(text="統計", icon="analytics", content=tab_stats),
-            ft.Tab(text="設定", icon="settings", content=tab_settings),
+            ft.Tab(text="紀錄", icon="list"),
+            ft.Tab(text="統計", icon="analytics"),
+            ft.Tab(text="設定", icon="settings"),
         ], expand=True
     )
 
+    def on_page_close(e):
+        # 工作階段結束時停掉自動備份排程
+        if backup_state["task"]:
+            backup_state["task"].cancel()
+
+    page.on_close = on_page_close
+    profiling.instrument_page(page)
     page.clean()
     page.add(t)
+    # 先畫出輸入頁，再到寫入執行緒開資料庫 (版本已是最新時只讀一次 user_version)
+    await db.open()
+    if not db.error_msg:
+        await rebuild_if_dirty(t.selected_index)
+        # 備份設定在切到設定頁前就要有，排程才知道間隔
+        s = await db.get_settings()
+        backup_state["keep"], backup_state["interval"] = s['backup_keep'], s['backup_interval']
+        backup_state["task"] = asyncio.create_task(auto_backup_loop())
     
     # 【修正】如果資料庫有錯誤，用修復過的語法來顯示警告視窗
     if db.error_msg:
@@ -559,7 +2721,6 @@ def main(page: ft.Page):
         )
         page.dialog.open = True
     
-    refresh_all_data()
     page.update()
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+from collections import deque
+
+# =========================================================================
+# 部位與成交配對 (FIFO / 平均成本)
+# 每個商品一本 PositionBook，未平倉的每一筆進場是一個 Lot，依進場順序放在 deque：
+# 加碼 append、平倉從最舊的一筆 popleft，每個被配對掉的 Lot 都是 O(1)。
+# 平倉產生的「來回交易」交給 DBManager 寫進 trades，損益由 App 的合約規則計算。
+# track=True 時記下每筆成交動到的 Lot，DBManager 只把這些寫回 position_lots。
+# =========================================================================
+
+MATCH_FIFO, MATCH_AVERAGE = "fifo", "avg"
+# 手數一律四捨五入到 8 位小數，避免 0.1 + 0.2 之類的浮點誤差留下極小的殘餘部位
+EPSILON = 1e-9
+
+
+class Lot:
+    """一筆尚未平倉的進場；lots 會隨部分平倉減少，配對完為 0。row_id 是 position_lots 的 id (尚未寫入為 None)。"""
+    __slots__ = ('lots', 'price', 'ts', 'fill_id', 'row_id')
+
+    def __init__(self, lots, price, ts, fill_id=None, row_id=None):
+        self.lots = lots
+        self.price = price
+        self.ts = ts
+        self.fill_id = fill_id
+        self.row_id = row_id
+
+
+class PositionBook:
+    """單一商品的淨部位：direction 為 'BUY' (多) / 'SELL' (空) / None (無部位)。"""
+    __slots__ = ('direction', 'lots', 'size', 'changes')
+
+    def __init__(self, direction=None, lots=(), track=False):
+        self.direction = direction if lots else None
+        self.lots = deque(lots)
+        self.size = round(sum(lot.lots for lot in self.lots), 8)
+        # 上次 take_changes() 之後新增、修改或配對完 (lots 為 0) 的 Lot；不追蹤時為 None
+        self.changes = [] if track else None
+
+    def touch(self, lot):
+        if self.changes is not None:
+            self.changes.append(lot)
+
+    def take_changes(self):
+        changes, self.changes = self.changes, []
+        return changes
+
+    def average_price(self):
+        return sum(lot.lots * lot.price for lot in self.lots) / self.size if self.size > EPSILON else 0.0
+
+    def open(self, direction, qty, price, ts, fill_id, method):
+        if method == MATCH_AVERAGE and self.lots:
+            # 平均成本：合併成單一筆，進場時間沿用最早的一筆
+            lot = self.lots[0]
+            lot.price = (lot.price * lot.lots + price * qty) / (lot.lots + qty)
+            lot.lots = round(lot.lots + qty, 8)
+        else:
+            lot = Lot(qty, price, ts, fill_id)
+            self.lots.append(lot)
+        self.touch(lot)
+        self.direction = direction
+        self.size = round(self.size + qty, 8)
+
+    def fill(self, side, qty, price, ts, fill_id=None, method=MATCH_FIFO):
+        """套用一筆成交，回傳平倉產生的來回交易 list。
+
+        每筆來回交易是 dict：direction (原部位方向)、lots、entry_price、exit_price、entry_ts、exit_ts。
+        反向成交大於現有部位時，先全部平倉，剩下的手數反手開新部位。
+        """
+        if method == MATCH_AVERAGE and len(self.lots) > 1:
+            # 從 FIFO 切到平均成本時，先把現有的多筆合併
+            merged = Lot(self.size, self.average_price(), self.lots[0].ts, self.lots[0].fill_id)
+            for lot in self.lots:
+                lot.lots = 0.0
+                self.touch(lot)
+            self.lots = deque([merged])
+            self.touch(merged)
+        if self.direction is None or side == self.direction:
+            self.open(side, qty, price, ts, fill_id, method)
+            return []
+        trips = []
+        remaining = qty
+        while remaining > EPSILON and self.lots:
+            lot = self.lots[0]
+            matched = min(lot.lots, remaining)
+            trips.append({
+                'direction': self.direction, 'lots': round(matched, 8), 'entry_price': lot.price,
+                'exit_price': price, 'entry_ts': lot.ts, 'exit_ts': ts,
+            })
+            lot.lots = round(lot.lots - matched, 8)
+            remaining = round(remaining - matched, 8)
+            self.size = round(self.size - matched, 8)
+            if lot.lots <= EPSILON:
+                self.lots.popleft()
+            self.touch(lot)
+        if not self.lots:
+            self.direction = None
+            self.size = 0.0
+        if remaining > EPSILON:
+            self.open(side, remaining, price, ts, fill_id, method)
+        return trips
@@ -0,0 +1,183 @@
+import asyncio
+import contextvars
+import functools
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+# =========================================================================
+# 效能紀錄 (診斷用)
+# handler 與 DBManager 方法的延遲直方圖、回傳筆數，以及每個 handler 送出幾次 page.update()
+# / 幾個 Flet 指令。預設關閉：關閉時每次呼叫只多一次布林判斷。
+# 以環境變數 JOURNAL_PROFILE=1 啟動即開啟，或在設定頁的診斷面板切換。
+# =========================================================================
+
+enabled = os.environ.get("JOURNAL_PROFILE") == "1"
+# 直方圖以 2 為底的對數分桶，每倍 4 桶 (相鄰桶約差 19%)，從 1 微秒起算
+BUCKETS_PER_OCTAVE = 4
+QUANTILES = (50, 95, 99)
+# 不在任何 handler 內的 page.update() (例如讀取執行緒的進度回報) 記在這個名稱下
+OTHER = "(其他)"
+
+current_handler = contextvars.ContextVar("current_handler", default=None)
+lock = threading.Lock()
+
+
+class Histogram:
+    """延遲直方圖：只存各桶計數，記一筆 O(1)，分位數誤差在一桶 (約 19%) 以內。"""
+    __slots__ = ('count', 'total', 'max', 'rows', 'buckets', 'updates', 'commands')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.buckets = {}
+        self.updates = 0
+        self.commands = 0
+
+    def add(self, seconds, rows=None):
+        us = seconds * 1e6
+        index = int(math.log2(us) * BUCKETS_PER_OCTAVE) if us > 1 else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max: self.max = seconds
+        if rows: self.rows += rows
+
+    def quantile(self, q):
+        # 回傳第 q 百分位所在桶的上界 (秒)，不超過實際最大值
+        if not self.count: return 0.0
+        target = self.count * q / 100
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(2 ** ((index + 1) / BUCKETS_PER_OCTAVE) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        s = {"count": self.count, "mean_ms": self.total / self.count * 1000 if self.count else 0.0}
+        for q in QUANTILES:
+            s[f"p{q}_ms"] = self.quantile(q) * 1000
+        s["max_ms"] = self.max * 1000
+        s["rows"] = self.rows
+        s["updates"] = self.updates
+        s["commands"] = self.commands
+        return s
+
+
+# {'handler' / 'query': {名稱: Histogram}}
+stats = {"handler": {}, "query": {}}
+
+
+def set_enabled(on):
+    global enabled
+    enabled = bool(on)
+
+
+def reset():
+    with lock:
+        for group in stats.values():
+            group.clear()
+
+
+def histogram(kind, name):
+    group = stats[kind]
+    h = group.get(name)
+    if h is None:
+        h = group[name] = Histogram()
+    return h
+
+
+def record(kind, name, seconds, rows=None):
+    # DB 方法在讀取/寫入執行緒呼叫，handler 在事件迴圈呼叫，共用一把鎖
+    with lock:
+        histogram(kind, name).add(seconds, rows)
+
+
+def row_count(result):
+    # 回傳 list / tuple 的方法視為筆數；dict、數字等不計
+    return len(result) if isinstance(result, (list, tuple)) else None
+
+
+def count_update(commands):
+    with lock:
+        h = histogram("handler", current_handler.get() or OTHER)
+        h.updates += 1
+        h.commands += commands
+
+
+def profiled(fn):
+    """包裝 Flet handler (同步或 async)，以函式名稱記錄延遲；期間的 page.update() 也歸到這個 handler。"""
+    name = fn.__name__
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not enabled:
+                return await fn(*args, **kwargs)
+            token = current_handler.set(name)
+            t0 = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                record("handler", name, time.perf_counter() - t0)
+                current_handler.reset(token)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            token = current_handler.set(name)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record("handler", name, time.perf_counter() - t0)
+                current_handler.reset(token)
+    return wrapper
+
+
+def call_timed(obj, name, *args, **kwargs):
+    # AsyncDBManager 的讀取/寫入執行緒經由這裡呼叫 DBManager 的方法
+    if not enabled:
+        return getattr(obj, name)(*args, **kwargs)
+    t0 = time.perf_counter()
+    result = getattr(obj, name)(*args, **kwargs)
+    record("query", name, time.perf_counter() - t0, row_count(result))
+    return result
+
+
+def instrument_page(page):
+    # page.update() / add() 最後都經過連線的 send_commands；包一層計算次數與指令數。
+    # 這是 Flet 的內部屬性，找不到時 (舊版或測試用的 Page) 就不記
+    conn = getattr(page, "_Page__conn", None)
+    if conn is None or getattr(conn, "profiling_wrapped", False) is True: return
+    send_commands = conn.send_commands
+
+    def counted_send_commands(session_id, commands):
+        if enabled:
+            count_update(len(commands))
+        return send_commands(session_id, commands)
+
+    conn.send_commands = counted_send_commands
+    conn.profiling_wrapped = True
+
+
+def snapshot():
+    with lock:
+        return {
+            "generated": datetime.now().isoformat(timespec="seconds"),
+            "enabled": enabled,
+            **{kind: {name: h.summary() for name, h in sorted(group.items())} for kind, group in stats.items()},
+        }
+
+
+def dump(path):
+    data = snapshot()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return data
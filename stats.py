@@ -0,0 +1,250 @@
+import math
+from array import array
+
+# numpy 為選用：有安裝時走向量化計算，沒有時 (例如 Android 打包) 退回單次迴圈
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# =========================================================================
+# 欄式統計引擎
+# 把 pnl_usd / lots / pair / entry_ts 各存成一個欄位陣列 (numpy 或 array.array)，
+# 一次載入後計算權益曲線、回撤、獲利因子、Sharpe/Sortino、連勝連敗與商品明細。
+# =========================================================================
+
+
+class TradeColumns:
+    """按時間排序的交易欄位；pair_ids 是 pairs 串列的索引。"""
+    __slots__ = ('pnl', 'lots', 'pair_ids', 'pairs', 'ts')
+
+    def __init__(self, pnl, lots, pair_ids, pairs, ts):
+        self.pnl = pnl
+        self.lots = lots
+        self.pair_ids = pair_ids
+        self.pairs = pairs
+        self.ts = ts
+
+    def __len__(self):
+        return len(self.pnl)
+
+
+def columns_from_rows(rows):
+    """rows 為 (pnl_usd, lots, pair, entry_ts) tuple 的序列 (例如 cursor.fetchall())。"""
+    if rows:
+        pnl, lots, pairs, ts = zip(*rows)
+    else:
+        pnl = lots = pairs = ts = ()
+    pair_index = {p: i for i, p in enumerate(dict.fromkeys(pairs))}
+    pair_ids = map(pair_index.__getitem__, pairs)
+    if np is not None:
+        return TradeColumns(
+            np.array(pnl, dtype=np.float64),
+            np.array(lots, dtype=np.float64),
+            np.fromiter(pair_ids, dtype=np.int32, count=len(pairs)),
+            list(pair_index),
+            np.array(ts, dtype=np.int64),
+        )
+    return TradeColumns(array('d', pnl), array('d', lots), array('I', pair_ids), list(pair_index), array('q', ts))
+
+
+def summary(count, wins, losses, gross_profit, gross_loss, net):
+    """由累計值推出比率類指標 (整體與各商品共用)。"""
+    return {
+        "count": count,
+        "wins": wins,
+        "losses": losses,
+        "gross_profit": gross_profit,
+        "gross_loss": gross_loss,
+        "net": net,
+        "win_rate": wins / count * 100 if count else 0.0,
+        "profit_factor": gross_profit / gross_loss if gross_loss else None,
+        "expectancy": net / count if count else 0.0,
+        "avg_win": gross_profit / wins if wins else 0.0,
+        "avg_loss": -gross_loss / losses if losses else 0.0,
+    }
+
+
+def compute_stats(cols):
+    """計算完整統計，回傳 dict。
+
+    回撤以起始資金 0 為基準，max_drawdown_duration 是最大回撤從前高到重新創高
+    (或至今) 的交易筆數；Sharpe / Sortino 以每筆交易損益計算，未年化。
+    """
+    if np is not None and isinstance(cols.pnl, np.ndarray):
+        return _compute_numpy(cols)
+    return _compute_python(cols)
+
+
+def _longest_run(mask):
+    # 布林陣列中最長連續 True 的長度
+    if not mask.any():
+        return 0
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return int((np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)).max())
+
+
+def _compute_numpy(cols):
+    pnl, pair_ids = cols.pnl, cols.pair_ids
+    count = len(pnl)
+    win_mask, loss_mask = pnl > 0, pnl < 0
+    wins_pnl, losses_pnl = pnl[win_mask], pnl[loss_mask]
+    result = summary(count, len(wins_pnl), len(losses_pnl), float(wins_pnl.sum()), float(-losses_pnl.sum()), float(pnl.sum()))
+
+    equity = np.cumsum(pnl)
+    curve = np.concatenate(([0.0], equity))
+    drawdowns = np.maximum.accumulate(curve) - curve
+    max_dd = float(drawdowns.max())
+    if max_dd > 0:
+        bottom = int(drawdowns.argmax())
+        start = int(np.flatnonzero(drawdowns[:bottom + 1] == 0)[-1])
+        recovered = np.flatnonzero(drawdowns[bottom:] == 0)
+        end = bottom + int(recovered[0]) if recovered.size else count
+        duration = end - start
+    else:
+        duration = 0
+    result["equity_curve"] = equity
+    result["max_drawdown"] = max_dd
+    result["max_drawdown_duration"] = duration
+    result["longest_underwater"] = _longest_run(drawdowns > 0)
+
+    mean = result["expectancy"]
+    std = float(pnl.std(ddof=1)) if count > 1 else 0.0
+    downside = math.sqrt(float(np.dot(losses_pnl, losses_pnl)) / count) if count else 0.0
+    result["sharpe"] = mean / std if count > 1 and std else None
+    result["sortino"] = mean / downside if count > 1 and downside else None
+    result["max_win_streak"] = _longest_run(win_mask)
+    result["max_loss_streak"] = _longest_run(loss_mask)
+    result["total_lots"] = float(cols.lots.sum())
+
+    # 各商品用 bincount 一次分組加總
+    n_pairs = len(cols.pairs)
+    counts = np.bincount(pair_ids, minlength=n_pairs)
+    nets = np.bincount(pair_ids, weights=pnl, minlength=n_pairs)
+    wins = np.bincount(pair_ids[win_mask], minlength=n_pairs)
+    losses = np.bincount(pair_ids[loss_mask], minlength=n_pairs)
+    profits = np.bincount(pair_ids[win_mask], weights=wins_pnl, minlength=n_pairs)
+    loss_sums = np.bincount(pair_ids[loss_mask], weights=losses_pnl, minlength=n_pairs)
+    lots = np.bincount(pair_ids, weights=cols.lots, minlength=n_pairs)
+    per_pair = {}
+    for i, pair in enumerate(cols.pairs):
+        per_pair[pair] = summary(int(counts[i]), int(wins[i]), int(losses[i]), float(profits[i]), float(-loss_sums[i]), float(nets[i]))
+        per_pair[pair]["lots"] = float(lots[i])
+    result["per_pair"] = per_pair
+    return result
+
+
+def _compute_python(cols):
+    # 沒有 numpy 時：單次走訪，逐筆更新所有累計值 (比多次 map/filter 還快)
+    pairs = cols.pairs
+    count = wins = losses = 0
+    gross_profit = gross_loss = net = sum_sq = down_sq = 0.0
+    peak = max_dd = 0.0
+    peak_i = dd_start = longest_under = 0
+    dd_end = None
+    win_run = loss_run = max_win_run = max_loss_run = 0
+    equity = array('d')
+    # 每個商品: [count, wins, losses, gross_profit, gross_loss, net, lots]
+    acc = [[0, 0, 0, 0.0, 0.0, 0.0, 0.0] for _ in pairs]
+
+    for pnl, lot, pair_id in zip(cols.pnl, cols.lots, cols.pair_ids):
+        count += 1
+        net += pnl
+        sum_sq += pnl * pnl
+        p = acc[pair_id]
+        p[0] += 1
+        p[5] += pnl
+        p[6] += lot
+        if pnl > 0:
+            wins += 1
+            gross_profit += pnl
+            p[1] += 1
+            p[3] += pnl
+            win_run += 1
+            loss_run = 0
+            if win_run > max_win_run: max_win_run = win_run
+        elif pnl < 0:
+            losses += 1
+            gross_loss -= pnl
+            down_sq += pnl * pnl
+            p[2] += 1
+            p[4] -= pnl
+            loss_run += 1
+            win_run = 0
+            if loss_run > max_loss_run: max_loss_run = loss_run
+        else:
+            win_run = loss_run = 0
+
+        equity.append(net)
+        if net >= peak:
+            # 回到 (或創) 新高：結束目前的水下期間
+            if count - peak_i - 1 > longest_under: longest_under = count - peak_i - 1
+            if dd_end is None and max_dd > 0 and peak_i == dd_start: dd_end = count
+            peak = net
+            peak_i = count
+        elif peak - net > max_dd:
+            max_dd = peak - net
+            dd_start = peak_i
+            dd_end = None
+    if count - peak_i > longest_under: longest_under = count - peak_i
+
+    result = summary(count, wins, losses, gross_profit, gross_loss, net)
+    result["equity_curve"] = equity
+    result["max_drawdown"] = max_dd
+    result["max_drawdown_duration"] = ((dd_end if dd_end is not None else count) - dd_start) if max_dd > 0 else 0
+    result["longest_underwater"] = longest_under
+
+    mean = result["expectancy"]
+    std = math.sqrt(max(sum_sq - count * mean * mean, 0.0) / (count - 1)) if count > 1 else 0.0
+    downside = math.sqrt(down_sq / count) if count else 0.0
+    result["sharpe"] = mean / std if count > 1 and std else None
+    result["sortino"] = mean / downside if count > 1 and downside else None
+    result["max_win_streak"] = max_win_run
+    result["max_loss_streak"] = max_loss_run
+    result["total_lots"] = math.fsum(cols.lots)
+
+    per_pair = {}
+    for pair, p in zip(pairs, acc):
+        per_pair[pair] = summary(p[0], p[1], p[2], p[3], p[4], p[5])
+        per_pair[pair]["lots"] = p[6]
+    result["per_pair"] = per_pair
+    return result
+
+
+def downsample_minmax(values, max_points):
+    """把曲線縮減到約 max_points 個點供圖表使用，回傳 (索引串列, 值串列)。
+
+    分成 max_points // 2 個區段，每段保留最低與最高點，再加上頭尾與最大回撤的高點/谷底，
+    縮減後的最高、最低點與最大回撤都和原曲線相同。
+    """
+    n = len(values)
+    if n <= max_points:
+        return list(range(n)), [float(v) for v in values]
+    buckets = max(max_points // 2, 1)
+    size = -(-n // buckets)
+    if np is not None:
+        v = np.asarray(values, dtype=np.float64)
+        # 尾端補上最後一個值，湊成 buckets x size 的矩陣一次取 argmin/argmax
+        padded = np.concatenate((v, np.full(buckets * size - n, v[-1])))
+        grid = padded.reshape(buckets, size)
+        base = np.arange(buckets) * size
+        trough = int((np.maximum.accumulate(v) - v).argmax())
+        peak = int(v[:trough + 1].argmax())
+        idx = np.concatenate((base + grid.argmin(axis=1), base + grid.argmax(axis=1), [0, n - 1, peak, trough]))
+        idx = np.unique(np.minimum(idx, n - 1))
+        return idx.tolist(), v[idx].tolist()
+    idx = {0, n - 1}
+    for start in range(0, n, size):
+        seg = values[start:start + size]
+        idx.add(start + seg.index(min(seg)))
+        idx.add(start + seg.index(max(seg)))
+    high = high_i = peak = trough = 0
+    worst = -1.0
+    for i, v in enumerate(values):
+        if i == 0 or v > high:
+            high, high_i = v, i
+        elif high - v > worst:
+            worst, peak, trough = high - v, high_i, i
+    idx.update((peak, trough))
+    idx = sorted(idx)
+    return idx, [float(values[i]) for i in idx]
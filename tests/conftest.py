@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import DBManager  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DBManager(str(tmp_path / "journal.db"))
+    assert not db.error_msg, db.error_msg
+    yield db
+    db.conn.close()
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from main import DBManager
+
+
+def test_cross_pair_pnl_kept_out_of_usd(db):
+    # USDJPY 以平倉價換成美元；EURJPY 換不成美元，損益以日圓存在 pnl_quote
+    _, usd = db.apply_trade('USDJPY', 'BUY', 1.0, 150.0, 151.0)
+    _, cross = db.apply_trade('EURJPY', 'BUY', 1.0, 160.0, 161.0)
+    db.conn.commit()
+    assert usd == {'pnl_usd': pytest.approx(100000.0 / 151.0), 'pnl_quote': None, 'pnl_currency': None}
+    assert cross == {'pnl_usd': None, 'pnl_quote': pytest.approx(100000.0), 'pnl_currency': 'JPY'}
+    fill = db.record_fill('EURJPY', 'BUY', 1.0, 160.0)
+    fill = db.record_fill('EURJPY', 'SELL', 1.0, 160.5)
+    assert fill['currency'] == 'JPY' and fill['realized'] == pytest.approx(50000.0)
+    assert db.conn.execute('SELECT count(realized_pnl) FROM fills').fetchone()[0] == 0
+    assert db.get_trade_stats()['net'] == pytest.approx(100000.0 / 151.0)
+
+
+def test_migration_moves_cross_pnl_after_backup(tmp_path):
+    path = str(tmp_path / "journal.db")
+    db = DBManager(path)
+    db.add_trade({'pair': 'EURJPY', 'direction': 'BUY', 'lots': 1.0, 'entry_price': 160.0, 'exit_price': 161.0, 'pnl_usd': 100000.0})
+    db.add_trade({'pair': 'XAUUSD', 'direction': 'BUY', 'lots': 1.0, 'entry_price': 2000.0, 'exit_price': 2010.0, 'pnl_usd': 1000.0})
+    # 模擬 v12 的資料庫：交叉盤的日圓損益存在 pnl_usd
+    db.conn.execute('ALTER TABLE trades DROP COLUMN pnl_quote')
+    db.conn.execute('ALTER TABLE trades DROP COLUMN pnl_currency')
+    db.conn.execute('PRAGMA user_version = 12')
+    db.conn.commit()
+    db.conn.close()
+
+    db = DBManager(path)
+    assert not db.error_msg, db.error_msg
+    assert len(os.listdir(db.backup_dir())) == 1
+    rows = db.conn.execute('SELECT pair, pnl_usd, pnl_quote, pnl_currency FROM trades ORDER BY id').fetchall()
+    assert rows == [('EURJPY', None, 100000.0, 'JPY'), ('XAUUSD', 1000.0, None, None)]
+    assert db.get_trade_stats()['net'] == pytest.approx(1000.0)
+    db.conn.close()
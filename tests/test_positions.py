@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+import positions
+
+
+def book_rows(book):
+    return [(book.direction, lot.lots, lot.price, lot.ts, lot.fill_id) for lot in book.lots]
+
+
+def assert_persisted(db, pair):
+    # 增量寫回的 position_lots 必須與記憶體中的部位一致 (重新載入後比較)
+    book = db.position_books.pop(pair)
+    assert book_rows(db.get_position_book(pair)) == book_rows(book)
+
+
+@pytest.mark.parametrize("method", [positions.MATCH_FIFO, positions.MATCH_AVERAGE])
+@pytest.mark.parametrize("seed", range(3))
+def test_random_fills_persist_delta(db, method, seed):
+    rnd = random.Random(seed)
+    db.set_lot_matching(method)
+    for _ in range(300):
+        pair = rnd.choice(["XAUUSD", "EURUSD"])
+        db.record_fill(pair, rnd.choice(["BUY", "SELL"]), 0.01 * rnd.randint(1, 80), round(rnd.uniform(90, 110), 2))
+        assert_persisted(db, pair)
+    realized = db.conn.execute('SELECT sum(realized_pnl) FROM fills').fetchone()[0]
+    assert realized == pytest.approx(db.get_trade_stats()['net'])
+
+
+def test_switching_to_average_merges_lots(db):
+    for price in (100.0, 102.0, 104.0):
+        db.record_fill("XAUUSD", "BUY", 1.0, price)
+    db.set_lot_matching(positions.MATCH_AVERAGE)
+    db.record_fill("XAUUSD", "SELL", 1.0, 110.0)
+    assert db.conn.execute('SELECT count(*), sum(lots), max(price) FROM position_lots').fetchone() == (1, 2.0, 102.0)
+    assert_persisted(db, "XAUUSD")
+
+
+def test_writes_per_fill_do_not_grow_with_open_lots(db):
+    statements = []
+    db.conn.set_trace_callback(lambda sql: statements.append(sql))
+    counts = []
+    for i in range(200):
+        statements.clear()
+        db.record_fill("XAUUSD", "BUY", 0.1, 100.0 + i)
+        counts.append(sum(s.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")) for s in statements))
+    assert len(set(counts)) == 1
+    statements.clear()
+    db.record_fill("XAUUSD", "SELL", 0.15, 150.0)
+    # 平掉最舊的一筆、部分平倉第二筆：position_lots 只有一個 DELETE 與一個 UPDATE
+    assert sorted(s.split()[0].upper() for s in statements if 'position_lots' in s) == ['DELETE', 'UPDATE']
+    assert db.conn.execute('SELECT count(*) FROM position_lots').fetchone()[0] == 199
+    assert_persisted(db, "XAUUSD")
+
+
+@pytest.mark.parametrize("side, lots", [("buy", 1.0), ("CLOSE", 1.0), (None, 1.0), ("BUY", 0), ("SELL", -1.0)])
+def test_invalid_fill_rejected(db, side, lots):
+    db.record_fill("XAUUSD", "BUY", 1.0, 100.0)
+    with pytest.raises(ValueError):
+        db.record_fill("XAUUSD", side, lots, 101.0)
+    assert db.get_open_positions()[0]['size'] == 1.0
+    assert db.conn.execute('SELECT count(*) FROM fills').fetchone()[0] == 1
@@ -0,0 +1,70 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+PAIRS = ["XAUUSD", "EURUSD", "USDJPY", "US30"]
+START = datetime(2023, 1, 1)
+
+
+def rollups(db):
+    return {r[:3]: r[3:] for r in db.conn.execute('SELECT * FROM trade_rollups')}
+
+
+def assert_matches_rebuild(db):
+    # 增量維護的彙總必須等於整表重算：計數完全相同，金額允許浮點累加順序的誤差
+    incremental = rollups(db)
+    db.rebuild_trade_rollups()
+    rebuilt = rollups(db)
+    assert incremental.keys() == rebuilt.keys()
+    for key, counts in incremental.items():
+        assert counts[:3] == rebuilt[key][:3], key
+        assert counts[3:] == pytest.approx(rebuilt[key][3:], abs=1e-6), key
+
+
+def random_trade(rnd):
+    entry = round(rnd.uniform(1, 2000), 2)
+    return {'pair': rnd.choice(PAIRS), 'direction': rnd.choice(["BUY", "SELL"]), 'lots': 0.01 * rnd.randint(1, 100),
+            'entry_price': entry, 'exit_price': round(entry * (1 + rnd.gauss(0, 0.01)), 2),
+            'entry_time': START + timedelta(seconds=rnd.randint(0, 400 * 86400))}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_ops_match_rebuild(db, seed):
+    rnd = random.Random(seed)
+    for _ in range(300):
+        ids = [r[0] for r in db.conn.execute('SELECT id FROM trades')]
+        op = rnd.random()
+        if op < 0.4 or not ids:
+            assert not isinstance(db.write_batch([('trade', random_trade(rnd))])[0], Exception)
+        elif op < 0.5:
+            assert db.add_trade({'pair': rnd.choice(PAIRS), 'direction': 'BUY', 'lots': 0.1, 'entry_price': 1.0, 'exit_price': 1.0,
+                                 'pnl_usd': rnd.choice([0.0, 12.5, -7.25])})
+        elif op < 0.8:
+            assert db.delete_trade(rnd.choice(ids))
+        else:
+            # 直接改損益 / 時間 / 商品由 trigger 把這筆搬到新的 bucket
+            db.conn.execute('UPDATE trades SET pnl_usd = ?, entry_ts = entry_ts + ?, pair = ? WHERE id = ?',
+                            (round(rnd.gauss(0, 50), 2), rnd.randint(-86400 * 40, 86400 * 40), rnd.choice(PAIRS), rnd.choice(ids)))
+            db.conn.commit()
+    assert_matches_rebuild(db)
+
+
+def test_import_then_delete_matches_rebuild(db):
+    rnd = random.Random(7)
+    rows = [dict(random_trade(rnd), ticket=str(i)) for i in range(500)]
+    assert db.import_trades(rows) == (500, 500)
+    for trade_id in random.Random(8).sample(range(1, 501), 200):
+        assert db.delete_trade(trade_id)
+    assert_matches_rebuild(db)
+    assert sum(r['count'] for r in db.get_rollups('month')) == 300
+
+
+def test_delete_failure_rolls_back(db):
+    trade_id, _ = db.write_batch([('trade', random_trade(random.Random(1)))])[0]
+    before = rollups(db)
+    db.conn.execute("CREATE TRIGGER block_delete BEFORE DELETE ON trades BEGIN SELECT RAISE(ABORT, 'blocked'); END")
+    assert db.delete_trade(trade_id) is False
+    assert not db.conn.in_transaction
+    assert rollups(db) == before
+    assert db.get_trade_by_id(trade_id) is not None
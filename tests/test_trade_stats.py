@@ -0,0 +1,72 @@
+import random
+from datetime import datetime
+
+import pytest
+
+FULL_RECOMPUTE = '''
+    SELECT count(*),
+           coalesce(sum(coalesce(pnl_usd, 0) > 0), 0),
+           coalesce(sum(coalesce(pnl_usd, 0) < 0), 0),
+           coalesce(sum(max(coalesce(pnl_usd, 0), 0)), 0.0),
+           coalesce(sum(max(-coalesce(pnl_usd, 0), 0)), 0.0),
+           coalesce(sum(pnl_usd), 0.0)
+    FROM trades
+'''
+KEYS = ("count", "wins", "losses", "gross_profit", "gross_loss", "net")
+
+
+def assert_stats_match(db):
+    # trigger 維護的彙總 == 全表重算 (SELECT 聚合) == rebuild_trade_stats()
+    incremental = db.get_trade_stats()
+    full = dict(zip(KEYS, db.conn.execute(FULL_RECOMPUTE).fetchone()))
+    db.rebuild_trade_stats()
+    for stats in (full, db.get_trade_stats()):
+        assert incremental["count"] == stats["count"]
+        assert incremental["wins"] == stats["wins"]
+        assert incremental["losses"] == stats["losses"]
+        for key in ("gross_profit", "gross_loss", "net"):
+            assert incremental[key] == pytest.approx(stats[key], abs=1e-6), key
+
+
+def random_pnl(rnd):
+    # 包含打平 (0) 與 NULL (舊資料) 的損益
+    return rnd.choice([None, 0.0, round(rnd.gauss(0, 100), 2), round(rnd.gauss(0, 100), 2)])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_insert_update_delete(db, seed):
+    rnd = random.Random(seed)
+    for _ in range(400):
+        ids = [r[0] for r in db.conn.execute('SELECT id FROM trades')]
+        op = rnd.random()
+        if op < 0.45 or not ids:
+            assert db.add_trade({'pair': 'XAUUSD', 'direction': rnd.choice(["BUY", "SELL"]), 'lots': 0.1,
+                                 'entry_price': 1.0, 'exit_price': 1.0, 'pnl_usd': random_pnl(rnd)})
+        elif op < 0.7:
+            assert db.delete_trade(rnd.choice(ids))
+        elif op < 0.9:
+            db.conn.execute('UPDATE trades SET pnl_usd = ? WHERE id = ?', (random_pnl(rnd), rnd.choice(ids)))
+            db.conn.commit()
+        else:
+            # 不動損益的修改 (心得) 不應影響彙總
+            db.update_trade_note(rnd.choice(ids), "複盤")
+    assert_stats_match(db)
+
+
+def test_bulk_paths(db):
+    rnd = random.Random(3)
+    rows = [{'ticket': str(i), 'pair': 'EURUSD', 'direction': rnd.choice(["BUY", "SELL"]), 'lots': 0.01 * rnd.randint(1, 100),
+             'entry_price': 1.1, 'exit_price': round(1.1 + rnd.gauss(0, 0.002), 5), 'entry_time': datetime(2024, 1, 1)}
+            for i in range(300)]
+    db.import_trades(rows)
+    db.write_batch([('fill', {'pair': 'XAUUSD', 'side': 'BUY', 'lots': 1.0, 'price': 2000.0}),
+                    ('fill', {'pair': 'XAUUSD', 'side': 'SELL', 'lots': 0.4, 'price': 2010.0}),
+                    ('fill', {'pair': 'XAUUSD', 'side': 'SELL', 'lots': 0.6, 'price': 1990.0})])
+    db.conn.execute('DELETE FROM trades WHERE id % 7 = 0')
+    db.conn.commit()
+    assert_stats_match(db)
+
+
+def test_empty_journal(db):
+    assert db.get_trade_stats() == {"count": 0, "wins": 0, "losses": 0, "gross_profit": 0.0, "gross_loss": 0.0, "net": 0.0}
+    assert_stats_match(db)